@@ -1,17 +1,100 @@
-import pdfplumber
 import re
+from contextlib import closing
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+from metrics import METRICS
+from pdf_backend import DEFAULT_BACKEND, DEFAULT_BACKENDS, CropBBox, backends_version, get_backend, iter_pages, resolve_backends
+from pdf_cache import PDFCache, source_version
 
 class PDFAnswerExtractor:
-    def __init__(self, filename):
+    """
+    從答案、更正答案pdf中提取每一題的題號與答案
+        逐頁讀取並累積文字，已找到答案後的下一頁不再出現 "題號" 時即停止，剩下的頁面不做文字擷取
+            是否完成只檢查新讀取的一頁，不重新比對已讀取的頁面
+            結果以已讀取頁面的完整文字比對 (答案表格跨頁時也正確)，同一題號出現多次時與原本相同以後者為準；
+            但停止後的頁面不再讀取，其中若再次出現已找到的題號 (例如另附的更正表) 不會覆蓋
+        crop_bbox 可只擷取每頁中答案表格的區域，格式為頁面寬高的比例 (x0, top, x1, bottom)
+        backends 為擷取文字的引擎順序 (見 pdf_backend)，主要引擎找不到任何答案時依序備援
+        pages 為已預先擷取的每頁文字，提供時不再讀取pdf
+        stats 記錄總頁數、實際讀取頁數與略過頁數
+        提供 cache 時，會以pdf的 sha256 快取提取結果，提取規則變動時快取自動失效
+    """
+    def __init__(self, filename, cache: Optional[PDFCache] = None, crop_bbox: Optional[CropBBox] = None,
+                 backends: Sequence[str] = DEFAULT_BACKENDS, pages: Optional[List[str]] = None):
         self.filename = filename
-        self.result = self.extract_answers()
+        self.cache = cache
+        self.crop_bbox = crop_bbox
+        self.backends = resolve_backends(backends)
+        self.backend: Optional[str] = None
+        self.stats = {"pages_total": 0, "pages_read": 0, "pages_skipped": 0}
+        # 逐頁讀取時是否已讀到答案表格
+        self.table_seen = False
+        if pages is not None:
+            self.stats["pages_total"] = len(pages)
+            self.result = self.match_answers(''.join(self.read_pages(pages)))
+        else:
+            with METRICS.timer('answers.extract', label=filename):
+                self.result = self.extract_answers()
+            METRICS.count('answers.pages_read', self.stats["pages_read"])
+            METRICS.count('answers.pages_skipped', self.stats["pages_skipped"])
+        METRICS.count('answers.matched', len(self.result))
+
+    def iter_pages(self, backend: str = DEFAULT_BACKEND) -> Iterator[str]:
+        return iter_pages(backend, self.filename, self.crop_bbox, on_open=self.set_pages_total)
+
+    def set_pages_total(self, count: int) -> None:
+        self.stats["pages_total"] = count
+
+    def is_complete(self, page_text: str) -> bool:
+        """
+        判斷讀取 page_text 這一頁後是否已包含所有答案：已找到答案，且最新一頁沒有答案區塊
+        """
+        return self.table_seen and '題號' not in page_text
+
+    def read_pages(self, pages: Iterable[str]) -> List[str]:
+        read = []
+        self.table_seen = False
+        for page_text in pages:
+            page_text = page_text or ''
+            read.append(page_text)
+            if self.is_complete(page_text):
+                break
+            self.table_seen = self.table_seen or '題號' in page_text
+        self.stats["pages_read"] += len(read)
+        self.stats["pages_skipped"] = max(0, self.stats["pages_total"] - len(read))
+        return read
+
+    def extract_with(self, backend: str, cache_key: Optional[str]) -> List[Dict]:
+        # 已有整份pdf的文字快取時直接使用 (裁切時不適用)
+        pages = None
+        if cache_key is not None and self.crop_bbox is None:
+            pages = self.cache.iter_lines('pages', cache_key, get_backend(backend).version)
+        if pages is not None:
+            pages = list(pages)
+            self.stats["pages_total"] = len(pages)
+            pages = self.read_pages(pages)
+        else:
+            # 提前停止時關閉產生器，剩下的頁面不再擷取
+            with closing(self.iter_pages(backend)) as page_iter:
+                pages = self.read_pages(page_iter)
+        return self.match_answers(''.join(pages))
 
     def extract_answers(self):
-        with pdfplumber.open(self.filename) as pdf:
-            text = ''
-            for page in pdf.pages:
-                text += page.extract_text()
+        cache_key = self.cache.file_key(self.filename) if self.cache is not None else None
+        version = f"{EXTRACTOR_VERSION}-{backends_version(self.backends)}-{self.crop_bbox}"
+        if cache_key is not None:
+            cached = self.cache.get('answers', cache_key, version)
+            if cached is not None:
+                return cached
+        for backend in self.backends:
+            result = self.extract_with(backend, cache_key)
+            self.backend = backend
+            if result:
+                break
+        if cache_key is not None:
+            self.cache.put('answers', cache_key, version, result)
+        return result
 
+    def match_answers(self, text: str) -> List[Dict]:
         # 更新提取題號和答案的正則表達式
         pattern = re.compile(r'題號\s*(第?\d+題?(?:\s*第?\d+題?)*)\s*答案\s*([A-Z\s#]*)')
         matches = pattern.findall(text)
@@ -35,6 +118,10 @@ class PDFAnswerExtractor:
     def get_results(self):
         return self.result
 
+
+# 提取規則寫在類別中，以其原始碼計算快取版本
+EXTRACTOR_VERSION = source_version(PDFAnswerExtractor)
+
 # if __name__ == "__main__":
 #     file_path = './102年考選部考古題/三等考試_農業行政/法學知識與英文（包括中華民國憲法、法學緒論、英文）/102年_三等考試_農業行政_法學知識與英文（包括中華民國憲法、法學緒論、英文）_更正答案.pdf'
 #     extractor = PDFAnswerExtractor(file_path)
@@ -0,0 +1,202 @@
+import argparse
+import gzip
+import hashlib
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.mock_site import MockFileServer
+from downloader import DownloadManifest, PDFDownloader
+
+"""
+以本機的模擬檔案伺服器 (benchmarks/mock_site.py) 測量 PDFDownloader 的並行下載速度，並確認：
+    同時連線數不超過 per_host_limit (含內容分段慢慢送出、讀取內容期間)，重新執行時依 manifest 全部略過，不發出任何請求
+    5xx 時以退避重試，超過 max_retries 時回傳 "http <status>"；429 時依 Retry-After 等待後重試
+    傳輸中斷時以 Range + If-Range 從 .part 續傳 (續傳請求不接受壓縮)，ETag 不符時從頭下載，.part 超出檔案 (416) 時重新下載，
+    .part 已完整 (416 的 Content-Range 與其大小相同) 時直接完成，不帶 Range 仍回 416 時不再重試
+    Content-Encoding: gzip 的回應 (含中斷後續傳) 寫出的檔案與原檔相同
+    python -m benchmarks.bench_downloader --files 200 --size 200
+"""
+
+
+def sha256(body):
+    return hashlib.sha256(body).hexdigest()
+
+
+def make_downloader(manifest_path, workers=8, per_host_limit=4, max_retries=3):
+    # backoff 設得很小，429 的等待時間只來自 Retry-After
+    return PDFDownloader(max_workers=workers, per_host_limit=per_host_limit, rate=0, max_retries=max_retries,
+                         backoff=0.01, manifest=DownloadManifest(manifest_path))
+
+
+def check_file(path, body):
+    with open(path, 'rb') as f:
+        assert f.read() == body, f"{path} 的內容與原檔不同"
+    assert not os.path.exists(f'{path}.part')
+
+
+def run_case(name, func):
+    start = time.perf_counter()
+    func()
+    print(f"{name}: 通過 ({time.perf_counter() - start:.2f}s)")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--files', type=int, default=200)
+    arg_parser.add_argument('--size', type=int, default=200, help='每個檔案的大小 (KB)')
+    arg_parser.add_argument('--workers', type=int, default=8)
+    arg_parser.add_argument('--per-host-limit', type=int, default=4)
+    arg_parser.add_argument('--latency', type=float, default=0.01, help='伺服器每個請求的延遲 (秒)')
+    args = arg_parser.parse_args()
+
+    rnd = random.Random(0)
+    files = {f'/pdf/{i}.pdf': rnd.randbytes(args.size * 1024) for i in range(args.files)}
+    # 可壓縮的檔案，gzip 後的長度與原檔不同
+    text = ''.join(f'第{i}題 依憲法規定，下列敘述何者正確？\n' for i in range(args.size * 40)).encode('utf-8')
+    files['/pdf/gzip.pdf'] = files['/pdf/gzip-resume.pdf'] = text
+    for name in ('retry', 'exhausted', 'retry-after', 'resume', 'if-range', 'too-long', 'complete-part', 'always-416'):
+        files[f'/pdf/{name}.pdf'] = rnd.randbytes(args.size * 1024)
+    slow = [f'/pdf/slow-{i}.pdf' for i in range(args.per_host_limit * 3)]
+    for path in slow:
+        files[path] = rnd.randbytes(args.size * 1024)
+
+    with MockFileServer(files, gzip_paths={'/pdf/gzip.pdf', '/pdf/gzip-resume.pdf'}, latency=args.latency) as site, \
+            tempfile.TemporaryDirectory() as tmp:
+        manifest_path = os.path.join(tmp, 'manifest.jsonl')
+
+        def target(path):
+            return os.path.join(tmp, 'pdf', os.path.basename(path))
+
+        bulk = [(site.url(path), target(path)) for path in files if path[len('/pdf/'):-len('.pdf')].isdigit()]
+        with make_downloader(manifest_path, args.workers, args.per_host_limit) as downloader:
+            start = time.perf_counter()
+            results = downloader.download_all(bulk)
+            seconds = time.perf_counter() - start
+        total = sum(len(files[path]) for path in files if target(path) in results)
+        print(f"並行下載 {len(bulk)} 個檔案: {seconds:.2f}s, {total / seconds / 1024 / 1024:.1f} MB/s, "
+              f"最大同時連線數 {site.stats['max_active']}")
+        assert set(results.values()) == {"downloaded"}, results
+        assert site.stats["max_active"] <= args.per_host_limit
+        for url, path in bulk:
+            check_file(path, files[url[url.index('/pdf/'):]])
+
+        def slow_bodies():
+            # 回應標頭很快送出，內容分段慢慢送出：讀取內容期間仍需佔用連線數上限的名額
+            site.stats["max_active"] = 0
+            for path in slow:
+                site.faults[path] = [("slow", 0.05)]
+            with make_downloader(manifest_path, args.workers, args.per_host_limit) as downloader:
+                results = downloader.download_all([(site.url(path), target(path)) for path in slow])
+            assert set(results.values()) == {"downloaded"}, results
+            assert site.stats["max_active"] <= args.per_host_limit, site.stats["max_active"]
+            for path in slow:
+                check_file(target(path), files[path])
+
+        def rerun():
+            before = site.stats["requests"]
+            with make_downloader(manifest_path, args.workers, args.per_host_limit) as downloader:
+                results = downloader.download_all(bulk)
+            assert set(results.values()) == {"skipped"}, results
+            assert site.stats["requests"] == before
+
+        def download(path, max_retries=3):
+            with make_downloader(manifest_path, max_retries=max_retries) as downloader:
+                return downloader.download(site.url(path), target(path))
+
+        def retry_5xx():
+            site.faults['/pdf/retry.pdf'] = [("status", 503), ("status", 502)]
+            assert download('/pdf/retry.pdf') == "downloaded"
+            assert [entry["status"] for entry in site.requests_for('/pdf/retry.pdf')] == [503, 502, 200]
+            check_file(target('/pdf/retry.pdf'), files['/pdf/retry.pdf'])
+
+            site.faults['/pdf/exhausted.pdf'] = [("status", 500)] * 5
+            assert download('/pdf/exhausted.pdf', max_retries=2) == "http 500"
+            assert len(site.requests_for('/pdf/exhausted.pdf')) == 3
+            assert not os.path.exists(target('/pdf/exhausted.pdf'))
+
+        def retry_after():
+            site.faults['/pdf/retry-after.pdf'] = [("retry_after", 1)]
+            start = time.perf_counter()
+            assert download('/pdf/retry-after.pdf') == "downloaded"
+            assert time.perf_counter() - start >= 1, "沒有依 Retry-After 等待"
+            assert [entry["status"] for entry in site.requests_for('/pdf/retry-after.pdf')] == [429, 200]
+
+        def resume():
+            path = '/pdf/resume.pdf'
+            cut = len(files[path]) // 3
+            site.faults[path] = [("truncate", cut)]
+            assert download(path) == "resumed"
+            first, second = site.requests_for(path)
+            # 中斷前最後一個不完整的區塊不會寫入 .part，續傳位置為已寫入的 bytes 數
+            offset = int(second["range"][len('bytes='):-1]) if second["range"] else 0
+            assert first["range"] is None and 0 < offset <= cut
+            assert second["if_range"] == site.etag(files[path]) and second["status"] == 206
+            assert second["accept_encoding"] == 'identity'
+            check_file(target(path), files[path])
+            entry = DownloadManifest(manifest_path).get(site.url(path))
+            assert entry["status"] == "complete" and entry["sha256"] == sha256(files[path])
+
+        def if_range_mismatch():
+            # 上次中斷時伺服器上的檔案與現在不同 (ETag 不符)，伺服器回傳完整檔案
+            path = '/pdf/if-range.pdf'
+            DownloadManifest(manifest_path).update(site.url(path), path=target(path), links=[], etag='"old"',
+                                                   last_modified=None, status="partial")
+            with open(f'{target(path)}.part', 'wb') as f:
+                f.write(b'stale' * 100)
+            assert download(path) == "downloaded"
+            assert [(entry["if_range"], entry["status"]) for entry in site.requests_for(path)] == [('"old"', 200)]
+            check_file(target(path), files[path])
+
+        def too_long():
+            path = '/pdf/too-long.pdf'
+            with open(f'{target(path)}.part', 'wb') as f:
+                f.write(b'x' * (len(files[path]) + 10))
+            assert download(path) == "downloaded"
+            assert [entry["status"] for entry in site.requests_for(path)] == [416, 200]
+            check_file(target(path), files[path])
+
+        def complete_part():
+            # 上次寫完最後一塊後、改名前中斷，.part 已是完整檔案
+            path = '/pdf/complete-part.pdf'
+            with open(f'{target(path)}.part', 'wb') as f:
+                f.write(files[path])
+            assert download(path) == "resumed"
+            assert [entry["status"] for entry in site.requests_for(path)] == [416]
+            check_file(target(path), files[path])
+            assert DownloadManifest(manifest_path).get(site.url(path))["sha256"] == sha256(files[path])
+
+        def always_416():
+            path = '/pdf/always-416.pdf'
+            with open(f'{target(path)}.part', 'wb') as f:
+                f.write(b'x' * 10)
+            site.faults[path] = [("status", 416)] * 5
+            assert download(path) == "http 416"
+            assert [entry["range"] for entry in site.requests_for(path)] == ['bytes=10-', None]
+            assert not os.path.exists(f'{target(path)}.part')
+
+        def gzip_encoded():
+            assert download('/pdf/gzip.pdf') == "downloaded"
+            assert [entry["encoding"] for entry in site.requests_for('/pdf/gzip.pdf')] == ['gzip']
+            check_file(target('/pdf/gzip.pdf'), files['/pdf/gzip.pdf'])
+
+            # gzip 的回應中斷後，以不壓縮的 Range 請求續傳
+            path = '/pdf/gzip-resume.pdf'
+            site.faults[path] = [("truncate", len(gzip.compress(files[path])) // 2)]
+            assert download(path) == "resumed"
+            first, second = site.requests_for(path)
+            assert first["encoding"] == 'gzip'
+            assert second["accept_encoding"] == 'identity' and second["encoding"] is None and second["status"] == 206
+            check_file(target(path), files[path])
+
+        run_case("內容慢慢送出時的同時連線數", slow_bodies)
+        run_case("manifest 重新執行", rerun)
+        run_case("5xx 重試", retry_5xx)
+        run_case("429 Retry-After", retry_after)
+        run_case("Range / If-Range 續傳", resume)
+        run_case("If-Range 不符", if_range_mismatch)
+        run_case(".part 超出檔案 (416)", too_long)
+        run_case(".part 已完整 (416)", complete_part)
+        run_case("不帶 Range 仍回 416", always_416)
+        run_case("gzip 回應", gzip_encoded)
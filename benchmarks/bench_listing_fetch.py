@@ -0,0 +1,78 @@
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.fixtures import make_listing_html
+from benchmarks.mock_site import MockExamSite
+from downloader import PDFDownloader
+from http_cache import HTTPCache
+from listing_fetcher import STATE_FIELDS, ListingFetcher, listing_path
+from listing_parser import parse_listing_file
+
+"""
+以本機的模擬考選部網站 (benchmarks/mock_site.py) 測量自動取得查詢頁面的時間與傳輸量，並確認：
+    各年份同時查詢時各自的表單狀態不會互相干擾，寫出的html可由 listing_parser 解析
+    重新執行時查詢頁面以 304 回應且不送出任何 postback，內容未變動的年份不改寫檔案
+    --revalidate 時仍查詢每個年份，內容未變動的年份不改寫檔案
+    網站更新某一年份後只有該年份被改寫
+    python -m benchmarks.bench_listing_fetch --years 10 --exams 100
+"""
+
+
+def run(site, html_dir, cache_dir, workers, revalidate=False):
+    with PDFDownloader(rate=0, per_host_limit=workers, max_retries=0) as downloader:
+        fetcher = ListingFetcher(downloader, HTTPCache(cache_dir, ignored_fields=STATE_FIELDS), html_dir,
+                                 max_workers=workers, search_url=f'{site.base_url}wFrmExamQandASearch.aspx')
+        before = dict(site.stats)
+        start = time.perf_counter()
+        results = fetcher.fetch_all(revalidate=revalidate)
+        seconds = time.perf_counter() - start
+    transferred = {name: site.stats[name] - before[name] for name in site.stats}
+    return results, seconds, transferred
+
+
+def report(name, results, seconds, transferred):
+    statuses = {}
+    for status in results.values():
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"{name}: {seconds:.2f}s, {transferred['requests']} 個請求, {transferred['bytes'] / 1024:.0f} KB, "
+          f"304 x {transferred['not_modified']}, {statuses}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--years', type=int, default=10)
+    arg_parser.add_argument('--exams', type=int, default=100)
+    arg_parser.add_argument('--subjects', type=int, default=10)
+    arg_parser.add_argument('--workers', type=int, default=4)
+    args = arg_parser.parse_args()
+
+    years = [str(112 - n) for n in range(args.years)]
+    with MockExamSite(years, args.exams, args.subjects) as site, tempfile.TemporaryDirectory() as tmp:
+        html_dir, cache_dir = os.path.join(tmp, 'html'), os.path.join(tmp, 'cache')
+
+        results, seconds, transferred = run(site, html_dir, cache_dir, args.workers)
+        report("第一次", results, seconds, transferred)
+        assert set(results.values()) == {"new"}, results
+        assert transferred['rejected'] == 0
+        for year in years:
+            assert len(parse_listing_file(listing_path(year, html_dir), None)) == args.exams * args.subjects
+
+        mtimes = {year: os.stat(listing_path(year, html_dir)).st_mtime_ns for year in years}
+        results, seconds, transferred = run(site, html_dir, cache_dir, args.workers)
+        report("重新執行", results, seconds, transferred)
+        assert set(results.values()) == {"unchanged"}, results
+        assert transferred['requests'] == transferred['not_modified'] == 1 and transferred['bytes'] == 0
+        assert all(os.stat(listing_path(year, html_dir)).st_mtime_ns == mtimes[year] for year in years)
+
+        results, seconds, transferred = run(site, html_dir, cache_dir, args.workers, revalidate=True)
+        report("重新執行 (--revalidate)", results, seconds, transferred)
+        assert set(results.values()) == {"unchanged"}, results
+        assert transferred['requests'] == 1 + 2 * len(years)
+        assert all(os.stat(listing_path(year, html_dir)).st_mtime_ns == mtimes[year] for year in years)
+
+        site.listings[years[0]] = make_listing_html(args.exams + 1, args.subjects)
+        results, seconds, transferred = run(site, html_dir, cache_dir, args.workers)
+        report("網站更新一個年份後", results, seconds, transferred)
+        assert results[years[0]] == "updated" and sum(status == "unchanged" for status in results.values()) == len(years) - 1
@@ -0,0 +1,59 @@
+import argparse
+import time
+
+from bs4 import BeautifulSoup
+
+from benchmarks.fixtures import make_listing_html
+from listing_parser import href_converter, parse_listing_html
+
+"""
+比較舊版 BeautifulSoup 解析 (find_previous 回溯) 與 listing_parser 單次走訪的速度，並確認輸出一致
+    python -m benchmarks.bench_listing_parser --exams 300 --subjects 20
+"""
+
+
+def legacy_parse(html_content: str) -> list:
+    soup = BeautifulSoup(html_content, 'html.parser')
+    table = soup.find('table', id='ctl00_holderContent_tblExamQand')
+    result = []
+    for td in table.find_all('td'):
+        label = td.find('label', {"class": "exam-title"})
+        if label and '法' in label.text:
+            for link in td.find_all('a'):
+                if link.text in ["答案", "更正答案"] and td.find('table'):
+                    result.append(td)
+                    break
+    exam_data = []
+    for td in result:
+        exam_info = {"考試名稱": "", "科目": "", "試題連結": "", "答案連結": "", "更正答案連結": ""}
+        level2_td = td.find_previous('td', class_='level2')
+        if level2_td and level2_td.find('label'):
+            exam_info["考試名稱"] = level2_td.find('label').text.strip()
+        exam_info["科目"] = td.find('label', {"class": "exam-title"}).text.strip()
+        for link in td.find_all('a', class_='exam-question-ans'):
+            if link.text in ("試題", "答案", "更正答案"):
+                exam_info[f"{link.text}連結"] = href_converter(link['href'])
+        exam_data.append(exam_info)
+    return exam_data
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--exams', type=int, default=300)
+    arg_parser.add_argument('--subjects', type=int, default=20)
+    args = arg_parser.parse_args()
+
+    html_content = make_listing_html(args.exams, args.subjects)
+    print(f"listing html: {len(html_content) / 1024 / 1024:.1f} MB, {args.exams * args.subjects} 科目")
+
+    new_result, new_time = timed(lambda: [r.to_dict() for r in parse_listing_html(html_content)])
+    legacy_result, legacy_time = timed(legacy_parse, html_content)
+    assert new_result == legacy_result, "輸出與舊版不一致"
+    print(f"legacy (bs4 + find_previous): {legacy_time:.3f}s")
+    print(f"listing_parser (lxml 單次走訪): {new_time:.3f}s  ({legacy_time / new_time:.1f}x)")
@@ -0,0 +1,103 @@
+import argparse
+import contextlib
+import os
+import random
+import subprocess
+import time
+import types
+from types import SimpleNamespace
+from typing import List
+
+from benchmarks.fixtures import ABANDON_HEADERS, GROUP_HEADERS, OPTION_GLYPHS as GLYPHS, PAGE_HEADERS
+from edata_extractor import PDFQuestionParser
+
+"""
+比較 PDFQuestionParser 舊版逐條正則 (--baseline 指定的 commit 中的 edata_extractor.py) 與模組層級合併正則 (NORMALIZER) 的速度，
+並在隨機產生的題本文字 (golden corpus) 上確認兩者輸出完全相同
+    python -m benchmarks.bench_normalizer --papers 200 --questions 80
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_REVISION = '4138ca1'
+
+NOISE = [''] * 12 + ['（25 分）', '依下文', '12 個月內', '①②④', '（請接背面）', '題組']
+
+
+def make_paper_pages(n_questions: int, seed: int, questions_per_page: int = 12) -> List[str]:
+    """
+    產生一份模擬 pdfplumber extract_text() 結果的題本，每頁一個字串
+    """
+    rnd = random.Random(seed)
+    header = rnd.choice(PAGE_HEADERS)
+    lines = []
+    q = 1
+    while q <= n_questions:
+        roll = rnd.random()
+        if roll < 0.08 and q + 3 <= n_questions:
+            lines.append(rnd.choice(GROUP_HEADERS).format(s=q, e=q + 3) + f'閱讀下文，回答問題。本文說明第{q}條規定。')
+        elif roll < 0.11 and q + 2 <= n_questions:
+            lines.append(f'文章內容{q}。' + rnd.choice(ABANDON_HEADERS).format(s=q, e=q + 2))
+        lines.append(f'{q} 依法律第{rnd.randint(1, 200)}條規定，下列敘述何者正確？{rnd.choice(NOISE)}')
+        if rnd.random() < 0.2:
+            lines.append(f'{rnd.randint(1, 300)} 年度預算{rnd.choice(NOISE)}')
+        if rnd.random() < 0.5:
+            lines.append(''.join(f'{GLYPHS[i]}選項{i}內容{rnd.randint(1, 99)}{rnd.choice(NOISE)}' for i in range(4)))
+        else:
+            for i in range(4):
+                lines.append(f'{GLYPHS[i]}選項{i}內容{rnd.randint(1, 99)}{rnd.choice(NOISE)}')
+        q += 1
+    pages = []
+    per_page = questions_per_page * 3
+    for i in range(0, len(lines), per_page):
+        page_lines = lines[i:i + per_page]
+        page = '\n'.join([header.format(total=4, page=len(pages) + 1)] + page_lines + ['（請接背面）'])
+        pages.append(page + '\n')
+    return pages
+
+
+def load_baseline(revision: str) -> types.ModuleType:
+    """
+    以 git show 讀取 revision 的 edata_extractor.py 原始碼並載入為模組，逐字使用舊版的規則
+    舊版只能以 pdfplumber.open(filename) 讀取pdf，這裡將模組內的 pdfplumber 換成直接回傳記憶體中各頁文字的物件
+    """
+    source = subprocess.run(['git', 'show', f'{revision}:edata_extractor.py'], cwd=REPO_DIR,
+                            capture_output=True, check=True).stdout.decode('utf-8')
+    module = types.ModuleType('baseline_edata_extractor')
+    exec(compile(source, f'{revision}:edata_extractor.py', 'exec'), module.__dict__)
+    module.pdfplumber = SimpleNamespace(open=lambda pages: contextlib.nullcontext(
+        SimpleNamespace(pages=[SimpleNamespace(extract_text=lambda text=text: text) for text in pages])))
+    return module
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--papers', type=int, default=200)
+    arg_parser.add_argument('--questions', type=int, default=80)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--baseline', default=BASELINE_REVISION, help='舊版 edata_extractor.py 所在的 commit')
+    args = arg_parser.parse_args()
+
+    baseline = load_baseline(args.baseline)
+
+    def legacy_parse(pages):
+        return baseline.PDFQuestionParser(pages).get_questions()
+
+    corpus = [make_paper_pages(args.questions, seed) for seed in range(args.papers)]
+    for pages in corpus:
+        assert PDFQuestionParser('<memory>', pages=pages).get_questions() == legacy_parse(pages), "輸出與舊版不一致"
+    print(f"golden corpus: {args.papers} 份題本輸出與舊版 ({args.baseline}) 一致")
+
+    def best_of(func):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for pages in corpus:
+                func(pages)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    legacy_time = best_of(lambda pages: legacy_parse(pages))
+    new_time = best_of(lambda pages: PDFQuestionParser('<memory>', pages=pages).get_questions())
+    n = args.papers * args.questions
+    print(f"legacy:     {legacy_time:.3f}s  ({n / legacy_time:,.0f} 題/s)")
+    print(f"normalizer: {new_time:.3f}s  ({n / new_time:,.0f} 題/s, {legacy_time / new_time:.2f}x)")
@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pyarrow as pa
+
+from benchmarks.bench_search_index import write_corpus
+from corpus_io import find_year_files, iter_questions
+from parquet_export import CorpusExport
+
+"""
+比較重新載入縮排的年份json與讀取 parquet / arrow 匯出檔的時間、檔案大小與記憶體，並確認匯出後可還原成相同的題目
+    json 的記憶體為 tracemalloc 的峰值；匯出檔為 pyarrow 配置的記憶體 (arrow 以 memory map 讀取時幾乎不需配置)
+    python -m benchmarks.bench_parquet_export --years 5 --subjects 40
+"""
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def measure(func):
+    """回傳 (結果, 秒數)"""
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def question_key(year, name, subject, question):
+    # 合成的題目沒有合併答案，缺少 "答案" 欄位，匯出後還原為 None
+    return year, name, subject, question['題號'], json.dumps({"答案": None, **question}, ensure_ascii=False, sort_keys=True)
+
+
+def load_json(json_dir):
+    data = []
+    for path in find_year_files(None, json_dir).values():
+        with open(path, 'r', encoding='utf-8') as f:
+            data.extend(json.load(f))
+    return data
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--years', type=int, default=5)
+    arg_parser.add_argument('--subjects', type=int, default=40, help='每年的科目數')
+    arg_parser.add_argument('--questions', type=int, default=80)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_dir = os.path.join(tmp, 'json')
+        years = list(range(101, 101 + args.years))
+        write_corpus(json_dir, years, args.subjects, args.questions, output_format='json')
+        expected = sorted(question_key(*record) for path in find_year_files(None, json_dir).values()
+                          for record in iter_questions(path))
+        print(f"{len(expected)} 題, json {directory_size(json_dir) / 1024 / 1024:.1f} MB")
+
+        tracemalloc.start()
+        _, seconds = measure(lambda: load_json(json_dir))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"json.load 全部年份: {seconds * 1000:.0f} ms, 峰值 {peak / 1024 / 1024:.1f} MB")
+
+        for file_format in ('parquet', 'arrow'):
+            export_dir = os.path.join(tmp, file_format)
+            export = CorpusExport(export_dir, json_dir)
+            _, seconds = measure(lambda: export.update(file_format=file_format))
+            print(f"\n{file_format}: 匯出 {seconds:.2f}s, {directory_size(export_dir) / 1024 / 1024:.1f} MB")
+
+            restored = sorted(question_key(*record) for record in CorpusExport(export_dir, json_dir).iter_questions())
+            assert restored == expected, "匯出後還原的題目與年份json不同"
+
+            export = CorpusExport(export_dir, json_dir)
+            before = pa.total_allocated_bytes()
+            table, seconds = measure(lambda: export.read_questions())
+            allocated = pa.total_allocated_bytes() - before
+            print(f"  讀取全部 {table.num_rows} 列: {seconds * 1000:.1f} ms, pyarrow 配置 {allocated / 1024 / 1024:.1f} MB")
+            del table
+
+            table, seconds = measure(lambda: export.read_questions(['question_number', 'answer', 'flag'],
+                                                                   years=[years[-1]], subject='行政法'))
+            print(f"  單一年份、科目 '行政法'、3 個欄位: {table.num_rows} 列, {seconds * 1000:.1f} ms")
+            assert table.num_rows == sum(1 for year, _, subject, *_ in expected
+                                         if year == years[-1] and '行政法' in subject)
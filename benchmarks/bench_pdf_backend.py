@@ -0,0 +1,85 @@
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+from adata_extractor import PDFAnswerExtractor
+from benchmarks.fixtures import answer_sheet_pages, exam_paper_pages, write_pdf
+from edata_extractor import PDFQuestionParser
+from pdf_backend import available_backends
+
+"""
+比較各pdf文字擷取引擎 (pdf_backend) 的速度與解析正確率
+    python -m benchmarks.bench_pdf_backend --papers 20 --questions 80
+    python -m benchmarks.bench_pdf_backend --pdf-dir ./考選部考古題pdf/112年考選部考古題
+合成試題以寫入pdf的原始文字解析結果為正確答案；指定 --pdf-dir 時以 pdfplumber 的結果為基準，比較其他引擎的一致率
+"""
+
+
+def make_fixtures(tmp_dir: str, n_papers: int, n_questions: int):
+    """
+    回傳 [(試題路徑, 答案路徑, 正確題目, 正確答案)]
+    """
+    fixtures = []
+    for seed in range(n_papers):
+        paper, sheet = exam_paper_pages(n_questions, seed), answer_sheet_pages(n_questions, seed)
+        paper_path = os.path.join(tmp_dir, f'{seed}_試題.pdf')
+        answer_path = os.path.join(tmp_dir, f'{seed}_答案.pdf')
+        write_pdf(paper_path, paper)
+        write_pdf(answer_path, sheet)
+        expected_questions = PDFQuestionParser(paper_path, pages=['\n'.join(lines) for lines in paper]).get_questions()
+        expected_answers = PDFAnswerExtractor(answer_path, pages=['\n'.join(lines) for lines in sheet]).get_results()
+        fixtures.append((paper_path, answer_path, expected_questions, expected_answers))
+    return fixtures
+
+
+def run_backend(backend: str, fixtures):
+    """
+    回傳 (秒數, 試題完全正確的比例, 題目正確的比例, 答案正確的比例)
+    """
+    start = time.perf_counter()
+    results = []
+    for paper_path, answer_path, _, _ in fixtures:
+        questions = PDFQuestionParser(paper_path, backends=[backend]).get_questions()
+        answers = PDFAnswerExtractor(answer_path, backends=[backend]).get_results() if answer_path else None
+        results.append((questions, answers))
+    elapsed = time.perf_counter() - start
+
+    exact, question_hits, question_total, answer_hits, answer_total = 0, 0, 0, 0, 0
+    for (questions, answers), (_, _, expected_questions, expected_answers) in zip(results, fixtures):
+        exact += questions == expected_questions
+        question_hits += sum(1 for question in questions if question in expected_questions)
+        question_total += max(len(expected_questions), len(questions))
+        if expected_answers is not None:
+            answer_hits += sum(1 for answer in answers if answer in expected_answers)
+            answer_total += max(len(expected_answers), len(answers))
+    return (elapsed, exact / len(fixtures), question_hits / max(question_total, 1),
+            answer_hits / answer_total if answer_total else None)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--papers', type=int, default=20)
+    arg_parser.add_argument('--questions', type=int, default=80)
+    arg_parser.add_argument('--pdf-dir', default=None, help='改用資料夾中 (遞迴) 的真實試題pdf')
+    arg_parser.add_argument('--backends', nargs='+', default=available_backends())
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.pdf_dir:
+            paths = sorted(glob.glob(os.path.join(args.pdf_dir, '**', '*_試題.pdf'), recursive=True))
+            fixtures = [(path, None, PDFQuestionParser(path, backends=['pdfplumber']).get_questions(), None)
+                        for path in paths]
+            print(f"{len(fixtures)} 份試題，以 pdfplumber 的結果為基準")
+        else:
+            fixtures = make_fixtures(tmp_dir, args.papers, args.questions)
+            print(f"{len(fixtures)} 份合成試題 + 答案，每份 {args.questions} 題")
+
+        baseline = None
+        for backend in args.backends:
+            elapsed, exact, question_rate, answer_rate = run_backend(backend, fixtures)
+            baseline = baseline or elapsed
+            answer_text = f"  答案 {answer_rate:6.1%}" if answer_rate is not None else ""
+            print(f"{backend:<10} {elapsed:7.2f}s  {len(fixtures) / elapsed:6.1f} 份/s ({baseline / elapsed:5.1f}x)  "
+                  f"試題完全一致 {exact:6.1%}  題目 {question_rate:6.1%}{answer_text}")
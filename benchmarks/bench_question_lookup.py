@@ -0,0 +1,78 @@
+import argparse
+import random
+import time
+
+from edata_extractor import FLAG_KEYWORDS, IntervalIndex, KeywordMatcher
+
+"""
+比較題組查詢 / 遺棄題組判斷 / 關鍵字標記的舊寫法 (線性 next、逐題號 range 迴圈、巢狀 any) 與
+IntervalIndex、KeywordMatcher 的速度
+    python -m benchmarks.bench_question_lookup --questions 5000 --groups 300
+"""
+
+
+def make_case(n_questions: int, n_groups: int, seed: int = 0):
+    rnd = random.Random(seed)
+    groups = []
+    for _ in range(n_groups):
+        start = rnd.randint(1, n_questions)
+        groups.append({"start_ques": start, "end_ques": start + rnd.randint(1, 5), "ques_desc": ""})
+    abandon = [{"start_ques": g["start_ques"], "end_ques": g["end_ques"]} for g in groups[::3]]
+    words = ["依法律規定", "下列敘述", "何者正確", "行政處分", "（25 分）", "請依上文作答", "代號：", "契約"]
+    questions = []
+    for q in range(1, n_questions + 1):
+        question = {"題號": q}
+        for key in ['題目', 'A', 'B', 'C', 'D']:
+            question[key] = ''.join(rnd.choice(words[:4]) for _ in range(6))
+        if rnd.random() < 0.05:
+            question['D'] += rnd.choice(words[4:])
+        questions.append(question)
+    return questions, groups, abandon
+
+
+def legacy(questions, groups, abandon):
+    flags = []
+    for question in questions:
+        group = next((g for g in groups if g["start_ques"] <= question["題號"] <= g["end_ques"]), None)
+        flag = "讚"
+        if any(keyword in question['題目'] or keyword in question[key] for key in ['A', 'B', 'C', 'D'] for keyword in FLAG_KEYWORDS):
+            flag = "蛋雕"
+        for g in abandon:
+            for 題號 in range(g["start_ques"], g["end_ques"] + 1):
+                if question["題號"] == 題號:
+                    flag = "蛋雕 (有必須遺棄的題組)"
+        flags.append((group, flag))
+    return flags
+
+
+def indexed(questions, groups, abandon):
+    group_index, abandon_index = IntervalIndex(groups), IntervalIndex(abandon)
+    matcher = KeywordMatcher(FLAG_KEYWORDS)
+    flags = []
+    for question in questions:
+        group = group_index.find(question["題號"])
+        flag = "讚"
+        if matcher.any_in(question[key] for key in ['題目', 'A', 'B', 'C', 'D']):
+            flag = "蛋雕"
+        if question["題號"] in abandon_index:
+            flag = "蛋雕 (有必須遺棄的題組)"
+        flags.append((group, flag))
+    return flags
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--questions', type=int, default=5000)
+    arg_parser.add_argument('--groups', type=int, default=300)
+    args = arg_parser.parse_args()
+
+    case = make_case(args.questions, args.groups)
+    timings = {}
+    results = {}
+    for name, func in (("legacy", legacy), ("indexed", indexed)):
+        start = time.perf_counter()
+        results[name] = func(*case)
+        timings[name] = time.perf_counter() - start
+    assert results["legacy"] == results["indexed"], "結果與舊版不一致"
+    print(f"legacy:  {timings['legacy']:.3f}s")
+    print(f"indexed: {timings['indexed']:.3f}s  ({timings['legacy'] / timings['indexed']:.1f}x)")
@@ -0,0 +1,103 @@
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+
+from benchmarks.fixtures import SUBJECTS, exam_paper_pages
+from corpus_io import CorpusWriter, find_year_files, iter_questions
+from edata_extractor import PDFQuestionParser
+from search_index import SearchIndex
+
+"""
+比較全文檢索索引與逐題掃描年份輸出 (同 grep / LIKE) 的查詢速度，並確認索引找得到所有包含查詢字串的題目
+合成題目的文字大多相同，查詢取題目或選項中包含數字 (例如條號) 的片段，較接近實際查詢的鑑別度
+    python -m benchmarks.bench_search_index --years 5 --subjects 40 --queries 200
+"""
+
+
+def write_corpus(json_dir, years, n_subjects, n_questions, output_format='jsonl'):
+    """output_format="json" 時寫出與 parse 預設相同的縮排年份json"""
+    for 考試年份 in years:
+        path = os.path.join(json_dir, f'{考試年份}_考古題.{output_format}')
+        with CorpusWriter(path, compact=output_format == 'jsonl') as writer:
+            for s in range(n_subjects):
+                pages = ['\n'.join(lines) for lines in exam_paper_pages(n_questions, 考試年份 * 1000 + s)]
+                parser = PDFQuestionParser('<memory>', pages=pages)
+                writer.write_subject({"考試年份": 考試年份, "考試名稱": f"考試{s % 7}",
+                                      "考試科目": SUBJECTS[s % len(SUBJECTS)], "考卷內容": parser.get_questions()})
+
+
+def scan(json_dir, query):
+    """
+    逐題比對包含 query 的題目，英數字同索引以整個詞比對 ("12" 不符合 "123")
+    """
+    pattern = re.compile(('(?<![0-9A-Za-z])' if query[:1].isalnum() and query[:1].isascii() else '')
+                         + re.escape(query)
+                         + ('(?![0-9A-Za-z])' if query[-1:].isalnum() and query[-1:].isascii() else ''))
+    found = set()
+    for path in find_year_files(None, json_dir).values():
+        for 考試年份, 考試名稱, 考試科目, question in iter_questions(path):
+            if any(pattern.search(question.get(key) or '') for key in ('題目', 'A', 'B', 'C', 'D')):
+                found.add((考試年份, 考試名稱, 考試科目, question['題號']))
+    return found
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--years', type=int, default=5)
+    arg_parser.add_argument('--subjects', type=int, default=40, help='每年的科目數')
+    arg_parser.add_argument('--questions', type=int, default=80)
+    arg_parser.add_argument('--queries', type=int, default=200)
+    arg_parser.add_argument('--scan-queries', type=int, default=10, help='逐題掃描較慢，只執行前幾個查詢')
+    args = arg_parser.parse_args()
+
+    rnd = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        json_dir, index_dir = os.path.join(tmp, 'json'), os.path.join(tmp, 'index')
+        years = list(range(101, 101 + args.years))
+        write_corpus(json_dir, years, args.subjects, args.questions)
+        texts = [question[key] for path in find_year_files(None, json_dir).values()
+                 for *_, question in iter_questions(path) for key in ('題目', 'A', 'B', 'C', 'D')]
+        print(f"{len(texts) // 5} 題")
+
+        index = SearchIndex(index_dir, json_dir)
+        start = time.perf_counter()
+        index.update()
+        build = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(index_dir, name)) for name in os.listdir(index_dir))
+        print(f"建立索引: {build:.2f}s, {size / 1024 / 1024:.1f} MB")
+
+        start = time.perf_counter()
+        statuses = SearchIndex(index_dir, json_dir).update()
+        print(f"未變動時更新: {time.perf_counter() - start:.3f}s {set(statuses.values())}")
+
+        queries = []
+        for _ in range(args.queries):
+            text = rnd.choice(texts)
+            number = re.search(r'\d+', text)
+            if number is None:
+                continue
+            start, end = max(0, number.start() - rnd.randint(1, 4)), number.end() + rnd.randint(0, 3)
+            queries.append(text[start:end])
+
+        index = SearchIndex(index_dir, json_dir)
+        index.search(queries[0])  # 載入所有區段
+        matched = sorted(len(index.search(query, limit=len(texts))) for query in queries)
+        print(f"{len(queries)} 個查詢，符合的題數: 中位數 {matched[len(matched) // 2]}，最多 {matched[-1]}")
+        start = time.perf_counter()
+        for query in queries:
+            index.search(query, limit=20)
+        index_time = (time.perf_counter() - start) / len(queries)
+
+        start = time.perf_counter()
+        for query in queries[:args.scan_queries]:
+            expected = scan(json_dir, query)
+            hits = {(hit.year, hit.exam_name, hit.subject, hit.question_number)
+                    for hit in index.search(query, limit=len(texts))}
+            assert expected <= hits, f"索引漏掉了 {query}: {expected - hits}"
+        scan_time = (time.perf_counter() - start) / args.scan_queries
+
+        print(f"逐題掃描: {scan_time * 1000:.1f} ms/查詢")
+        print(f"索引查詢: {index_time * 1000:.2f} ms/查詢  ({scan_time / index_time:.0f}x)")
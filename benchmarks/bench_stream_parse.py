@@ -0,0 +1,80 @@
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fixtures import exam_paper_pages, write_pdf
+from edata_extractor import PDFQuestionParser
+from pdf_cache import PDFCache
+
+"""
+比較整份解析 (PDFQuestionParser 預設) 與逐頁串流解析 (stream=True) 在大型合成試題上的時間與記憶體峰值 (tracemalloc)，
+並確認兩者的 get_questions() 完全相同
+    text: 每頁文字逐頁產生 (同引擎逐頁擷取)，只量測解析本身
+    records: 逐題取得 QuestionRecord 後即丟棄 (只計數)，不轉為 dict
+    --pdf: 改為實際寫出pdf並以 --backend 擷取文字，峰值含引擎在 Python 中的配置，
+        並量測使用快取時的 records (首次逐頁寫入每頁文字與題目的快取，再次執行時逐行讀回)
+    python -m benchmarks.bench_stream_parse --questions 20000
+"""
+
+
+def measure(func):
+    """回傳 (結果, 秒數, 記憶體峰值 bytes)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--questions', type=int, default=20000, help='合成試題的題數')
+    arg_parser.add_argument('--pdf', action='store_true', help='寫出pdf並實際擷取文字')
+    arg_parser.add_argument('--backend', default='pdfium')
+    args = arg_parser.parse_args()
+
+    page_lines = exam_paper_pages(args.questions, seed=0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.pdf:
+            path = os.path.join(tmp, 'paper.pdf')
+            write_pdf(path, page_lines)
+            print(f"{args.questions} 題, {len(page_lines)} 頁, pdf {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+            def make_parser(stream, cache=None):
+                return PDFQuestionParser(path, backends=[args.backend], stream=stream, cache=cache)
+        else:
+            size = sum(len('\n'.join(lines)) for lines in page_lines)
+            print(f"{args.questions} 題, {len(page_lines)} 頁, 文字 {size / 1024 / 1024:.1f} M 字元")
+
+            def make_parser(stream, cache=None):
+                return PDFQuestionParser('<memory>', pages=('\n'.join(lines) for lines in page_lines), stream=stream)
+
+        cache = PDFCache(os.path.join(tmp, 'cache'))
+        cases = [
+            ("整份解析", lambda: make_parser(False).get_questions()),
+            ("串流解析", lambda: make_parser(True).get_questions()),
+            ("串流 records", lambda: sum(1 for _ in make_parser(True).iter_records())),
+        ]
+        if args.pdf:
+            cases += [
+                ("串流 records (快取首次)", lambda: sum(1 for _ in make_parser(True, cache).iter_records())),
+                ("串流 records (快取命中)", lambda: sum(1 for _ in make_parser(True, cache).iter_records())),
+            ]
+        results = {}
+        for name, run in cases:
+            result, seconds, peak = measure(run)
+            results[name] = result
+            print(f"{name}: {seconds:.2f}s, 峰值 {peak / 1024 / 1024:.1f} MB")
+
+        assert results["整份解析"] == results["串流解析"], "串流解析的結果與整份解析不同"
+        assert results["串流 records"] == len(results["整份解析"])
+        if args.pdf:
+            assert results["串流 records (快取首次)"] == results["串流 records (快取命中)"] == len(results["整份解析"])
+            assert make_parser(True, cache).get_questions() == results["整份解析"], "快取讀回的題目與整份解析不同"
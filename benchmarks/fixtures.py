@@ -0,0 +1,206 @@
+import os
+import random
+import zlib
+from typing import List
+
+"""
+產生基準測試用的合成資料，大小皆可設定
+    write_pdf: 不依賴其他套件的最小pdf產生器，以 Type0 (Identity-H) 字型加上 ToUnicode 對照表寫入文字，
+        pdfplumber / pdfminer / pypdfium2 都能擷取出原本的字串 (包含選項用的私有區字元)
+    exam_paper_pages: 試題，含 "代號：…頁次：…" 頁首、各種題組敘述、選項字元、關鍵字與 "（請接背面）"
+    answer_sheet_pages: 答案 / 更正答案，每 10 題一組 "題號 第1題 … / 答案 A …"，更正答案含 "#"
+    make_listing_html: 大型的考選部查詢頁面
+    write_exam_tree: 依 file_iterator 的資料夾結構寫出整個 ./考選部考古題pdf
+"""
+
+OPTION_GLYPHS = ['', '', '', '']
+PAGE_HEADERS = [
+    '代號：50140｜51140頁次：{total}－{page}',
+    '代號：2501頁次：{total}－{page}',
+    '代號：30160-30660、30860頁次：{total}－{page}',
+    '代號：50130-5063050830-5123051430-51530頁次：{total}－{page}',
+    '代 號：50140｜51140頁次：{total}－{page}',
+    '代號：43150|44150頁次：{total}－{page}',
+    '代號：30150-3085031050、3115031650、3195032050、3275032850頁次：{total}－{page}',
+    '代號： 23012701頁 次： {total}－{page}',
+]
+GROUP_HEADERS = [
+    '第{s}題至第{e}題為題組。',
+    '請依下文回答第{s}～{e}題。',
+    '請依下文回答第{s}題至第{e}題。',
+    '依此回答下\uf99c第{s}題至第{e}題。',  # pdf中的 "列" 為相容表意字元 U+F99C
+    '依此回答下列第{s}題至第{e}題。',  # 一般的 "列" 不是題組關鍵字，僅作為題目文字
+    '請回答第{s}題至第{e}題：',
+    '第{s}題至第{e}題為篇章結構，各題請依文意，從四個選項中選出最合適者，各題答案內容不重複。',
+]
+# pdf中 "閱讀上文" 的 "讀" 為相容表意字元 U+F95A
+ABANDON_HEADERS = ['閱\uf95a上文，回答第{s}題至第{e}題', '請依上文回答第{s}題至第{e}題', '閱讀上文，回答第{s}題至第{e}題']
+NOISE = [''] * 12 + ['（25 分）', '依下文', '12 個月內', '①②④', '題組']
+EXAMS = ['三等考試_一般行政', '四等考試_財稅行政', '一般警察人員考試四等考試_行政警察人員', '地方政府公務人員考試三等考試_法制']
+SUBJECTS = ['法學知識與英文', '行政法', '民法概要', '刑法概要', '國文', '憲法']
+
+
+def write_pdf(path: str, pages: List[List[str]], font_size: int = 10, line_height: int = 16,
+              margin: int = 50, page_width: int = 595, page_height: int = 842) -> None:
+    """
+    pages 為每頁的文字行，每行由上而下寫在頁面左側
+    """
+    chars = sorted({char for page in pages for line in page for char in line})
+    cids = {char: index + 1 for index, char in enumerate(chars)}
+    objects: List[bytes] = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages_id = add(None)
+    items = list(cids.items())
+    bfchars = []
+    for start in range(0, len(items), 100):
+        chunk = items[start:start + 100]
+        bfchars.append(f'{len(chunk)} beginbfchar\n'
+                       + '\n'.join(f'<{cid:04X}> <{ord(char):04X}>' for char, cid in chunk)
+                       + '\nendbfchar')
+    cmap = ('/CIDInit /ProcSet findresource begin 12 dict begin begincmap\n'
+            '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n'
+            '/CMapName /Adobe-Identity-UCS def /CMapType 2 def\n'
+            '1 begincodespacerange <0000> <FFFF> endcodespacerange\n'
+            + '\n'.join(bfchars)
+            + '\nendcmap CMapName currentdict /CMap defineresource pop end end').encode()
+    tounicode = add(b'<< /Length %d >>\nstream\n' % len(cmap) + cmap + b'\nendstream')
+    descriptor = add(b'<< /Type /FontDescriptor /FontName /SynthCJK /Flags 4 /FontBBox [0 -120 1000 880] '
+                     b'/ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 700 /StemV 80 >>')
+    widths = ' '.join(f'{cids[char]} [{500 if ord(char) < 128 else 1000}]' for char in chars)
+    cidfont = add(f'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /SynthCJK '
+                  f'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> '
+                  f'/FontDescriptor {descriptor} 0 R /DW 1000 /W [{widths}] /CIDToGIDMap /Identity >>'.encode())
+    font = add(f'<< /Type /Font /Subtype /Type0 /BaseFont /SynthCJK /Encoding /Identity-H '
+               f'/DescendantFonts [{cidfont} 0 R] /ToUnicode {tounicode} 0 R >>'.encode())
+
+    page_ids = []
+    for lines in pages:
+        operators = []
+        y = page_height - margin
+        for line in lines:
+            encoded = ''.join(f'{cids[char]:04X}' for char in line)
+            operators.append(f'BT /F1 {font_size} Tf 1 0 0 1 {margin} {y} Tm <{encoded}> Tj ET')
+            y -= line_height
+        data = zlib.compress('\n'.join(operators).encode())
+        content = add(b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(data) + data + b'\nendstream')
+        page_ids.append(add(f'<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 {page_width} {page_height}] '
+                            f'/Resources << /Font << /F1 {font} 0 R >> >> /Contents {content} 0 R >>'.encode()))
+    objects[catalog - 1] = f'<< /Type /Catalog /Pages {pages_id} 0 R >>'.encode()
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    objects[pages_id - 1] = f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'.encode()
+
+    out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    for offset in offsets:
+        out += f'{offset:010d} 00000 n \n'.encode()
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def exam_paper_pages(n_questions: int = 50, seed: int = 0, questions_per_page: int = 12) -> List[List[str]]:
+    """
+    產生一份試題的每頁文字行，約 8% 的題目前有題組敘述、3% 有必須遺棄的題組，選項有時同一行、有時分行
+    """
+    rnd = random.Random(seed)
+    header = rnd.choice(PAGE_HEADERS)
+    lines = []
+    q = 1
+    while q <= n_questions:
+        roll = rnd.random()
+        if roll < 0.08 and q + 3 <= n_questions:
+            lines.append(rnd.choice(GROUP_HEADERS).format(s=q, e=q + 3) + f'閱讀下文後回答問題，本文描述憲法第{q}條之規定。')
+        elif roll < 0.11 and q + 2 <= n_questions:
+            lines.append(f'文章內容{q}。' + rnd.choice(ABANDON_HEADERS).format(s=q, e=q + 2))
+        lines.append(f'{q} 依憲法第{rnd.randint(1, 170)}條規定，下列敘述何者正確？{rnd.choice(NOISE)}')
+        if rnd.random() < 0.5:
+            lines.append(''.join(f'{OPTION_GLYPHS[i]}選項{"甲乙丙丁"[i]}內容{rnd.randint(1, 99)}' for i in range(4)))
+        else:
+            for i in range(4):
+                lines.append(f'{OPTION_GLYPHS[i]}選項{"甲乙丙丁"[i]}內容{rnd.randint(1, 99)}{rnd.choice(NOISE)}')
+        q += 1
+    per_page = questions_per_page * 4
+    chunks = [lines[start:start + per_page] for start in range(0, len(lines), per_page)]
+    return [[header.format(total=len(chunks), page=page)] + chunk + ['（請接背面）']
+            for page, chunk in enumerate(chunks, 1)]
+
+
+def answer_sheet_pages(n_questions: int = 50, seed: int = 0, corrected: bool = False,
+                       blocks_per_page: int = 10) -> List[List[str]]:
+    """
+    corrected 時為更正答案，約 5% 的題目答案為 "#" (一律給分)
+    """
+    rnd = random.Random(seed)
+    title = '更正答案' if corrected else '測驗式試題標準答案'
+    lines = []
+    for start in range(1, n_questions + 1, 10):
+        numbers = range(start, min(start + 10, n_questions + 1))
+        answers = ['#' if corrected and rnd.random() < 0.05 else rnd.choice('ABCD') for _ in numbers]
+        lines.append('題號 ' + ' '.join(f'第{q}題' for q in numbers))
+        lines.append('答案 ' + ' '.join(answers))
+    per_page = blocks_per_page * 2
+    return [[title] + lines[start:start + per_page] for start in range(0, len(lines), per_page)] + [['備註：本答案僅供參考']]
+
+
+def make_listing_html(n_exams: int, n_subjects: int, shared: bool = False) -> str:
+    """
+    產生大型的考選部查詢頁面，每個考試有 n_subjects 個科目，每個科目另有一份不含 table 的mobile版資料
+        shared: 法學知識科目在各考試間共用同一份試題 (相同的 code/c，查詢參數順序不同)
+    """
+    rows = []
+    for e in range(n_exams):
+        rows.append(f'<tr><td class="level2" colspan="2"><label>第{e}次考試_類科{e}</label></td></tr>')
+        for s in range(n_subjects):
+            subject = f'法學知識{s}' if s % 2 == 0 else f'國文{s}'
+            query = f'code={e:03d}{s:02d}&amp;amp;c={s}&amp;amp;s=0{s}'
+            if shared and s % 2 == 0:
+                query = f'c={s}&amp;amp;s=0{s}&amp;amp;code=999{s:02d}' if e % 2 else f'code=999{s:02d}&amp;amp;c={s}&amp;amp;s=0{s}'
+            answer = '更正答案' if s % 5 == 0 else '答案'
+            answer_type = 'M' if s % 5 == 0 else 'S'
+            links = (
+                f'<a class="exam-question-ans" href="wHandExamQandA_File.ashx?t=Q&amp;amp;{query}">試題</a>'
+                f'<a class="exam-question-ans" href="wHandExamQandA_File.ashx?t={answer_type}&amp;amp;{query}">{answer}</a>'
+            )
+            rows.append(
+                f'<tr><td><label class="exam-title">{subject}</label>'
+                f'<table><tr><td>{links}</td></tr></table></td>'
+                f'<td class="mobile"><label class="exam-title">{subject}</label><div>{links}</div></td></tr>'
+            )
+    return (
+        '<html><head><meta charset="utf-8"></head><body><div>header</div>'
+        f'<table id="ctl00_holderContent_tblExamQand">{"".join(rows)}</table></body></html>'
+    )
+
+
+def write_exam_tree(root: str, years: List[int], n_exams: int = 2, n_subjects: int = 2,
+                    n_questions: int = 50, corrected_every: int = 3) -> List[str]:
+    """
+    在 root 下寫出 ./考選部考古題pdf/<n>年考選部考古題/<考試名稱>/<科目>/ 的試題與答案，
+    每 corrected_every 個科目有一份更正答案，回傳所有科目資料夾
+    """
+    folders = []
+    for 考試年份 in years:
+        for e in range(n_exams):
+            考試名稱 = EXAMS[e % len(EXAMS)] + (f'{e // len(EXAMS)}' if e >= len(EXAMS) else '')
+            for s in range(n_subjects):
+                科目 = SUBJECTS[s % len(SUBJECTS)] + (f'{s // len(SUBJECTS)}' if s >= len(SUBJECTS) else '')
+                folder = os.path.join(root, '考選部考古題pdf', f'{考試年份}年考選部考古題', 考試名稱, 科目)
+                prefix = os.path.join(folder, f'{考試年份}年_{考試名稱}_{科目}')
+                seed = 考試年份 * 10000 + e * 100 + s
+                write_pdf(f'{prefix}_試題.pdf', exam_paper_pages(n_questions, seed))
+                write_pdf(f'{prefix}_答案.pdf', answer_sheet_pages(n_questions, seed))
+                if corrected_every and len(folders) % corrected_every == 0:
+                    write_pdf(f'{prefix}_更正答案.pdf', answer_sheet_pages(n_questions, seed, corrected=True))
+                folders.append(folder)
+    return folders
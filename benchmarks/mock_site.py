@@ -0,0 +1,258 @@
+import gzip
+import hashlib
+import threading
+import time
+import uuid
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from benchmarks.fixtures import make_listing_html
+from listing_fetcher import SEARCH_BUTTON, YEAR_FIELD
+
+"""
+模擬考選部查詢頁面 (ASP.NET WebForms) 的本機伺服器，供 listing_fetcher 的基準測試與驗證使用
+    GET 查詢頁面: 帶 ETag / Last-Modified (涵蓋各年份的查詢結果，網站更新任一年份時改變)，條件式請求符合時回 304
+    選擇年份的 postback: 發出該年份專屬的 __VIEWSTATE 並以 cookie 綁定 session
+    查詢: __VIEWSTATE 必須與同一 session 最後一次取得的相符 (不同年份共用 session 或 state 時回 500)，回傳該年份的查詢頁面
+listings 為 {年份: 查詢結果html}，可在執行中修改以模擬網站更新
+另有模擬放置pdf的檔案伺服器 (MockFileServer)，供 downloader 的驗證使用
+"""
+
+SEARCH_PATH = '/exam/wFrmExamQandASearch.aspx'
+
+
+def form_page(years: List[str], selected: str = '', viewstate: str = 'initial', body: str = '') -> str:
+    options = ''.join(f'<option value="{year}"{" selected" if year == selected else ""}>{year}</option>'
+                      for year in years)
+    button, label = SEARCH_BUTTON
+    return (
+        '<html><head><meta charset="utf-8"></head><body>'
+        f'<form method="post" action="./wFrmExamQandASearch.aspx" id="aspnetForm">'
+        f'<input type="hidden" name="__EVENTTARGET" value="" />'
+        f'<input type="hidden" name="__EVENTARGUMENT" value="" />'
+        f'<input type="hidden" name="__VIEWSTATE" value="{viewstate}" />'
+        f'<input type="hidden" name="__EVENTVALIDATION" value="{hashlib.md5(viewstate.encode()).hexdigest()}" />'
+        f'<select name="{YEAR_FIELD}"><option value="">請選擇</option>{options}</select>'
+        f'<select name="ctl00$holderContent$ddlExamCode"><option value="" selected>全部</option></select>'
+        f'<input type="submit" name="{button}" value="{label}" />'
+        f'{body}</form></body></html>'
+    )
+
+
+class MockExamSite:
+    def __init__(self, years: List[str], n_exams: int = 20, n_subjects: int = 10):
+        self.years = years
+        self.listings: Dict[str, str] = {year: make_listing_html(n_exams, n_subjects) for year in years}
+        self.last_modified = formatdate(usegmt=True)
+        self.sessions: Dict[str, str] = {}
+        self.stats = {"requests": 0, "bytes": 0, "not_modified": 0, "rejected": 0}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_port}/exam/'
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status: int, body: bytes = b'', headers: Dict[str, str] = None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with site.lock:
+                    site.stats["requests"] += 1
+                    site.stats["bytes"] += len(body)
+
+            def do_GET(self):
+                if urlsplit(self.path).path != SEARCH_PATH:
+                    return self._send(404)
+                body = form_page(site.years).encode('utf-8')
+                digest = hashlib.sha256(body)
+                for year in site.years:
+                    digest.update(site.listings[year].encode('utf-8'))
+                etag = f'"{digest.hexdigest()[:16]}"'
+                if self.headers.get('If-None-Match') == etag:
+                    with site.lock:
+                        site.stats["not_modified"] += 1
+                    return self._send(304, headers={'ETag': etag})
+                self._send(200, body, {'ETag': etag, 'Last-Modified': site.last_modified,
+                                       'Content-Type': 'text/html; charset=utf-8'})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                fields = dict(parse_qsl(self.rfile.read(length).decode('utf-8'), keep_blank_values=True))
+                cookie = self.headers.get('Cookie', '')
+                session_id = cookie.split('ASP.NET_SessionId=')[-1].split(';')[0] if 'ASP.NET_SessionId=' in cookie else None
+                year = fields.get(YEAR_FIELD, '')
+
+                if fields.get('__EVENTTARGET') == YEAR_FIELD:
+                    session_id = session_id or uuid.uuid4().hex
+                    viewstate = f'{year}:{uuid.uuid4().hex}'
+                    with site.lock:
+                        site.sessions[session_id] = viewstate
+                    body = form_page(site.years, year, viewstate).encode('utf-8')
+                    return self._send(200, body, {'Set-Cookie': f'ASP.NET_SessionId={session_id}; path=/',
+                                                  'Content-Type': 'text/html; charset=utf-8'})
+
+                button, _ = SEARCH_BUTTON
+                with site.lock:
+                    expected = site.sessions.get(session_id)
+                if button not in fields or expected is None or fields.get('__VIEWSTATE') != expected \
+                        or not expected.startswith(f'{year}:'):
+                    with site.lock:
+                        site.stats["rejected"] += 1
+                    return self._send(500, b'Invalid postback or callback argument.')
+                body = form_page(site.years, year, expected, site.listings[year]).encode('utf-8')
+                self._send(200, body, {'Content-Type': 'text/html; charset=utf-8'})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+SLOW_CHUNKS = 10
+
+
+class MockFileServer:
+    """
+    模擬放置pdf的檔案伺服器
+        回應帶 ETag / Last-Modified，支援 Range (bytes=n-) 與 If-Range (ETag 不符時回傳完整檔案)，起始位置超出檔案時回 416
+        files: {路徑: 內容}
+        faults: {路徑: [故障, ...]}，依序套用在該路徑接下來的請求上，用完後正常回應
+            ("status", 503): 回應該狀態碼
+            ("retry_after", 秒數): 回 429 並附 Retry-After
+            ("truncate", n): 宣告完整的 Content-Length，只送出前 n bytes 就關閉連線
+            ("slow", 秒數): 內容分 SLOW_CHUNKS 次送出，每次之間等待該秒數 (內容大於 socket 緩衝區時才看得出並行傳輸)
+        gzip_paths: 用戶端接受 gzip 時以 Content-Encoding: gzip 回應 (Range 請求除外)
+        latency: 每個請求回應前等待的秒數，用來觀察同時連線數
+        log: 每個請求的 {"path", "range", "if_range", "accept_encoding", "status", "encoding"}
+        stats: 請求數、送出的 bytes、最大同時連線數
+    """
+
+    def __init__(self, files: Dict[str, bytes], gzip_paths: Optional[Set[str]] = None, latency: float = 0.0):
+        self.files = files
+        self.gzip_paths = gzip_paths or set()
+        self.latency = latency
+        self.faults: Dict[str, List[Tuple[str, int]]] = {}
+        self.last_modified = formatdate(usegmt=True)
+        self.log: List[Dict] = []
+        self.stats = {"requests": 0, "bytes": 0, "max_active": 0}
+        self.active = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path: str) -> str:
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
+
+    @staticmethod
+    def etag(body: bytes) -> str:
+        return f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+
+    def requests_for(self, path: str) -> List[Dict]:
+        with self.lock:
+            return [entry for entry in self.log if entry["path"] == path]
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, entry: Dict, status: int, body: bytes = b'', headers: Dict[str, str] = None,
+                      content_length: Optional[int] = None, delay: float = 0.0):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body) if content_length is None else content_length))
+                self.end_headers()
+                if delay:
+                    size = -(-len(body) // SLOW_CHUNKS)
+                    for start in range(0, len(body), size):
+                        if start:
+                            time.sleep(delay)
+                        self.wfile.write(body[start:start + size])
+                        self.wfile.flush()
+                else:
+                    self.wfile.write(body)
+                entry["status"] = status
+                with site.lock:
+                    site.stats["bytes"] += len(body)
+
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                entry = {"path": path, "range": self.headers.get('Range'), "if_range": self.headers.get('If-Range'),
+                         "accept_encoding": self.headers.get('Accept-Encoding'), "status": None, "encoding": None}
+                with site.lock:
+                    site.log.append(entry)
+                    site.stats["requests"] += 1
+                    site.active += 1
+                    site.stats["max_active"] = max(site.stats["max_active"], site.active)
+                    faults = site.faults.get(path)
+                    fault = faults.pop(0) if faults else (None, 0)
+                try:
+                    time.sleep(site.latency)
+                    self._respond(path, entry, fault)
+                finally:
+                    with site.lock:
+                        site.active -= 1
+
+            def _respond(self, path: str, entry: Dict, fault: Tuple[Optional[str], int]):
+                kind, value = fault
+                if path not in site.files:
+                    return self._send(entry, 404)
+                if kind == "status":
+                    return self._send(entry, value)
+                if kind == "retry_after":
+                    return self._send(entry, 429, headers={'Retry-After': str(value)})
+
+                body = site.files[path]
+                etag = site.etag(body)
+                headers = {'ETag': etag, 'Last-Modified': site.last_modified, 'Accept-Ranges': 'bytes',
+                           'Content-Type': 'application/pdf'}
+                status = 200
+                byte_range = self.headers.get('Range', '')
+                if_range = self.headers.get('If-Range')
+                if byte_range.startswith('bytes=') and (if_range is None or if_range == etag):
+                    start = int(byte_range[len('bytes='):].split('-')[0])
+                    if start >= len(body):
+                        return self._send(entry, 416, headers={'Content-Range': f'bytes */{len(body)}'})
+                    headers['Content-Range'] = f'bytes {start}-{len(body) - 1}/{len(body)}'
+                    body, status = body[start:], 206
+                elif path in site.gzip_paths and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body = gzip.compress(body)
+                    headers['Content-Encoding'] = entry["encoding"] = 'gzip'
+
+                if kind == "truncate":
+                    # 宣告完整長度但提早關閉連線，用戶端會收到不完整的內容
+                    self.close_connection = True
+                    return self._send(entry, status, body[:value], headers, content_length=len(body))
+                self._send(entry, status, body, headers, delay=value if kind == "slow" else 0.0)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
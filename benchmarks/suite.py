@@ -0,0 +1,249 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlmodel import create_engine
+
+from adata_extractor import PDFAnswerExtractor
+from benchmarks.fixtures import (answer_sheet_pages, exam_paper_pages, make_listing_html, write_exam_tree,
+                                 write_pdf)
+from corpus_io import CorpusWriter, OutputOptions
+from edata_extractor import PDFQuestionParser
+from file_iterator import build_corpus
+from json2postgreSQL import bulk_load
+from listing_parser import parse_listing_html
+
+"""
+基準測試組，涵蓋 PDFQuestionParser、PDFAnswerExtractor、爬蟲的查詢頁面解析、資料庫載入與整個 build_corpus
+    python -m benchmarks.suite
+    python -m benchmarks.suite --only question_parser answer_extractor --repeat 5
+每次執行的結果存到 benchmarks/results/<commit>.json (工作目錄有未提交的變更時為 <commit>-dirty.json)，
+並與最近一個有結果的祖先 commit (或 --baseline 指定的結果檔) 比較，變慢超過 --threshold 時標記為退步
+結果與機器有關，只比較同一台機器上的結果才有意義
+"""
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 名稱 -> setup(args, tmp_dir)，回傳 (每次重複執行的函式, 處理量, 單位)
+Case = Callable[[argparse.Namespace, str], Tuple[Callable[[], None], int, str]]
+CASES: Dict[str, Case] = {}
+
+
+def case(name: str):
+    def register(setup: Case) -> Case:
+        CASES[name] = setup
+        return setup
+    return register
+
+
+@case('question_parser')
+def question_parser_case(args, tmp_dir):
+    paths = []
+    for seed in range(args.papers):
+        path = os.path.join(tmp_dir, 'papers', f'{seed}_試題.pdf')
+        write_pdf(path, exam_paper_pages(args.questions, seed))
+        paths.append(path)
+
+    def run():
+        for path in paths:
+            PDFQuestionParser(path, backends=[args.backend])
+    return run, args.papers, '份'
+
+
+@case('question_parser_text')
+def question_parser_text_case(args, tmp_dir):
+    """只量測文字處理 (不含pdf文字擷取)"""
+    corpus = [['\n'.join(lines) for lines in exam_paper_pages(args.questions, seed)] for seed in range(args.papers * 10)]
+
+    def run():
+        for pages in corpus:
+            PDFQuestionParser('<memory>', pages=pages)
+    return run, len(corpus) * args.questions, '題'
+
+
+@case('answer_extractor')
+def answer_extractor_case(args, tmp_dir):
+    paths = []
+    for seed in range(args.papers):
+        path = os.path.join(tmp_dir, 'answers', f'{seed}_答案.pdf')
+        write_pdf(path, answer_sheet_pages(args.questions, seed, corrected=seed % 2 == 1))
+        paths.append(path)
+
+    def run():
+        for path in paths:
+            PDFAnswerExtractor(path, backends=[args.backend])
+    return run, args.papers, '份'
+
+
+@case('listing_parse')
+def listing_parse_case(args, tmp_dir):
+    html_content = make_listing_html(args.exams, args.subjects)
+
+    def run():
+        parse_listing_html(html_content)
+    return run, args.exams * args.subjects, '科目'
+
+
+@case('db_load')
+def db_load_case(args, tmp_dir):
+    path = os.path.join(tmp_dir, '101_考古題.jsonl')
+    rows = 0
+    with CorpusWriter(path, compact=True) as writer:
+        for s in range(max(1, args.rows // args.questions)):
+            pages = ['\n'.join(lines) for lines in exam_paper_pages(args.questions, s)]
+            parser = PDFQuestionParser('<memory>', pages=pages)
+            parser.integrate_answers([{"題號": q, "答案": "ABCD"[q % 4]} for q in range(1, args.questions + 1)])
+            writer.write_subject({"考試年份": 101, "考試名稱": f"考試{s // 5}", "考試科目": f"法學知識{s}",
+                                  "考卷內容": parser.get_questions()})
+            rows += len(parser.get_questions())
+    runs = itertools.count()
+
+    def run():
+        # 每次載入到新的資料庫
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, f'load{next(runs)}.db')}")
+        bulk_load(engine, [path], workers=1)
+        engine.dispose()
+    return run, rows, 'rows'
+
+
+@case('build_corpus')
+def build_corpus_case(args, tmp_dir):
+    root = os.path.join(tmp_dir, 'tree')
+    folders = write_exam_tree(root, [101], n_exams=2, n_subjects=max(1, args.papers // 2), n_questions=args.questions)
+
+    def run():
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            build_corpus([101], workers=1, cache_dir=None, output=OutputOptions('jsonl'),
+                         backends=[args.backend])
+        finally:
+            os.chdir(cwd)
+    return run, len(folders), '科目'
+
+
+def git_commit() -> Tuple[str, bool]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short=12', 'HEAD'], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip() != ''
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', True
+
+
+def find_baseline(commit: str) -> Optional[str]:
+    """
+    沿著 git 歷史往前找最近一個有結果檔的 commit (不含目前的 commit)
+    """
+    try:
+        history = subprocess.run(['git', 'rev-list', '--abbrev-commit', '--abbrev=12', 'HEAD'], cwd=REPO_DIR,
+                                 capture_output=True, text=True, check=True).stdout.split()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    for ancestor in history:
+        path = os.path.join(RESULTS_DIR, f'{ancestor[:12]}.json')
+        if ancestor[:12] != commit and os.path.exists(path):
+            return path
+    return None
+
+
+def run_case(name: str, args, tmp_dir: str) -> Dict:
+    run, amount, unit = CASES[name](args, tmp_dir)
+    run()  # 暖身 (載入模組、lru_cache 等)
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {"seconds": best, "median": statistics.median(timings), "amount": amount, "unit": unit,
+            "throughput": amount / best if best else 0.0}
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """
+    印出與 baseline 的比較，回傳退步的項目
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            print(f"  {name:<22} (baseline 無此項目)")
+            continue
+        change = result["seconds"] / previous["seconds"] - 1 if previous["seconds"] else 0.0
+        mark = ''
+        if change > threshold:
+            mark = '  <-- 退步'
+            regressions.append(name)
+        elif change < -threshold:
+            mark = '  (進步)'
+        print(f"  {name:<22} {previous['seconds']:8.3f}s -> {result['seconds']:8.3f}s  {change:+7.1%}{mark}")
+    return regressions
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='執行基準測試組並與先前 commit 的結果比較')
+    arg_parser.add_argument('--only', nargs='+', choices=list(CASES), default=list(CASES))
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--papers', type=int, default=10, help='試題 / 答案pdf份數')
+    arg_parser.add_argument('--questions', type=int, default=80, help='每份試題的題數')
+    arg_parser.add_argument('--exams', type=int, default=300, help='查詢頁面的考試數')
+    arg_parser.add_argument('--subjects', type=int, default=20, help='查詢頁面每個考試的科目數')
+    arg_parser.add_argument('--rows', type=int, default=20000, help='資料庫載入的題數')
+    arg_parser.add_argument('--backend', default='pdfplumber', help='pdf文字擷取引擎')
+    arg_parser.add_argument('--baseline', default=None, help='比較用的結果檔，預設為最近一個有結果的祖先 commit')
+    arg_parser.add_argument('--threshold', type=float, default=0.10, help='變慢超過此比例視為退步')
+    arg_parser.add_argument('--no-save', action='store_true', help='不儲存結果')
+    arg_parser.add_argument('--fail-on-regression', action='store_true', help='有退步時以非 0 結束')
+    args = arg_parser.parse_args()
+
+    commit, dirty = git_commit()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in args.only:
+            results[name] = run_case(name, args, tmp_dir)
+            result = results[name]
+            print(f"{name:<22} {result['seconds']:8.3f}s (median {result['median']:.3f}s)  "
+                  f"{result['throughput']:12,.1f} {result['unit']}/s")
+
+    record = {
+        "commit": commit,
+        "dirty": dirty,
+        "date": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} {platform.processor()} cpu={os.cpu_count()}",
+        "params": {key: value for key, value in vars(args).items()
+                   if key not in ('only', 'baseline', 'no_save', 'fail_on_regression')},
+        "results": results,
+    }
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        result_path = os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}.json")
+        with open(result_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=4)
+        print(f"結果已儲存至 {os.path.relpath(result_path, REPO_DIR)}")
+
+    baseline_path = args.baseline or find_baseline(commit)
+    if baseline_path is None:
+        print("沒有可比較的先前結果")
+        sys.exit(0)
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"與 {baseline['commit']} ({baseline['date']}) 比較：")
+    if baseline.get("machine") != record["machine"] or baseline.get("params") != record["params"]:
+        print("  注意：機器或參數與 baseline 不同，比較結果僅供參考")
+    regressions = compare(results, baseline, args.threshold)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
@@ -0,0 +1,71 @@
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from corpus_io import JSON_DIR
+from pdf_cache import sha256_file
+
+"""
+增量重建用的輸入指紋紀錄
+    每個科目資料夾的指紋為資料夾中每個檔案的 (檔名, 大小, mtime, sha256)，
+    檔名、大小、mtime 都沒變時沿用上次的 sha256，不必重新讀檔
+    每年一份紀錄，存在 ./考選部考古題json/<年份>_考古題.state.json，以 "<考試名稱>/<考試科目>" 為鍵
+"""
+
+
+def state_path(考試年份) -> str:
+    return f'{JSON_DIR}/{考試年份}_考古題.state.json'
+
+
+def subject_key(考試名稱: str, 考試科目: str) -> str:
+    return f'{考試名稱}/{考試科目}'
+
+
+def subject_fingerprint(folder_path: str, previous: Optional[List[Dict]] = None) -> List[Dict]:
+    previous_files = {item['name']: item for item in (previous or [])}
+    fingerprint = []
+    for name in sorted(os.listdir(folder_path)):
+        path = os.path.join(folder_path, name)
+        if not os.path.isfile(path) or not name.endswith('.pdf'):
+            continue
+        stat = os.stat(path)
+        old = previous_files.get(name)
+        if old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+            sha256 = old['sha256']
+        else:
+            sha256 = sha256_file(path)
+        fingerprint.append({"name": name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256})
+    return fingerprint
+
+
+def content_key(fingerprint: List[Dict]) -> Tuple:
+    """
+    以 (檔案類型, sha256) 表示科目資料夾的內容，不含考試名稱與檔名
+    同一份試題列在多個考試類科下時各科目的 content_key 相同，只需解析一次
+    """
+    return tuple(sorted((item['name'].rsplit('_', 1)[-1], item['sha256']) for item in fingerprint))
+
+
+def same_inputs(a: Optional[List[Dict]], b: Optional[List[Dict]]) -> bool:
+    """
+    以檔名與 sha256 判斷輸入是否相同 (只有 mtime 改變，例如重新下載同一份檔案，不算變動)
+    """
+    if a is None or b is None:
+        return False
+    return [(item['name'], item['sha256']) for item in a] == [(item['name'], item['sha256']) for item in b]
+
+
+def load_state(考試年份) -> Dict[str, List[Dict]]:
+    try:
+        with open(state_path(考試年份), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_state(考試年份, state: Dict[str, List[Dict]]) -> None:
+    os.makedirs(JSON_DIR, exist_ok=True)
+    tmp_path = f'{state_path(考試年份)}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, state_path(考試年份))
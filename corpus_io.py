@@ -0,0 +1,236 @@
+import glob
+import gzip
+import json
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+"""
+年份考古題輸出的讀寫
+    json: 與原本相同的 json.dump(..., indent=4) 格式，逐筆寫入暫存檔，完成後才取代原檔
+    jsonl: 每解析完一個科目 (或一題) 就寫出一行並 flush，中途中斷時已寫出的科目仍保留，可選 gzip / zstd 壓縮
+        granularity="subject" 時每行為 {"考試年份", "考試名稱", "考試科目", "考卷內容"}
+        granularity="question" 時每行為一題，並附上 "考試年份"、"考試名稱"、"考試科目"；
+            沒有任何題目的科目改寫出一行考卷內容為空的科目 ({..., "考卷內容": []})，讀回時仍保留該科目 (增量重建時可沿用)
+"""
+
+JSON_DIR = './考選部考古題json'
+COMPRESSION_SUFFIX = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def output_path(考試年份, output_format: str = 'json', compression: Optional[str] = None) -> str:
+    if output_format == 'json':
+        return f'{JSON_DIR}/{考試年份}_考古題.json'
+    return f'{JSON_DIR}/{考試年份}_考古題.jsonl{COMPRESSION_SUFFIX[compression]}'
+
+
+@dataclass(frozen=True)
+class OutputOptions:
+    output_format: str = 'json'
+    compression: Optional[str] = None
+    granularity: str = 'subject'
+    compact: bool = False
+
+    def path(self, 考試年份) -> str:
+        return output_path(考試年份, self.output_format, self.compression)
+
+
+def find_year_files(years: Optional[list] = None, json_dir: str = JSON_DIR) -> Dict[int, str]:
+    """
+    找出各年份的輸出檔 {年份: 路徑}，同一年份有多種格式時依 jsonl.zst、jsonl.gz、jsonl、json 的順序擇一
+    """
+    preference = ['.jsonl.zst', '.jsonl.gz', '.jsonl', '.json']
+    found = {}
+    for path in glob.glob(os.path.join(json_dir, '*_考古題.json*')):
+        match = re.fullmatch(r'(\d+)_考古題(\.jsonl?(?:\.gz|\.zst)?)', os.path.basename(path))
+        if not match or (years is not None and int(match.group(1)) not in years):
+            continue
+        year, suffix = int(match.group(1)), match.group(2)
+        if year not in found or preference.index(suffix) < preference.index(found[year][1]):
+            found[year] = (path, suffix)
+    return {year: found[year][0] for year in sorted(found)}
+
+
+def open_text(path: str, mode: str):
+    """
+    依副檔名 (.gz / .zst) 開啟壓縮或一般文字檔
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, f'{mode}t', encoding='utf-8')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError("讀寫 .zst 檔需要安裝 zstandard 套件")
+        return zstandard.open(path, f'{mode}t', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class CorpusWriter:
+    """
+    逐科目寫出年份輸出，依 path 的副檔名決定 json / jsonl 及壓縮方式
+        compact: 不縮排、不含多餘空白
+        atomic: jsonl 也寫到暫存檔，close 時才取代 (寫出期間仍可讀取原本的輸出)，json 一律如此
+    """
+    def __init__(self, path: str, granularity: str = 'subject', compact: bool = False, atomic: bool = False):
+        self.path = path
+        self.granularity = granularity
+        self.compact = compact
+        self.separators = (',', ':') if compact else None
+        self.is_jsonl = '.jsonl' in os.path.basename(path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # json 陣列寫到暫存檔，完成才取代，避免中斷時留下不合法的json
+        if not self.is_jsonl:
+            self.write_path = f'{path}.tmp'
+        elif atomic:
+            # 保留壓縮的副檔名，open_text 依此決定壓縮方式
+            stem, suffix = os.path.splitext(path) if path.endswith(('.gz', '.zst')) else (path, '')
+            self.write_path = f'{stem}.tmp{suffix}'
+        else:
+            self.write_path = path
+        self.file = open_text(self.write_path, 'w')
+        self.count = 0
+
+    def _write_json_item(self, record: Dict) -> None:
+        if self.compact:
+            text = json.dumps(record, ensure_ascii=False, separators=self.separators)
+            self.file.write(('[' if self.count == 0 else ',') + text)
+        else:
+            text = json.dumps(record, ensure_ascii=False, indent=4).replace('\n', '\n    ')
+            self.file.write(('[\n    ' if self.count == 0 else ',\n    ') + text)
+        self.count += 1
+
+    def _write_line(self, record: Dict) -> None:
+        self.file.write(json.dumps(record, ensure_ascii=False, separators=self.separators) + '\n')
+        self.count += 1
+
+    def write_subject(self, record: Dict) -> None:
+        if not self.is_jsonl:
+            self._write_json_item(record)
+            return
+        if self.granularity == 'question':
+            self.write_questions({key: record[key] for key in ("考試年份", "考試名稱", "考試科目")}, record["考卷內容"])
+            return
+        self._write_line(record)
+        self.file.flush()
+
+    def write_questions(self, exam: Dict, questions: Iterable[Dict]) -> None:
+        """
+        寫出與 write_subject({**exam, "考卷內容": list(questions)}) 完全相同的內容，
+        但逐題寫出，questions 可為逐題讀取的 iterator，不需先取得整個科目的題目
+        """
+        if self.is_jsonl and self.granularity == 'question':
+            empty = True
+            for question in questions:
+                self._write_line({**exam, **question})
+                empty = False
+            if empty:
+                self._write_line({**exam, "考卷內容": []})
+            self.file.flush()
+            return
+        indent = not self.is_jsonl and not self.compact
+        # 以空的考卷內容輸出科目，在 "[]" 處切開，題目逐一寫在兩段之間 ("考卷內容" 為最後一個鍵)
+        empty = {**exam, "考卷內容": []}
+        if indent:
+            head, tail = json.dumps(empty, ensure_ascii=False, indent=4).replace('\n', '\n    ').rsplit('[]', 1)
+            self.file.write(('[\n    ' if self.count == 0 else ',\n    ') + head)
+        else:
+            head, tail = json.dumps(empty, ensure_ascii=False, separators=self.separators).rsplit('[]', 1)
+            if not self.is_jsonl:
+                self.file.write('[' if self.count == 0 else ',')
+            self.file.write(head)
+        first = True
+        for question in questions:
+            if indent:
+                # 題目在科目中縮排兩層，科目在陣列中再縮排一層
+                text = '\n' + ' ' * 12 + json.dumps(question, ensure_ascii=False, indent=4).replace('\n', '\n' + ' ' * 12)
+            else:
+                text = json.dumps(question, ensure_ascii=False, separators=self.separators)
+            self.file.write(('[' if first else (',' if indent or self.compact else ', ')) + text)
+            first = False
+        if first:
+            self.file.write('[]')
+        else:
+            self.file.write('\n' + ' ' * 8 + ']' if indent else ']')
+        self.file.write(tail)
+        self.count += 1
+        if self.is_jsonl:
+            self.file.write('\n')
+            self.file.flush()
+
+    def close(self) -> None:
+        if not self.is_jsonl:
+            if self.count == 0:
+                self.file.write('[]')
+            else:
+                self.file.write(']' if self.compact else '\n]')
+        self.file.close()
+        if self.write_path != self.path:
+            os.replace(self.write_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_records(path: str) -> Iterator[Dict]:
+    """
+    逐筆讀取輸出檔中的紀錄，jsonl 不會整份載入記憶體
+        jsonl 最後一行不完整 (中斷時寫到一半) 或壓縮檔結尾不完整時，讀到該處即停止
+    """
+    if '.jsonl' not in os.path.basename(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+    with open_text(path, 'r') as f:
+        try:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    return
+        except EOFError:
+            return
+
+
+def iter_subjects(path: str) -> Iterator[Dict]:
+    """
+    逐科目讀取，題目為單位的 jsonl 會將連續同一科目的題目合併回 {"考卷內容": [...]} 格式 (沒有題目的科目為考卷內容為空的一行)
+    """
+    current = None
+    for record in iter_records(path):
+        if "考卷內容" in record:
+            if current is not None:
+                yield current
+                current = None
+            yield record
+            continue
+        exam = {key: record.pop(key) for key in ("考試年份", "考試名稱", "考試科目")}
+        if current is None or any(current[key] != value for key, value in exam.items()):
+            if current is not None:
+                yield current
+            current = {**exam, "考卷內容": []}
+        current["考卷內容"].append(record)
+    if current is not None:
+        yield current
+
+
+def iter_questions(path: str) -> Iterator[Tuple[int, str, str, Dict]]:
+    """
+    逐題讀取，產生 (考試年份, 考試名稱, 考試科目, 題目)
+    """
+    for record in iter_records(path):
+        if "考卷內容" in record:
+            for question in record["考卷內容"]:
+                yield record["考試年份"], record["考試名稱"], record["考試科目"], question
+        else:
+            exam = [record.pop(key) for key in ("考試年份", "考試名稱", "考試科目")]
+            yield exam[0], exam[1], exam[2], record
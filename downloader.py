@@ -0,0 +1,464 @@
+import hashlib
+import json
+import os
+import random
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError
+from tqdm import tqdm
+
+from metrics import METRICS
+
+# download() 回傳的狀態中視為成功的狀態
+SUCCESS_STATUSES = ("downloaded", "resumed", "skipped", "linked")
+
+
+def link_file(src: str, dst: str) -> None:
+    """
+    以 hardlink 將 src 連結至 dst (原子性地取代既有的 dst)，不支援 hardlink 的檔案系統 (或跨裝置) 時退回複製
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    tmp_path = f'{dst}.link'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def _release_on_close(response: requests.Response, semaphore: threading.Semaphore) -> None:
+    """
+    串流的回應在 close() 時 (只有第一次) 才釋放連線數上限的名額
+    """
+    close = response.close
+    released = False
+
+    def close_and_release() -> None:
+        nonlocal released
+        try:
+            close()
+        finally:
+            if not released:
+                released = True
+                semaphore.release()
+
+    response.close = close_and_release
+
+
+class TokenBucket:
+    """
+    token bucket 限速器，取代原本每個科目固定 time.sleep(0.5) 的做法
+        rate: 每秒補充的 token 數 (即平均每秒請求數)，<= 0 表示不限速
+        capacity: 最多可累積的 token 數 (允許的瞬間突發請求數)
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def canonical_url(url: str) -> str:
+    """
+    將連結正規化：scheme、host 轉小寫，去除 fragment 與空值的參數，參數依名稱排序
+        只作為判斷是否為同一份檔案的鍵 (同一份試題在不同考試類科下的連結正規化後相同，只需下載一次)，
+        實際請求仍使用原本的連結
+    """
+    parts = urlsplit(url)
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if value != '')
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(query), ''))
+
+
+class DownloadManifest:
+    """
+    持久化的下載紀錄 (url -> path、links、size、sha256、etag、last_modified、status)
+        url 以 canonical_url 正規化後作為鍵
+        path 為實際下載的路徑，links 為同一 url 以 hardlink 連結的其他路徑
+        以 append-only 的 jsonl 儲存，每完成一個檔案即附加一行，中途中斷也不會遺失已完成的紀錄
+        載入時後寫入的紀錄覆蓋先前的紀錄，compact() 會將檔案重寫為每個 url 一行
+    重新執行時只需查詢 dict 即可判斷是否需要下載，不必對每個路徑做 os.path.exists
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 中斷時可能只寫了半行，略過即可
+                    continue
+                self.entries[canonical_url(entry['url'])] = entry
+
+    def get(self, url: str) -> Optional[Dict]:
+        return self.entries.get(canonical_url(url))
+
+    def is_complete(self, url: str, path: str) -> bool:
+        entry = self.get(url)
+        return (bool(entry) and entry['status'] == "complete"
+                and (entry['path'] == path or path in entry.get('links', ())))
+
+    def update(self, url: str, **fields) -> None:
+        url = canonical_url(url)
+        with self.lock:
+            entry = dict(self.entries.get(url, {}), url=url, **fields)
+            self.entries[url] = entry
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def compact(self) -> None:
+        with self.lock:
+            if not self.entries:
+                return
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.path)
+
+
+class PDFDownloader:
+    """
+    以連線池 (requests.Session) 並行下載考古題pdf
+        max_workers: 同時進行的下載數
+        per_host_limit: 每個 host 同時連線數上限
+        rate / burst: 每個 host 的 token bucket 限速 (每秒請求數 / 突發上限)
+        max_retries: 遇到 5xx、429、timeout、連線錯誤時的重試次數，間隔以指數退避 (backoff * 2^n) 加上隨機抖動，
+            回應帶有 Retry-After (秒數或 HTTP 日期) 時至少等待該時間
+        manifest: 下載紀錄，有提供時以紀錄判斷是否已下載完成，否則退回以 os.path.exists 判斷
+    同一份試題常列在多個考試類科下 (正規化後的 url 相同)，每個 url 只下載一次，其餘路徑以 hardlink 連結
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        per_host_limit: int = 4,
+        rate: float = 4.0,
+        burst: Optional[float] = None,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 30,
+        chunk_size: int = 64 * 1024,
+        manifest: Optional[DownloadManifest] = None,
+        session: Optional[requests.Session] = None,
+    ):
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.manifest = manifest
+        self.session = session or self._build_session()
+        self._hosts: Dict[str, Tuple[threading.Semaphore, TokenBucket]] = {}
+        self._hosts_lock = threading.Lock()
+        # canonical_url -> [第一個請求的路徑, 完成事件, 狀態]，同一 url 的其他路徑等待完成後連結
+        self._claims: Dict[str, list] = {}
+        self._claims_lock = threading.Lock()
+
+    def _build_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(self.max_workers, self.per_host_limit))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _host_limits(self, url: str) -> Tuple[threading.Semaphore, TokenBucket]:
+        host = urlsplit(url).netloc
+        with self._hosts_lock:
+            if host not in self._hosts:
+                self._hosts[host] = (threading.Semaphore(self.per_host_limit), TokenBucket(self.rate, self.burst))
+            return self._hosts[host]
+
+    def _sleep_backoff(self, attempt: int, response: Optional[requests.Response] = None) -> None:
+        delay = self.backoff * (2 ** attempt)
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        elif retry_after:
+            try:
+                delay = max(delay, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+        time.sleep(delay + random.uniform(0, self.backoff))
+
+    def fetch(self, url: str, headers: Optional[Dict[str, str]] = None, stream: bool = False,
+              data: Optional[List[Tuple[str, str]]] = None, session: Optional[requests.Session] = None) -> requests.Response:
+        """
+        以 GET (有 data 時為 POST 表單) 取得 url 內容，5xx / 429 / timeout / 連線錯誤時重試，
+        超過次數則拋出最後一次的錯誤 (5xx / 429 時回傳最後一次的回應)
+            session: 需要各自保存 cookie 的請求 (例如每個年份的查詢表單) 可指定其他 session，限速與連線數上限仍共用
+            stream=True 時回應的內容尚未讀取，連線數上限的名額保留到回應 close() 為止 (需以 with 使用回應)，
+            讀取內容期間同樣受 per_host_limit 限制
+        """
+        session = session or self.session
+        semaphore, bucket = self._host_limits(url)
+        for attempt in range(self.max_retries + 1):
+            last_try = attempt == self.max_retries
+            bucket.acquire()
+            semaphore.acquire()
+            try:
+                if data is None:
+                    response = session.get(url, headers=headers, timeout=self.timeout, stream=stream)
+                else:
+                    response = session.post(url, data=data, headers=headers, timeout=self.timeout, stream=stream)
+            except (requests.Timeout, requests.ConnectionError):
+                semaphore.release()
+                if last_try:
+                    raise
+                METRICS.count('http.retries')
+                self._sleep_backoff(attempt)
+                continue
+            except BaseException:
+                semaphore.release()
+                raise
+            if stream:
+                _release_on_close(response, semaphore)
+            else:
+                semaphore.release()
+            if response.status_code in self.RETRY_STATUS and not last_try:
+                METRICS.count('http.retries')
+                response.close()
+                self._sleep_backoff(attempt, response)
+                continue
+            return response
+
+    def download(self, url: str, path: str) -> str:
+        """
+        下載單一檔案至 path，回傳狀態字串："downloaded"、"resumed"、"skipped"、"linked"、"http <status>"
+            同一 url 已由其他路徑下載 (本次執行或 manifest 中的紀錄) 時，以 hardlink 連結至 path，狀態為 "linked"
+            以串流分塊寫入 <path>.part，完成後才以 os.replace 原子性地改名為 path
+            若上次中斷留下 .part 檔，則以 HTTP Range 從中斷處續傳 (有 ETag/Last-Modified 時附上 If-Range)
+            傳輸中斷時依 max_retries 重試，重試同樣從 .part 續傳
+            續傳回應 416 時：.part 的大小與 Content-Range 的檔案大小相同則直接完成，否則捨棄 .part 不帶 Range 重新下載一次
+        """
+        key = canonical_url(url)
+        with self._claims_lock:
+            claim = self._claims.get(key)
+            if claim is None:
+                claim = self._claims[key] = [path, threading.Event(), None]
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            primary, done, _ = claim
+            done.wait()
+            status = claim[2]
+            if primary == path or status not in SUCCESS_STATUSES:
+                return status
+            return self._link(url, primary, path)
+
+        try:
+            claim[2] = self._download(url, path)
+        except Exception as e:
+            claim[2] = f"error: {e}"
+            raise
+        finally:
+            claim[1].set()
+        return claim[2]
+
+    def _link(self, url: str, src: str, path: str) -> str:
+        if self.manifest is not None:
+            if self.manifest.is_complete(url, path) and os.path.exists(path):
+                return "skipped"
+        elif os.path.exists(path):
+            return "skipped"
+        link_file(src, path)
+        if self.manifest is not None:
+            entry = self.manifest.get(url) or {}
+            self.manifest.update(url, links=sorted(set(entry.get('links', [])) | {path}))
+        return "linked"
+
+    def _download(self, url: str, path: str) -> str:
+        if self.manifest is not None:
+            if self.manifest.is_complete(url, path):
+                return "skipped"
+            entry = self.manifest.get(url)
+            if entry and entry['status'] == "complete" and os.path.exists(entry['path']):
+                # 先前的執行已下載至其他路徑
+                return self._link(url, entry['path'], path)
+        elif os.path.exists(path):
+            print(f"文件 {os.path.basename(path)} 已存在，跳過下載。")
+            return "skipped"
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with METRICS.timer('download.file', label=url):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return self._stream_to_file(url, path)
+                except (requests.Timeout, requests.ConnectionError, ChunkedEncodingError):
+                    if attempt == self.max_retries:
+                        raise
+                    METRICS.count('http.retries')
+                    self._sleep_backoff(attempt)
+
+    def _stream_to_file(self, url: str, path: str, resume: bool = True) -> str:
+        """
+        resume=False 時不使用既有的 .part (416 後的重新下載)
+        """
+        part_path = f'{path}.part'
+        entry = self.manifest.get(url) if self.manifest is not None else None
+        offset = os.path.getsize(part_path) if resume and os.path.exists(part_path) else 0
+
+        headers = {}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            # 續傳時不接受壓縮，Range 的位置才會對應到檔案本身 (而非壓縮後的內容)
+            headers['Accept-Encoding'] = 'identity'
+            validator = entry and (entry.get('etag') or entry.get('last_modified'))
+            if validator:
+                headers['If-Range'] = validator
+
+        with self.fetch(url, headers=headers, stream=True) as response:
+            if response.status_code == 416 and offset:
+                # Content-Range: bytes */<檔案大小>，.part 剛好完整時 (上次寫完最後一塊後、改名前中斷) 直接完成
+                total = response.headers.get('Content-Range', '').rpartition('/')[2]
+                if total.isdigit() and int(total) == offset:
+                    return self._finish_part(url, path, entry, offset, response.headers.get('ETag'),
+                                             response.headers.get('Last-Modified'))
+                # .part 已不符合伺服器上的檔案 (例如檔案變短)，捨棄後不帶 Range 重新下載一次
+                try:
+                    os.remove(part_path)
+                except FileNotFoundError:
+                    pass
+                return self._stream_to_file(url, path, resume=False)
+            if response.status_code not in (200, 206):
+                return f"http {response.status_code}"
+            if response.status_code == 200:
+                # 伺服器不支援 Range 或檔案已變更 (If-Range 不符)，從頭下載
+                offset = 0
+
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if self.manifest is not None and offset == 0:
+                self.manifest.update(url, path=path, links=[], etag=etag, last_modified=last_modified,
+                                     status="partial")
+
+            sha256 = hashlib.sha256()
+            if offset:
+                with open(part_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                        sha256.update(chunk)
+
+            size = offset
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+                    sha256.update(chunk)
+                    size += len(chunk)
+                    METRICS.count('download.bytes', len(chunk))
+
+            # Content-Length 為傳輸的長度 (有 Content-Encoding: gzip 等壓縮時為壓縮後的長度)，
+            # 以 response.raw 實際讀到的 bytes 檢查，size 為解壓縮後寫入的長度
+            content_length = response.headers.get('Content-Length')
+            received = response.raw.tell()
+            if content_length is not None and received != int(content_length):
+                raise requests.ConnectionError(f"傳輸不完整: {received}/{content_length} bytes")
+
+        self._complete(url, path, entry, size, sha256.hexdigest(), etag, last_modified)
+        return "resumed" if offset else "downloaded"
+
+    def _finish_part(self, url: str, path: str, entry: Optional[Dict], size: int, etag: Optional[str],
+                     last_modified: Optional[str]) -> str:
+        """
+        .part 已是完整的檔案 (伺服器對其大小的 Range 回應 416)，計算雜湊後改名完成
+        """
+        sha256 = hashlib.sha256()
+        with open(f'{path}.part', 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                sha256.update(chunk)
+        self._complete(url, path, entry, size, sha256.hexdigest(), etag, last_modified)
+        return "resumed"
+
+    def _complete(self, url: str, path: str, entry: Optional[Dict], size: int, sha256: str, etag: Optional[str],
+                  last_modified: Optional[str]) -> None:
+        os.replace(f'{path}.part', path)
+        if self.manifest is not None:
+            self.manifest.update(
+                url,
+                path=path,
+                size=size,
+                sha256=sha256,
+                etag=etag or (entry or {}).get('etag'),
+                last_modified=last_modified or (entry or {}).get('last_modified'),
+                status="complete",
+            )
+
+    def download_all(self, tasks: List[Tuple[str, str]], desc: str = "Downloading exam data") -> Dict[str, str]:
+        """
+        並行下載 [(url, path), ...]，單一檔案失敗不影響其他檔案
+        同一 url 的多個路徑只會下載一次，先提交各 url 的第一個路徑，避免 worker 都在等待同一個下載
+        回傳 {path: 狀態字串}，失敗時為 "error: <訊息>"
+        """
+        results: Dict[str, str] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            first, rest, seen = [], [], set()
+            for url, path in tasks:
+                key = canonical_url(url)
+                (rest if key in seen else first).append((url, path))
+                seen.add(key)
+            futures = {executor.submit(self.download, url, path): path for url, path in first + rest}
+            for future in tqdm(as_completed(futures), total=len(futures), desc=desc, unit="its"):
+                path = futures[future]
+                try:
+                    results[path] = future.result()
+                except Exception as e:
+                    print(f"發生錯誤: {path} {e}")
+                    results[path] = f"error: {e}"
+                METRICS.count(f"download.{results[path].split(':')[0].replace(' ', '_')}")
+        return results
+
+    def close(self) -> None:
+        if self.manifest is not None:
+            self.manifest.compact()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
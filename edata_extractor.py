@@ -1,7 +1,386 @@
-import pdfplumber
+import hashlib
 import re
-from typing import List, Dict, Optional
+import sys
+from bisect import bisect_right
+from functools import lru_cache
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Dict, Optional, Sequence, Tuple
 from termcolor import colored
+from metrics import METRICS
+from pdf_backend import DEFAULT_BACKEND, DEFAULT_BACKENDS, backends_version, get_backend, iter_pages, resolve_backends
+from pdf_cache import PDFCache, source_version
+
+# 選項字元 (pdf中的私有區字元) 轉為 [A]~[D] 標記
+OPTION_GLYPHS = str.maketrans({
+    '\ue18c': ' [A]',
+    '\ue18d': ' [B]',
+    '\ue18e': ' [C]',
+    '\ue18f': ' [D]'
+})
+
+# 換頁時的 "代號：...頁次：..." 字樣，部分字元間允許空格 (注意："|","｜"字元可能不同)
+#     代號：50140｜51140頁次：4－2
+#     代號：2501頁次：4－2
+#     代號：30160-30660、30860頁次：4－3
+#     代號：50130-5063050830-5123051430-51530頁次：4－2
+#     代 號：50140｜51140頁次：4－2
+#     代號：43150|44150頁次：4－2
+#     代號：30150-3085031050、3115031650、3195032050、3275032850頁次：4－4
+#     代號： 23012701頁 次： 4－3
+PAGE_HEADER_PATTERNS = [
+    r'代號：\d+｜?頁次：\d+－\d+',
+    r'代號：\d+-\d+、?-?\d+頁次：\d+－\d',
+    r'代號：\d+-\d+-\d+-\d+頁次：\d+－\d',
+    r'代\s*號\s*：\s*\d+\s*｜\s*\d+\s*頁\s*次\s*：\s*\d+\s*－\s*\d+',
+    r'代號：\d+\|?\d+頁次：\d+－\d+',
+    # r'代[\s]*號[\s]*：(?:\d+(?:[-｜、,－|]\d+)*)[\s]*頁[\s]*次[\s]*：\d+－\d+',
+]
+
+# 注意：pdf中的 "列"、"讀" 為相容表意字元 (U+F99C、U+F95A)，與一般的 "列"、"讀" 不同，以跳脫字元寫出避免被編輯器正規化
+
+# 題組關鍵字 (第1個數字為起始題號、第2個為結束題號)，其後到下一題題號前為題組描述
+QGROUP_HEADERS = [
+    r'第(\d+)題至第(\d+)題為題組。?', # 第n題至第m題為題組
+    r'請依下文回答第(\d+)～(\d+)題。?', # 請依下文回答第39～41題
+    r'請依下文回答第(\d+)題至第(\d+)題。?', # 請依下文回答第42題至第45題
+    r'依此回答下\uf99c第(\d+)題至第(\d+)題。?', # 依此回答下列第37題至第38題
+    r'請回答第(\d+)題至第(\d+)題：?', # 請回答第42題至第45題：
+    r'第(\d+)題至第(\d+)題為篇章結構，各題請依文意，從四個選項中選出最合適者，各題答案內容不重複。?',
+]
+
+# 遺棄題組的關鍵字串
+#     出現"閱讀上文，回答第47題至第50題"類型的字串(題組關鍵字在題目前)時，無法準確分割上一題的d選項與題組的題目
+#     解決辦法為識別題組為哪幾題，然後通通蛋雕
+QGROUP_ABANDON_HEADERS = [
+    r'閱\uf95a上文，回答第(\d+)題至第(\d+)題',
+    r'請依上文回答第(\d+)題至第(\d+)題',
+]
+
+# 冗餘字串 (出現處至結尾皆刪除)
+REDUNDANT_WORDS = [
+    r'第\d+題至第\d+題為題組',
+    r'請依下文回答第\d+～\d+題',
+    r'請依下文回答第\d+題至第\d+題',
+    r'依此回答下\uf99c第\d+題至第\d+題',
+    r'請回答第\d+題至第\d+題',
+    r'（請接背面）',
+    r'第\d+題至第\d+題為篇章結構，各題請依文意，從四個選項中選出最合適者，各題答案內容不重複',
+]
+
+# 題目或選項中出現以下字串時，該題標記為"蛋雕"
+#     "（15 分）"、"計分" keyword用來篩選掉申論題
+#     "依此回答下"、"回答第"、"依下文" 用來篩選可能沒篩乾淨的題組
+FLAG_KEYWORDS = [
+    "頁次", "題組", "代號：", "計分", "背面）", "依此回答下", "回答第", "依下文", "上文",
+    "（50分）", "（25 分）", "（15 分）"
+]
+
+QUESTION_PATTERN = re.compile(
+    r"\[(\d+)\]\s(.*?)\[(A)\](.*?)\[(B)\](.*?)\[(C)\](.*?)\[(D)\](.*?)(?=\[\d+\]\s|\Z)",
+    re.DOTALL
+)
+# 題目的開頭 (同 QUESTION_PATTERN 的前綴與結尾的 lookahead)
+QUESTION_START = re.compile(r"\[\d+\]\s")
+
+
+def _numbered_groups(pattern: str, prefix: str, index: int) -> str:
+    """將 pattern 中的 (\d+) 依序改為具名群組 <prefix>_s<index>、<prefix>_e<index>"""
+    pattern = pattern.replace(r'(\d+)', f'(?P<{prefix}_s{index}>\\d+)', 1)
+    return pattern.replace(r'(\d+)', f'(?P<{prefix}_e{index}>\\d+)', 1)
+
+
+class QuestionTextNormalizer:
+    """
+    將上方的規則合併為少數幾個預先編譯的正則，整個模組共用一份 (NORMALIZER)
+        PAGE_HEADER_PATTERNS 合併為單一 alternation，一次 sub 移除所有頁首
+        QGROUP_HEADERS 與 QGROUP_ABANDON_HEADERS 合併為一個以具名群組區分規則的 lookahead，一次掃描找出全部題組；
+            以 lookahead 掃描才能和原本逐條 findall 一樣，找出彼此重疊的不同規則，
+            並依 (規則順序, 出現位置) 排序，使結果順序與逐條 findall 相同
+        REDUNDANT_WORDS 先以合併後的 alternation 檢查是否出現，多數欄位不含冗餘字串，可略過逐條刪除
+    """
+
+    def __init__(self):
+        self.page_header_pattern = re.compile('|'.join(f'(?:{p})' for p in PAGE_HEADER_PATTERNS))
+        alternatives = [_numbered_groups(p, 'g', i) for i, p in enumerate(QGROUP_HEADERS)]
+        alternatives += [_numbered_groups(p, 'a', i) for i, p in enumerate(QGROUP_ABANDON_HEADERS)]
+        self.group_pattern = re.compile(
+            r'(?=(?:' + '|'.join(alternatives) + r')(?P<desc>.*?)(?=\[\d+\]\s|\Z))', re.DOTALL
+        )
+        self.group_keys = [('g', i) for i in range(len(QGROUP_HEADERS))]
+        self.group_keys += [('a', i) for i in range(len(QGROUP_ABANDON_HEADERS))]
+        self.redundant_any = re.compile('|'.join(f'(?:{p})' for p in REDUNDANT_WORDS))
+        self.redundant_patterns = [re.compile(f'{p}.*') for p in REDUNDANT_WORDS]
+
+    def convert_lines(self, text: str) -> str:
+        """
+        將選項字元轉為 [A]~[D]，並將行首依序出現的題號轉為 [n]，最後將所有行串接
+        """
+        converted_lines, _, _ = self.convert_line_list(text.translate(OPTION_GLYPHS).split('\n'))
+        return "".join(converted_lines)
+
+    def convert_line_list(self, lines: List[str], question_counter: int = 1) -> Tuple[List[str], List[int], int]:
+        """
+        convert_lines 的逐行版本 (lines 需已轉換選項字元)，逐頁解析時以 question_counter 延續上一頁的題號
+        回傳 (轉換後的各行, 轉為 [n] 的行的位置, 下一個題號)
+        """
+        converted_lines = []
+        markers = []
+        for line in lines:
+            # 檢查該行第一組字串是否為數字(題號)，以及確定是否只包含10進制數字(否則會讓'①②④'通過)
+            head, sep, rest = line.partition(' ')
+            if head.isdigit() and head.isdecimal() and int(head) == question_counter:
+                question_counter += 1
+                if sep:
+                    line = f' [{head}] {rest}'
+                    markers.append(len(converted_lines))
+            converted_lines.append(line)
+        return converted_lines, markers, question_counter
+
+    def strip_page_headers(self, text: str) -> str:
+        return self.page_header_pattern.sub('', text)
+
+    def scan_groups(self, text: str):
+        """
+        回傳 (題組, 遺棄題組)，格式同 PDFQuestionParser.group_ranges、abandon_group
+        """
+        return self.group_lists(self.find_groups(text))
+
+    def find_groups(self, text: str) -> List[Tuple]:
+        """
+        回傳未排序的 [(規則順序, 出現位置, 種類, 起始題號, 結束題號, 題組描述)]
+        """
+        found = []
+        last_end = {}
+        for match in self.group_pattern.finditer(text):
+            for order, (kind, index) in enumerate(self.group_keys):
+                start = match.group(f'{kind}_s{index}')
+                if start is None:
+                    continue
+                # 同一條規則的結果不重疊 (與 findall 相同)
+                end = match.end(f'{kind}_e{index}') if kind == 'a' else match.end('desc')
+                if match.start() >= last_end.get(order, 0):
+                    last_end[order] = end
+                    found.append((order, match.start(), kind, int(start), int(match.group(f'{kind}_e{index}')), match.group('desc')))
+                break
+        return found
+
+    @staticmethod
+    def group_lists(found: List[Tuple]):
+        """將 find_groups 的結果依 (規則順序, 出現位置) 排序，分為題組與遺棄題組"""
+        found = sorted(found, key=lambda item: (item[0], item[1]))
+        group_ranges = [
+            {"start_ques": start, "end_ques": end, "ques_desc": desc.strip()}
+            for _, _, kind, start, end, desc in found if kind == 'g'
+        ]
+        abandon_group = [
+            {"start_ques": start, "end_ques": end}
+            for _, _, kind, start, end, _ in found if kind == 'a'
+        ]
+        return group_ranges, abandon_group
+
+    def strip_redundant(self, value: str) -> str:
+        if self.redundant_any.search(value) is None:
+            return value
+        for pattern in self.redundant_patterns:
+            value = pattern.sub('', value).strip()
+        return value
+
+
+NORMALIZER = QuestionTextNormalizer()
+
+
+class KeywordMatcher:
+    """
+    多關鍵字比對，將所有關鍵字合併為一個 alternation，每個欄位只需掃描一次，關鍵字增加時不必多跑一輪 in 檢查
+    (純 Python 實作的 Aho-Corasick 逐字元走訪反而比 C 實作的 re 掃描慢，因此以合併正則達成單次掃描)
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = tuple(keywords)
+        # 長的關鍵字優先，避免被較短的前綴搶先 (僅影響 find 回傳的字串)
+        ordered = sorted(self.keywords, key=len, reverse=True)
+        self.pattern = re.compile('|'.join(map(re.escape, ordered))) if ordered else None
+
+    def find(self, text: str) -> Optional[str]:
+        if self.pattern is None:
+            return None
+        match = self.pattern.search(text)
+        return match.group() if match else None
+
+    def any_in(self, texts: Iterable[str]) -> bool:
+        return any(self.find(text) is not None for text in texts)
+
+
+@lru_cache(maxsize=None)
+def keyword_matcher(keywords: tuple) -> KeywordMatcher:
+    return KeywordMatcher(keywords)
+
+
+class IntervalIndex:
+    """
+    題號區間 (start_ques <= 題號 <= end_ques) 的查詢索引
+        區間依起點排序並記錄前綴最大終點，以 bisect 找到候選後往前檢查，查詢為 O(log n + 重疊區間數)
+        find() 回傳原本順序中第一個包含該題號的區間，與依序線性搜尋的結果相同
+    """
+
+    def __init__(self, intervals: List[Dict[str, int]]):
+        order = sorted(range(len(intervals)), key=lambda i: intervals[i]["start_ques"])
+        self.starts = [intervals[i]["start_ques"] for i in order]
+        self.entries = [(i, intervals[i]) for i in order]
+        self.max_ends = []
+        max_end = None
+        for _, interval in self.entries:
+            max_end = interval["end_ques"] if max_end is None else max(max_end, interval["end_ques"])
+            self.max_ends.append(max_end)
+
+    def find(self, 題號: int) -> Optional[Dict[str, int]]:
+        best = None
+        i = bisect_right(self.starts, 題號) - 1
+        while i >= 0 and self.max_ends[i] >= 題號:
+            position, interval = self.entries[i]
+            if interval["end_ques"] >= 題號 and (best is None or position < best[0]):
+                best = (position, interval)
+            i -= 1
+        return best[1] if best else None
+
+    def __contains__(self, 題號: int) -> bool:
+        return self.find(題號) is not None
+
+
+@dataclass
+class QuestionRecord:
+    """
+    逐頁解析產生的一題，以 __slots__ 儲存，比每題一個中文鍵的 dict 省記憶體
+    to_dict() 轉為 get_questions() 的格式
+    """
+    __slots__ = ('number', 'text', 'option_a', 'option_b', 'option_c', 'option_d', 'group', 'flag', 'answer')
+    number: int                     # 題號
+    text: str                       # 題目
+    option_a: str                   # A
+    option_b: str                   # B
+    option_c: str                   # C
+    option_d: str                   # D
+    group: Optional[Dict]           # 題組，同一題組的題目共用同一個 dict
+    flag: str
+    answer: Optional[str]           # 答案，尚未整合答案時為 None
+
+    def to_dict(self, include_answer: bool = True) -> Dict[str, Optional[str]]:
+        question = {
+            "題號": self.number,
+            "題目": self.text,
+            "A": self.option_a,
+            "B": self.option_b,
+            "C": self.option_c,
+            "D": self.option_d,
+            "題組": self.group,
+            "flag": self.flag,
+        }
+        if include_answer:
+            question["答案"] = self.answer
+        return question
+
+    @classmethod
+    def from_dict(cls, question: Dict) -> 'QuestionRecord':
+        return cls(question["題號"], question["題目"], question["A"], question["B"], question["C"], question["D"],
+                   question["題組"], question["flag"], question.get("答案"))
+
+    def integrate_answer(self, answer_dict: Dict[int, str]) -> None:
+        """同 PDFQuestionParser.integrate_answers"""
+        self.answer = answer_dict.get(self.number, None)
+        if self.answer == "#":
+            self.flag = "蛋雕 (有不明確的更正答案)"
+
+
+class QuestionStream:
+    """
+    逐頁解析試題，結果與整份文字一次解析 (PDFQuestionParser.parse_pages) 相同，但只保留尚未完成的部分：
+        line_tail: 最後一個換行之後的文字 (頁與頁直接串接，下一頁的開頭可能是同一行)
+        pending: 已轉換、但最後一題可能延續到下一頁的各行
+    每頁在最後一個 [n] 題號行之前切開，前段移除頁首、找出題組與題目後即產生 QuestionRecord，後段留待下一頁；
+    頁首與題組規則都不含 "["，不會跨過切點，各段分別處理與整份一次處理相同
+    前段結尾仍有未湊齊選項的題號 (整份解析時會延伸到後面的題目) 時不切開，等下一頁再試
+    題組以已讀到的題組判斷，題組標題需出現在其題目之前 (試題的題組說明都在題目前)
+    """
+
+    def __init__(self, keyword_matcher: KeywordMatcher):
+        self.keyword_matcher = keyword_matcher
+        self.question_counter = 1
+        self.line_tail = ''
+        self.pending: List[str] = []
+        self.markers: List[int] = []
+        self.offset = 0  # 已解析的文字 (移除頁首後) 長度，作為題組出現位置的基準
+        self.found_groups: List[Tuple] = []
+        # {題號: ((規則順序, 出現位置), 題組)}，保留排序最前面的題組，同 IntervalIndex.find
+        self.group_lookup: Dict[int, Tuple[Tuple[int, int], Dict]] = {}
+        self.abandoned = set()
+        self.group_ranges: List[Dict] = []
+        self.abandon_group: List[Dict] = []
+
+    def feed(self, page: str) -> Iterator[QuestionRecord]:
+        head, sep, self.line_tail = (self.line_tail + (page or '')).rpartition('\n')
+        if not sep:
+            return
+        self._append_lines(head)
+        cut = self.markers[-1] if self.markers else 0
+        if cut == 0:
+            return
+        records = self._parse(''.join(self.pending[:cut]), final=False)
+        if records is None:
+            return
+        del self.pending[:cut]
+        self.markers = [marker - cut for marker in self.markers if marker >= cut]
+        yield from records
+
+    def close(self) -> Iterator[QuestionRecord]:
+        """處理最後剩下的文字"""
+        self._append_lines(self.line_tail)
+        self.line_tail = ''
+        text = ''.join(self.pending)
+        self.pending, self.markers = [], []
+        yield from self._parse(text, final=True)
+        self.group_ranges, self.abandon_group = NORMALIZER.group_lists(self.found_groups)
+
+    def _append_lines(self, text: str) -> None:
+        lines, markers, self.question_counter = NORMALIZER.convert_line_list(
+            text.translate(OPTION_GLYPHS).split('\n'), self.question_counter)
+        self.markers.extend(len(self.pending) + marker for marker in markers)
+        self.pending.extend(lines)
+
+    def _parse(self, text: str, final: bool) -> Optional[List[QuestionRecord]]:
+        """
+        解析一段文字，非最後一段且結尾有未完成的題目時回傳 None (不改變任何狀態)
+        """
+        text = NORMALIZER.strip_page_headers(text)
+        matches = list(QUESTION_PATTERN.finditer(text))
+        if not final:
+            tail = text[matches[-1].end():] if matches else text
+            if QUESTION_START.search(tail):
+                return None
+
+        for order, position, kind, start, end, desc in NORMALIZER.find_groups(text):
+            position += self.offset
+            self.found_groups.append((order, position, kind, start, end, desc))
+            if kind == 'a':
+                self.abandoned.update(range(start, end + 1))
+                continue
+            group = {"start_ques": start, "end_ques": end, "ques_desc": desc.strip()}
+            for 題號 in range(start, end + 1):
+                current = self.group_lookup.get(題號)
+                if current is None or (order, position) < current[0]:
+                    self.group_lookup[題號] = ((order, position), group)
+        self.offset += len(text)
+
+        records = []
+        for match in matches:
+            題號 = int(match.group(1))
+            fields = [NORMALIZER.strip_redundant(match.group(i).strip()) for i in (2, 4, 6, 8, 10)]
+            flag = "蛋雕" if self.keyword_matcher.any_in(fields) else "讚"
+            if 題號 in self.abandoned:
+                flag = "蛋雕 (有必須遺棄的題組)"
+            group = self.group_lookup.get(題號)
+            records.append(QuestionRecord(題號, *fields, group[1] if group else None, flag, None))
+        return records
+
 
 class PDFQuestionParser:
     """
@@ -15,118 +394,212 @@ class PDFQuestionParser:
         每一題的flag資訊，若該題的題目或選項中帶有指定字串，則將該題的flag標記為"蛋雕"，否則標記為"讚"
         若為題組，則該題資料中會有"題組題的start_ques、end_ques、ques_desc"，否則為None
         若答案不明確(可能更正答案中有多個答案)，會標記成"蛋雕 (有不明確的更正答案)"
+
+    提供 cache 時，會以pdf的 sha256 快取每頁文字與解析結果 (整合答案前)，解析規則變動時快取自動失效
+    flag_keywords 可替換標記"蛋雕"的關鍵字 (預設為 FLAG_KEYWORDS)
+    backends 為擷取文字的引擎順序 (見 pdf_backend)，第一個為主要引擎，其餘在解析不出題目時依序備援
+    pages 為已預先擷取的每頁文字 (stream=True 時可為逐頁產生文字的 iterator)，提供時不再讀取pdf
+    stream=True 時不在建構時解析，改由 iter_records() 逐頁解析並逐題產生 QuestionRecord (見 QuestionStream)，
+        不需保留整份文字與其各階段的複本；get_questions() 仍回傳相同格式的 dict
     """
     
-    def __init__(self, filename: str, debug_mode:bool = False):
+    def __init__(self, filename: str, debug_mode:bool = False, cache: Optional[PDFCache] = None,
+                 flag_keywords: Optional[Iterable[str]] = None, backends: Sequence[str] = DEFAULT_BACKENDS,
+                 pages: Optional[Iterable[str]] = None, stream: bool = False):
         self.filename = filename
         self.debug_mode=debug_mode
+        self.cache = cache
+        self.backends = resolve_backends(backends)
+        self.backend: Optional[str] = None
+        self.keyword_matcher = keyword_matcher(tuple(FLAG_KEYWORDS if flag_keywords is None else flag_keywords))
+        # 自訂關鍵字會影響 flag，快取版本需一併區分
+        self.parser_version = PARSER_VERSION
+        if flag_keywords is not None:
+            self.parser_version += '-' + hashlib.sha256('\x00'.join(self.keyword_matcher.keywords).encode('utf-8')).hexdigest()[:8]
+        # 使用的引擎 (含其版本) 與備援順序也會影響結果
+        self.parser_version += '-' + backends_version(self.backends)
         self.questions: List[Dict[str, Optional[str]]] = []
         self.group_ranges: List[Dict[str, int]] = []
         self.text_content: str = ""
-        self.conversion_dict = {
-            '': ' [A]',
-            '': ' [B]',
-            '': ' [C]',
-            '': ' [D]'
-        }
-        # 定義題組關鍵字
-        self.qgroup_patterns = [
-            re.compile(r'第(\d+)題至第(\d+)題為題組。?(.*?)(?=\[\d+\]\s|\Z)', re.DOTALL), # 第n題至第m題為題組
-            re.compile(r'請依下文回答第(\d+)～(\d+)題。?(.*?)(?=\[\d+\]\s|\Z)', re.DOTALL), # 請依下文回答第39～41題
-            re.compile(r'請依下文回答第(\d+)題至第(\d+)題。?(.*?)(?=\[\d+\]\s|\Z)', re.DOTALL), # 請依下文回答第42題至第45題
-            re.compile(r'依此回答下列第(\d+)題至第(\d+)題。?(.*?)(?=\[\d+\]\s|\Z)', re.DOTALL), # 依此回答下列第37題至第38題
-            re.compile(r'請回答第(\d+)題至第(\d+)題：?(.*?)(?=\[\d+\]\s|\Z)', re.DOTALL), # 請回答第42題至第45題：
-            re.compile(r'第(\d+)題至第(\d+)題為篇章結構，各題請依文意，從四個選項中選出最合適者，各題答案內容不重複。?(.*?)(?=\[\d+\]\s|\Z)', re.DOTALL),
-        ]
-        # 定義冗餘字串
-        self.redundant_words_patterns = [
-            re.compile(r'第\d+題至第\d+題為題組.*'),
-            re.compile(r'請依下文回答第\d+～\d+題.*'),
-            re.compile(r'請依下文回答第\d+題至第\d+題.*'),
-            re.compile(r'依此回答下列第\d+題至第\d+題.*'),
-            re.compile(r'請回答第\d+題至第\d+題.*'),
-            re.compile(r'（請接背面）.*'),
-            re.compile(r'第\d+題至第\d+題為篇章結構，各題請依文意，從四個選項中選出最合適者，各題答案內容不重複.*'),
-        ]
-        # 定義遺棄題組的關鍵字串
-        self.abandon_group = []
-        self.qgroup_abandon_patterns = [
-            re.compile(r'閱讀上文，回答第(\d+)題至第(\d+)題', re.DOTALL),
-            re.compile(r'請依上文回答第(\d+)題至第(\d+)題', re.DOTALL),
-        ]
-        self.parse_pdf()
+        self.abandon_group: List[Dict[str, int]] = []
+        self.pages = pages
+        self.parsed = not stream
+        if stream:
+            return
+        if pages is not None:
+            # 已預先擷取的每頁文字，直接解析 (不使用快取與備援引擎)
+            self.parse_pages(pages)
+        else:
+            self.parse_pdf()
+
+    def extract_pages(self, backend: str = DEFAULT_BACKEND) -> List[str]:
+        return list(iter_pages(backend, self.filename))
+
+    def load_pages(self, backend: str, cache_key: Optional[str]) -> List[str]:
+        if cache_key is None:
+            return self.extract_pages(backend)
+        return list(self.iter_pages(backend, cache_key))
 
     def parse_pdf(self) -> None:
-        with pdfplumber.open(self.filename) as pdf:
-            text = ''.join(page.extract_text() for page in pdf.pages)
+        """
+        依序以 backends 中的引擎擷取文字並解析，主要引擎解析不出任何題目時 (例如無法識別選項字元) 改用下一個引擎
+        """
+        with METRICS.timer('parse.questions_pdf', label=self.filename):
+            self._parse_pdf()
+        METRICS.count('parse.questions', len(self.questions))
 
-        # 逐行處理提取的文本
-        lines = text.split('\n')
-        converted_lines = []
-        question_counter = 1
+    def _parse_pdf(self) -> None:
+        cache_key = self.cache.file_key(self.filename) if self.cache is not None else None
+        if cache_key is not None:
+            cached = self.cache.iter_lines('questions', cache_key, self.parser_version)
+            if cached is not None:
+                self.questions = list(self._read_cached_questions(cached))
+                return
+
+        for backend in self.backends:
+            self.parse_pages(self.load_pages(backend, cache_key))
+            self.backend = backend
+            if self.questions:
+                break
+            if self.debug_mode:print(colored(f"{backend} 沒有解析出任何題目", 'red'))
 
+        if cache_key is not None:
+            with self.cache.writer('questions', cache_key, self.parser_version) as writer:
+                for question in self.questions:
+                    writer.write(question)
+                writer.write(self._questions_trailer())
+
+    def _questions_trailer(self) -> Dict:
+        """
+        題目快取 (每行一題) 的最後一行，記錄整份解析後才確定的題組與使用的引擎
+        """
+        return {"trailer": {
+            "group_ranges": self.group_ranges,
+            "abandon_group": self.abandon_group,
+            "backend": self.backend,
+        }}
+
+    def _read_cached_questions(self, lines: Iterator[Dict]) -> Iterator[Dict]:
+        """
+        逐題產生快取中的題目 (整合答案前)，讀到最後一行時設定 group_ranges、abandon_group、backend
+        """
         for line in lines:
-            for char, letter in self.conversion_dict.items():
-                line = line.replace(char, letter)
-            
-            # 檢查該行第一組字串是否為數字(題號)，以及確定是否只包含10進制數字(否則會讓'①②④'通過)
-            if line and line.split(' ', 1)[0].isdigit() and line.split(' ', 1)[0].isdecimal():
-                if int(line.split(' ', 1)[0]) == question_counter:
-                    question_counter += 1
-                    parts = line.split(' ', 1)
-                    if len(parts) > 1:
-                        line = f' [{parts[0]}] {parts[1]}'
-            converted_lines.append(line)
+            if "trailer" in line:
+                trailer = line["trailer"]
+                self.group_ranges = trailer['group_ranges']
+                self.abandon_group = trailer['abandon_group']
+                self.backend = trailer['backend']
+            else:
+                yield line
 
-        self.text_content = "".join(converted_lines)
-        self.clean_text_content()
-        self.extract_groups()
-        self.find_abandon_qgroup()
-        self.extract_questions()
+    def iter_pages(self, backend: str, cache_key: Optional[str]) -> Iterator[str]:
+        """
+        逐頁產生文字，有快取時逐行讀取快取；快取中沒有時每擷取一頁就寫入快取，不收集整份文字
+        (全部頁面都擷取完才完成快取，中途停止時不留下不完整的快取)
+        """
+        if self.pages is not None:
+            yield from self.pages
+            return
+        if cache_key is None:
+            yield from iter_pages(backend, self.filename)
+            return
+        version = get_backend(backend).version
+        cached = self.cache.iter_lines('pages', cache_key, version)
+        if cached is not None:
+            yield from cached
+            return
+        with self.cache.writer('pages', cache_key, version) as writer:
+            for page in iter_pages(backend, self.filename):
+                writer.write(page)
+                yield page
+
+    def iter_records(self, answers: Optional[List[Dict[str, str]]] = None) -> Iterator[QuestionRecord]:
+        """
+        逐頁解析並逐題產生 QuestionRecord，answers 為 PDFAnswerExtractor 的結果，提供時一併整合答案
+        主要引擎沒有解析出任何題目時改用下一個引擎 (同 parse_pdf)，已預先提供 pages 時不使用備援
+        有快取時逐行讀取；沒有時每產生一題就寫入題目快取，group_ranges 等在產生完所有題目後才設定
+        """
+        answer_dict = {ans['題號']: ans['答案'] for ans in answers} if answers is not None else None
+        cache_key = self.cache.file_key(self.filename) if self.cache is not None and self.pages is None else None
+        cached = self.cache.iter_lines('questions', cache_key, self.parser_version) if cache_key is not None else None
+        if cached is not None:
+            for question in self._read_cached_questions(cached):
+                record = QuestionRecord.from_dict(question)
+                if answer_dict is not None:
+                    record.integrate_answer(answer_dict)
+                yield record
+            return
+        if cache_key is None:
+            for record in self._stream_records(cache_key):
+                if answer_dict is not None:
+                    record.integrate_answer(answer_dict)
+                yield record
+            return
+        with self.cache.writer('questions', cache_key, self.parser_version) as writer:
+            for record in self._stream_records(cache_key):
+                writer.write(record.to_dict(include_answer=False))
+                if answer_dict is not None:
+                    record.integrate_answer(answer_dict)
+                yield record
+            writer.write(self._questions_trailer())
+
+    def _stream_records(self, cache_key: Optional[str]) -> Iterator[QuestionRecord]:
+        backends = self.backends if self.pages is None else self.backends[:1]
+        for backend in backends:
+            stream = QuestionStream(self.keyword_matcher)
+            count = 0
+            for page in self.iter_pages(backend, cache_key):
+                for record in stream.feed(page):
+                    count += 1
+                    yield record
+            for record in stream.close():
+                count += 1
+                yield record
+            self.group_ranges, self.abandon_group = stream.group_ranges, stream.abandon_group
+            self.backend = backend
+            if count:
+                break
+            if self.debug_mode:print(colored(f"{backend} 沒有解析出任何題目", 'red'))
+
+    def _parse_stream(self) -> None:
+        with METRICS.timer('parse.questions_pdf', label=self.filename):
+            self.questions = [record.to_dict(include_answer=False) for record in self.iter_records()]
+        METRICS.count('parse.questions', len(self.questions))
+        if self.debug_mode:print(colored("questions: \n"+str(self.questions),'light_cyan'))
+
+    def parse_pages(self, pages: Iterable[str]) -> None:
+        self.questions = []
+        text = ''.join(page or '' for page in pages)
+
+        # 逐行處理提取的文本，各階段分別計時
+        with METRICS.timer('parse.convert_lines'):
+            self.text_content = NORMALIZER.convert_lines(text)
+        with METRICS.timer('parse.strip_page_headers'):
+            self.clean_text_content()
+        with METRICS.timer('parse.scan_groups'):
+            self.extract_groups()
+        with METRICS.timer('parse.extract_questions'):
+            self.extract_questions()
 
     def clean_text_content(self) -> None:
         """
-        解決出現以下字串的情況，部分字元間允許空格 (注意："|","｜"字元可能不同)
-            代號：50140｜51140頁次：4－2
-            代號：2501頁次：4－2
-            代號：30160-30660、30860頁次：4－3
-            代號：50130-5063050830-5123051430-51530頁次：4－2
-            代 號：50140｜51140頁次：4－2
-            代號：43150|44150頁次：4－2
-            代號：30150-3085031050、3115031650、3195032050、3275032850頁次：4－4
-            代號： 23012701頁 次： 4－3
-        """
-        sub_contents = [
-            r'代號：\d+｜?頁次：\d+－\d+',
-            r'代號：\d+-\d+、?-?\d+頁次：\d+－\d',
-            r'代號：\d+-\d+-\d+-\d+頁次：\d+－\d',
-            r'代\s*號\s*：\s*\d+\s*｜\s*\d+\s*頁\s*次\s*：\s*\d+\s*－\s*\d+',
-            r'代號：\d+\|?\d+頁次：\d+－\d+',
-            # r'代[\s]*號[\s]*：(?:\d+(?:[-｜、,－|]\d+)*)[\s]*頁[\s]*次[\s]*：\d+－\d+',
-        ]
-        for sub_content in sub_contents:
-            self.text_content = re.sub(sub_content, '', self.text_content)
+        移除換頁時的 "代號：...頁次：..." 字樣 (格式見 PAGE_HEADER_PATTERNS)
+        """
+        self.text_content = NORMALIZER.strip_page_headers(self.text_content)
 
         if self.debug_mode:print(colored("text_content: \n"+str(self.text_content),'green'))
-        # return fixed_content
 
     def extract_groups(self) -> None:
-        for pattern in self.qgroup_patterns:
-            group_matches = pattern.findall(self.text_content)
-            for match in group_matches:
-                self.group_ranges.append({
-                    "start_ques": int(match[0]),
-                    "end_ques": int(match[1]),
-                    "ques_desc": match[2].strip()
-                })
+        """
+        一次掃描找出題組 (group_ranges) 與必須遺棄的題組 (abandon_group)
+        """
+        self.group_ranges, self.abandon_group = NORMALIZER.scan_groups(self.text_content)
         if self.debug_mode:print(colored("group_ranges: \n"+str(self.group_ranges),'blue'))
 
     def extract_questions(self) -> None:
-        pattern = re.compile(
-            r"\[(\d+)\]\s(.*?)\[(A)\](.*?)\[(B)\](.*?)\[(C)\](.*?)\[(D)\](.*?)(?=\[\d+\]\s|\Z)",
-            re.DOTALL
-        )
-        matches = pattern.findall(self.text_content)
+        self.group_index = IntervalIndex(self.group_ranges)
+        self.abandon_index = IntervalIndex(self.abandon_group)
+        matches = QUESTION_PATTERN.findall(self.text_content)
         if self.debug_mode:print(colored("matches: \n"+str(matches),'yellow'))
         for match in matches:
             question = {
@@ -136,63 +609,45 @@ class PDFQuestionParser:
                 "B": match[5].strip(),
                 "C": match[7].strip(),
                 "D": match[9].strip(),
-                "題組": next(
-                    (group for group in self.group_ranges if group["start_ques"] <= int(match[0]) <= group["end_ques"]),
-                    None
-                )
+                "題組": self.group_index.find(int(match[0]))
             }
             for key in ["題目", 'A', 'B', 'C', 'D']:
-                for rwp in self.redundant_words_patterns:
-                    question[key] = re.sub(rwp, '', question[key]).strip()
-                    
+                question[key] = NORMALIZER.strip_redundant(question[key])
+
             self.keyword_filter(question)
             self.questions.append(question)
         
         if self.debug_mode:print(colored("questions: \n"+str(self.questions),'light_cyan'))
 
-    
-    def find_abandon_qgroup(self):
-        """
-        出現"閱讀上文，回答第47題至第50題"類型的字串(題組關鍵字在題目前)時，無法準確分割上一題的d選項與題組的題目
-        解決辦法為識別題組為哪幾題，然後通通蛋雕
-        """
-        for pattern in self.qgroup_abandon_patterns:
-            group_matches = pattern.findall(self.text_content)
-            for match in group_matches:
-                self.abandon_group.append({
-                    "start_ques": int(match[0]),
-                    "end_ques": int(match[1]),
-                })
-    
     def keyword_filter(self, question: Dict[str, str]) -> None:
-        # "（15 分）"、"計分" keyword用來篩選掉申論題
-        # "依此回答下"、"回答第"、"依下文" 用來篩選可能沒篩乾淨的題組
-        keywords = [
-            "頁次", "題組", "代號：", "計分", "背面）", "依此回答下", "回答第", "依下文", "上文",
-            "（50分）", "（25 分）", "（15 分）"
-        ]
         question['flag'] = "讚"  # 默認為讚
         
         # 處理關鍵字
-        if any(keyword in question['題目'] or keyword in question[key] for key in ['A', 'B', 'C', 'D'] for keyword in keywords):
+        if self.keyword_matcher.any_in(question[key] for key in ['題目', 'A', 'B', 'C', 'D']):
             question['flag'] = "蛋雕"
         
         # 處理必須拋棄的題組
-        for group in self.abandon_group:
-            for 題號 in range(group["start_ques"],group["end_ques"]+1):
-                if question["題號"]==題號: question['flag'] = "蛋雕 (有必須遺棄的題組)"
+        if question["題號"] in self.abandon_index:
+            question['flag'] = "蛋雕 (有必須遺棄的題組)"
 
     def integrate_answers(self, answers: List[Dict[str, str]]) -> None:
         answer_dict = {ans['題號']: ans['答案'] for ans in answers}
-        for question in self.questions:
+        for question in self.get_questions():
             question['答案'] = answer_dict.get(question['題號'], None)
             # 更正答案中，答案可能會有"#"字元，遇到則蛋雕
             if question['答案'] == "#":
                 question['flag'] = "蛋雕 (有不明確的更正答案)"
 
     def get_questions(self) -> List[Dict[str, Optional[str]]]:
+        if not self.parsed:
+            self.parsed = True
+            self._parse_stream()
         return self.questions
 
+
+# 以整個模組的原始碼 (解析規則、正則、關鍵字) 計算快取版本
+PARSER_VERSION = source_version(sys.modules[__name__])
+
 # if __name__ == "__main__":
 #     from adata_extractor import PDFAnswerExtractor
 #     年度 = 112
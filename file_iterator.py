@@ -1,8 +1,27 @@
+import argparse
 import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 import json
 from edata_extractor import PDFQuestionParser
 from adata_extractor import PDFAnswerExtractor
+from pdf_backend import BACKENDS, DEFAULT_BACKENDS
+from pdf_cache import DEFAULT_CACHE_DIR, PDFCache
+from corpus_io import CorpusWriter, OutputOptions, iter_subjects
+from build_state import content_key, load_state, same_inputs, save_state, subject_fingerprint, subject_key
+from metrics import METRICS, default_report_path, print_summary, profile_call, write_report
+
+# 每個 process 各自建立一個 PDFCache (跨 process 共用同一個快取資料夾)
+_cache = None
+
+def get_cache(cache_dir):
+    global _cache
+    if cache_dir is None:
+        return None
+    if _cache is None or _cache.cache_dir != cache_dir:
+        _cache = PDFCache(cache_dir)
+    return _cache
 
 def list_directories(folder_path):
     try:
@@ -38,55 +57,318 @@ def classify_files(folder_path):
         return classified_files
     except Exception as e:
         print(f"發生錯誤: {e}")
-        return {}    
-if __name__ == "__main__":
-    exam_years = [
-        101,
-        102,
-        103,
-        104,
-        105,
-        106,
-        107,
-        108,
-        109,
-        110,
-        111,
-        112
-        ]
-    for exam_year in exam_years:
-        考試年份 = exam_year
+        return {}
+
+
+def iter_subject_questions(lv3_path, cache=None, backends=DEFAULT_BACKENDS):
+    """
+    逐題產生單一科目資料夾的考卷內容 (有更正答案時優先使用更正答案)
+        先提取答案，再逐頁串流解析試題並逐題整合答案後產生，不保留整份試題的題目
+        backends 為擷取pdf文字的引擎順序，主要引擎解析不出內容時依序備援
+    """
+    pdf_file = classify_files(lv3_path)
+
+    試題_path = f'{lv3_path}/{pdf_file["試題"][0]}'
+    # 檢查是否有更正答案，有則使用"更正答案"，反之則用"答案"
+    # 答案需在試題之前提取，答案pdf讀到答案後的下一頁沒有 "題號" 即停止
+    if pdf_file["更正答案"]!=[]:
+        更正答案_path = f'{lv3_path}/{pdf_file["更正答案"][0]}'
+        ans = PDFAnswerExtractor(更正答案_path, cache=cache, backends=backends).get_results()
+    else:
+        答案_path = f'{lv3_path}/{pdf_file["答案"][0]}'
+        ans = PDFAnswerExtractor(答案_path, cache=cache, backends=backends).get_results()
+
+    q_parser = PDFQuestionParser(試題_path, cache=cache, backends=backends, stream=True)
+    count = 0
+    # 計時包含逐題寫出的時間 (寫出與解析交錯進行)
+    with METRICS.timer('parse.questions_pdf', label=試題_path):
+        for record in q_parser.iter_records(ans):
+            count += 1
+            yield record.to_dict()
+    METRICS.count('parse.questions', count)
+
+
+def parse_subject(lv3_path, cache=None, backends=DEFAULT_BACKENDS):
+    """
+    解析單一科目資料夾中的試題與答案，回傳考卷內容 (見 iter_subject_questions)
+    """
+    return list(iter_subject_questions(lv3_path, cache, backends))
+
+
+class SubjectSpool:
+    """
+    一個科目的考卷內容，由 worker 逐題寫入暫存 jsonl，跨 process 只傳遞路徑
+    主 process 以 iter() 逐題讀回 (可重複讀取) 寫入年份輸出，users 個引用者都 release() 後刪除
+    """
+    def __init__(self, path, users=1):
+        self.path = path
+        self.users = users
+
+    @classmethod
+    def write(cls, spool_dir, questions):
+        fd, path = tempfile.mkstemp(suffix='.jsonl', dir=spool_dir)
+        try:
+            with open(fd, 'w', encoding='utf-8') as f:
+                for question in questions:
+                    f.write(json.dumps(question, ensure_ascii=False) + '\n')
+        except BaseException:
+            os.remove(path)
+            raise
+        return cls(path)
+
+    def __iter__(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def release(self):
+        self.users -= 1
+        if self.users <= 0 and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def collect_work_units(exam_years):
+    """
+    列出所有 (考試年份, 考試名稱, 考試科目) 工作單元，資料夾依名稱排序以確保輸出順序固定
+    """
+    units = []
+    for 考試年份 in exam_years:
         lv1_folder = f'./考選部考古題pdf/{考試年份}年考選部考古題'  #考試年份
-        lv2_folder = list_directories(lv1_folder)  #考試名稱:list
-        data=[]
-        for 考試名稱 in tqdm(lv2_folder, desc='Parsing PDF content', unit="its"):
-            lv3_folder = list_directories(f"{lv1_folder}/{考試名稱}") #考試科目:list
-            for 考試科目 in lv3_folder:
-                lv3_path = f'{lv1_folder}/{考試名稱}/{考試科目}'
-                pdf_file = classify_files(lv3_path)
-                
-                試題_path = f'{lv3_path}/{pdf_file["試題"][0]}'
-                答案_path = f'{lv3_path}/{pdf_file["答案"][0]}'
-                # 檢查是否有更正答案，有則使用"更正答案"，反之則用"答案"
-                更正答案_path = [""]
-                if pdf_file["更正答案"]!=[]:
-                    更正答案_path = f'{lv3_path}/{pdf_file["更正答案"][0]}'
-                    ans = PDFAnswerExtractor(更正答案_path).get_results()
-                else: ans = PDFAnswerExtractor(答案_path).get_results()
-                    
-                q_parser = PDFQuestionParser(試題_path)
-                q_parser.integrate_answers(ans)
-                考卷內容 = q_parser.get_questions()
-                
-                考試資料 = {
+        for 考試名稱 in sorted(list_directories(lv1_folder)):  #考試名稱:list
+            for 考試科目 in sorted(list_directories(f"{lv1_folder}/{考試名稱}")):  #考試科目:list
+                units.append((考試年份, 考試名稱, 考試科目))
+    return units
+
+
+def unit_path(unit):
+    考試年份, 考試名稱, 考試科目 = unit
+    return f'./考選部考古題pdf/{考試年份}年考選部考古題/{考試名稱}/{考試科目}'
+
+
+def run_unit(unit, cache_dir=None, backends=DEFAULT_BACKENDS, spool_dir=None):
+    """
+    在 worker 中解析一個工作單元，錯誤以字串回傳而不拋出，避免單一科目失敗中斷整批
+        提供 spool_dir 時考卷內容逐題寫入其中的 SubjectSpool 並回傳 SubjectSpool，否則回傳 list
+    """
+    try:
+        with METRICS.timer('subject', label='/'.join(map(str, unit))):
+            questions = iter_subject_questions(unit_path(unit), get_cache(cache_dir), backends)
+            考卷內容 = list(questions) if spool_dir is None else SubjectSpool.write(spool_dir, questions)
+        METRICS.count('subjects')
+        return 考卷內容, None
+    except Exception as e:
+        METRICS.count('subjects.failed')
+        return None, f"{type(e).__name__}: {e}"
+
+
+def run_unit_in_worker(unit, cache_dir=None, backends=DEFAULT_BACKENDS, spool_dir=None):
+    """
+    在 process pool 中執行 run_unit，並附上此工作單元的 metrics 由主 process 合併
+    """
+    METRICS.reset()
+    return (*run_unit(unit, cache_dir, backends, spool_dir), METRICS.snapshot())
+
+
+def iter_unit_results(units, indices, workers, cache_dir=None, backends=DEFAULT_BACKENDS, spool_dir=None):
+    """
+    解析 units 中指定索引的工作單元，依完成順序產生 (工作單元索引, 考卷內容, 錯誤)，workers <= 1 時不建立 process pool
+    """
+    if workers <= 1:
+        for index in indices:
+            yield (index, *run_unit(units[index], cache_dir, backends, spool_dir))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_unit_in_worker, units[index], cache_dir, backends, spool_dir): index
+                   for index in indices}
+        for future in as_completed(futures):
+            考卷內容, error, snapshot = future.result()
+            METRICS.merge(snapshot)
+            yield futures[future], 考卷內容, error
+
+
+def load_year(考試年份, output):
+    try:
+        return list(iter_subjects(output.path(考試年份)))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+class YearOutput:
+    """
+    依工作單元順序逐科目寫出一個年份的輸出，先完成但順序在後的科目會暫存 (SubjectSpool 只保留路徑) 到前面的科目完成為止
+    所有科目都寫出後，一併儲存該年份的輸入指紋 (解析失敗的科目不記錄，下次會重新解析)
+    """
+    def __init__(self, 考試年份, indices, units, fingerprints, output):
+        self.考試年份 = 考試年份
+        self.indices = indices
+        self.units = units
+        self.fingerprints = fingerprints
+        self.position = 0
+        self.finished = {}
+        self.state = {}
+        self.writer = CorpusWriter(output.path(考試年份), output.granularity, output.compact)
+        self.flush()
+
+    def add(self, index, 考卷內容):
+        """考卷內容為 list 或 SubjectSpool (寫出後 release)，None 表示該科目解析失敗"""
+        self.finished[index] = 考卷內容
+        self.flush()
+
+    def flush(self):
+        while self.position < len(self.indices) and self.indices[self.position] in self.finished:
+            index = self.indices[self.position]
+            考卷內容 = self.finished.pop(index)
+            if 考卷內容 is not None:
+                考試年份, 考試名稱, 考試科目 = self.units[index]
+                self.writer.write_questions({
                     "考試年份":考試年份,
                     "考試名稱":考試名稱,
                     "考試科目":考試科目,
-                    "考卷內容":考卷內容
-                }
-                
-                data.append(考試資料)
-
-        # 存為json
-        with open(f'./考選部考古題json/{考試年份}_考古題.json', 'w', encoding='utf-8') as json_file:
-            json.dump(data, json_file, ensure_ascii=False, indent=4) 
+                }, 考卷內容)
+                if isinstance(考卷內容, SubjectSpool):
+                    考卷內容.release()
+                self.state[subject_key(考試名稱, 考試科目)] = self.fingerprints[index]
+            self.position += 1
+        if self.position == len(self.indices):
+            self.writer.close()
+            save_state(self.考試年份, self.state)
+
+
+def plan_units(exam_years, units, incremental, output):
+    """
+    計算每個工作單元的輸入指紋並與上次紀錄比對
+        incremental 時，指紋相同且既有輸出中有該科目者直接沿用，其餘才需重新解析
+    回傳 (需解析的索引, 沿用的 {索引: 考卷內容}, {索引: 指紋}, 報告)
+    報告格式為 {年份: {"rebuilt": [...], "added": [...], "removed": [...], "unchanged": 數量}}
+    """
+    states = {考試年份: load_state(考試年份) for 考試年份 in exam_years}
+    existing = {考試年份: {} for 考試年份 in exam_years}
+    if incremental:
+        for 考試年份 in exam_years:
+            for record in load_year(考試年份, output):
+                existing[考試年份][subject_key(record["考試名稱"], record["考試科目"])] = record["考卷內容"]
+    report = {考試年份: {"rebuilt": [], "added": [], "removed": [], "unchanged": 0} for 考試年份 in exam_years}
+
+    pending, reused, fingerprints = [], {}, {}
+    current_keys = {考試年份: set() for 考試年份 in exam_years}
+    for index, unit in enumerate(units):
+        考試年份, 考試名稱, 考試科目 = unit
+        key = subject_key(考試名稱, 考試科目)
+        current_keys[考試年份].add(key)
+        previous = states[考試年份].get(key)
+        fingerprints[index] = subject_fingerprint(unit_path(unit), previous)
+        if incremental and same_inputs(previous, fingerprints[index]) and key in existing[考試年份]:
+            reused[index] = existing[考試年份][key]
+            report[考試年份]["unchanged"] += 1
+        else:
+            pending.append(index)
+            report[考試年份]["rebuilt" if previous is not None else "added"].append(key)
+
+    for 考試年份 in exam_years:
+        old_keys = set(states[考試年份]) | set(existing[考試年份])
+        report[考試年份]["removed"] = sorted(old_keys - current_keys[考試年份])
+    return pending, reused, fingerprints, report
+
+
+def group_by_content(indices, fingerprints):
+    """
+    將內容相同 (content_key 相同) 的工作單元分為一組，回傳 {代表的索引: [同組的索引, ...]}
+    """
+    groups, representatives = {}, {}
+    for index in indices:
+        representative = representatives.setdefault(content_key(fingerprints[index]), index)
+        groups.setdefault(representative, []).append(index)
+    return groups
+
+
+def build_corpus(exam_years, workers, cache_dir=DEFAULT_CACHE_DIR, incremental=False, output=OutputOptions(),
+                 backends=DEFAULT_BACKENDS):
+    """
+    將所有年份的工作單元分散到 process pool 解析，每完成一個科目即依工作單元順序寫出至該年份的輸出
+        內容相同的科目 (同一份試題列在多個考試類科下) 只解析一次，結果寫入每個引用它的科目
+        cache_dir 為 None 時不使用快取
+        incremental 時只重新解析輸入有變動 (或新增) 的科目，並與既有的年份輸出合併，沒有變動的年份不重寫
+        output 決定輸出格式 (json / jsonl)、壓縮、每行為科目或題目、是否精簡
+        backends 為擷取pdf文字的引擎順序 (第一個為主要引擎)
+    回傳 ({(考試年份, 考試名稱, 考試科目): 錯誤訊息}, 報告)
+    """
+    units = collect_work_units(exam_years)
+    pending, reused, fingerprints, report = plan_units(exam_years, units, incremental, output)
+    pending_years = {units[index][0] for index in pending}
+    errors = {}
+
+    outputs = {}
+    for 考試年份 in exam_years:
+        if incremental and 考試年份 not in pending_years and not report[考試年份]["removed"]:
+            continue
+        indices = [index for index, unit in enumerate(units) if unit[0] == 考試年份]
+        outputs[考試年份] = YearOutput(考試年份, indices, units, fingerprints, output)
+        for index in indices:
+            if index in reused:
+                outputs[考試年份].add(index, reused.pop(index))
+
+    groups = group_by_content(pending, fingerprints)
+    METRICS.count('subjects.deduplicated', len(pending) - len(groups))
+    progress = tqdm(total=len(pending), desc='Parsing PDF content', unit="its")
+    # worker 將考卷內容逐題寫入暫存檔，主 process 依工作單元順序逐題讀回寫出，兩端都不保留整個科目
+    with tempfile.TemporaryDirectory(prefix='spool-') as spool_dir:
+        for representative, 考卷內容, error in iter_unit_results(units, list(groups), workers, cache_dir, backends,
+                                                              spool_dir):
+            if 考卷內容 is not None:
+                考卷內容.users = len(groups[representative])
+            for index in groups[representative]:
+                unit = units[index]
+                progress.update(1)
+                if error is not None:
+                    errors[unit] = error
+                    progress.write(f"發生錯誤: {'/'.join(map(str, unit))} {error}")
+                outputs[unit[0]].add(index, 考卷內容)
+    progress.close()
+    return errors, report
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='解析考古題pdf並輸出每年的json')
+    arg_parser.add_argument('--years', type=int, nargs='+', default=list(range(101, 113)), help='考試年份，預設101~112')
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='平行解析的 process 數，預設為CPU核心數')
+    arg_parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='pdf文字與解析結果的快取資料夾')
+    arg_parser.add_argument('--no-cache', action='store_true', help='不使用快取')
+    arg_parser.add_argument('--incremental', action='store_true', help='只重新解析輸入有變動的科目，並合併至既有的年份json')
+    arg_parser.add_argument('--format', choices=['json', 'jsonl'], default='json', help='輸出格式，jsonl 每解析完一個科目就寫出一行')
+    arg_parser.add_argument('--compression', choices=['gzip', 'zstd'], default=None, help='jsonl 的壓縮方式')
+    arg_parser.add_argument('--granularity', choices=['subject', 'question'], default='subject', help='jsonl 每行為一個科目或一題')
+    arg_parser.add_argument('--compact', action='store_true', help='輸出不縮排、不含多餘空白')
+    arg_parser.add_argument('--backend', choices=list(BACKENDS), default=DEFAULT_BACKENDS[0], help='擷取pdf文字的主要引擎')
+    arg_parser.add_argument('--fallback', choices=list(BACKENDS), nargs='*', default=list(DEFAULT_BACKENDS[1:]),
+                            help='主要引擎解析不出內容時依序改用的引擎，不指定任何引擎則不備援')
+    arg_parser.add_argument('--metrics', default=None, help='metrics json 的輸出路徑，預設為 ./metrics/parse-<時間>.json')
+    arg_parser.add_argument('--profile', default=None, metavar='年份/考試名稱/考試科目',
+                            help='只以 profiler 分析單一科目的解析 (不使用快取、不寫出輸出)')
+    arg_parser.add_argument('--profile-engine', choices=['cprofile', 'pyinstrument'], default='cprofile')
+    arg_parser.add_argument('--profile-output', default=None, help='profiler 結果檔 (.prof / .html)')
+    args = arg_parser.parse_args()
+
+    output = OutputOptions(args.format, args.compression, args.granularity, args.compact)
+    backends = (args.backend, *args.fallback)
+    if args.profile:
+        profile_call(parse_subject, unit_path(args.profile.split('/', 2)), None, backends,
+                     output=args.profile_output, engine=args.profile_engine)
+        raise SystemExit(0)
+
+    errors, report = build_corpus(args.years, args.workers, None if args.no_cache else args.cache_dir, args.incremental, output, backends)
+    for 考試年份, year_report in report.items():
+        print(f"{考試年份}: 重建 {len(year_report['rebuilt'])}、新增 {len(year_report['added'])}、"
+              f"移除 {len(year_report['removed'])}、未變動 {year_report['unchanged']}")
+        if not args.incremental:
+            continue
+        for 狀態, keys in (("重建", year_report['rebuilt']), ("新增", year_report['added']), ("移除", year_report['removed'])):
+            for key in keys:
+                print(f"  [{狀態}] {key}")
+    if errors:
+        print(f"共 {len(errors)} 個科目解析失敗：")
+        for (考試年份, 考試名稱, 考試科目), error in errors.items():
+            print(f"  {考試年份} {考試名稱} {考試科目}: {error}")
+
+    metrics_path = args.metrics or default_report_path('parse')
+    print_summary(write_report(metrics_path, stage='parse', years=args.years, workers=args.workers))
+    print(f"metrics 已寫入 {metrics_path}")
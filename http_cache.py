@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import requests
+
+from metrics import METRICS
+
+"""
+考選部查詢頁面等 HTTP 回應的磁碟快取
+    GET: 附上次回應的 ETag / Last-Modified 為 If-None-Match / If-Modified-Since，伺服器回 304 時直接使用快取內容，
+        Cache-Control: max-age 未過期時不發出請求，no-store 的回應不快取
+    POST (WebForms 的 postback): 無法條件式請求，每次仍會傳輸，以內容的 sha256 判斷與上次相比是否變動
+快取鍵為 (method, url, 表單欄位) 的 sha256，表單中每次回應都會改變的欄位 (例如 __VIEWSTATE) 不列入
+每個項目存成 <cache_dir>/<鍵前2碼>/<鍵>.json (標頭等資訊) 與 <鍵>.body (內容)
+"""
+
+DEFAULT_HTTP_CACHE_DIR = './.http_cache'
+
+FormData = Sequence[Tuple[str, str]]
+# fetch(url, headers=..., data=...)，data 為 None 時為 GET，否則為 POST
+Fetch = Callable[..., requests.Response]
+
+
+@dataclass
+class CachedResponse:
+    """
+    status 為 "fresh" (未發出請求)、"not_modified" (304)、"unchanged" (內容與上次相同)、"changed"、"new"
+    """
+    url: str
+    body: bytes
+    status: str
+
+    @property
+    def changed(self) -> bool:
+        return self.status in ("changed", "new")
+
+
+def max_age(cache_control: Optional[str]) -> Optional[int]:
+    for directive in (cache_control or '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name.lower() == 'max-age' and value.strip().isdigit():
+            return int(value)
+    return None
+
+
+class HTTPCache:
+    def __init__(self, cache_dir: str = DEFAULT_HTTP_CACHE_DIR, ignored_fields: Sequence[str] = ()):
+        self.cache_dir = cache_dir
+        self.ignored_fields = frozenset(ignored_fields)
+
+    def key(self, method: str, url: str, data: Optional[FormData] = None) -> str:
+        fields = sorted((name, value) for name, value in (data or ()) if name not in self.ignored_fields)
+        return hashlib.sha256(json.dumps([method, url, fields], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return f'{base}.json', f'{base}.body'
+
+    def get(self, key: str) -> Optional[Tuple[Dict, bytes]]:
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if hashlib.sha256(body).hexdigest() != meta.get('sha256'):
+            # 內容與標頭不一致 (例如寫入到一半中斷)，視為沒有快取
+            return None
+        return meta, body
+
+    def put(self, key: str, meta: Dict, body: bytes) -> None:
+        meta_path, body_path = self._paths(key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        suffix = f'{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(f'{body_path}.{suffix}', 'wb') as f:
+            f.write(body)
+        with open(f'{meta_path}.{suffix}', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        # 先換內容再換標頭，讀取時以 sha256 檢查兩者一致
+        os.replace(f'{body_path}.{suffix}', body_path)
+        os.replace(f'{meta_path}.{suffix}', meta_path)
+
+    def request(self, fetch: Fetch, url: str, data: Optional[FormData] = None) -> CachedResponse:
+        """
+        以 fetch 取得 url (data 不為 None 時為 POST)，回傳內容與快取狀態，非 200 / 304 的回應拋出 requests.HTTPError
+        """
+        method = 'GET' if data is None else 'POST'
+        key = self.key(method, url, data)
+        cached = self.get(key)
+        meta, body = cached if cached else ({}, b'')
+
+        headers = {}
+        if method == 'GET' and cached:
+            if meta.get('expires_at') and time.time() < meta['expires_at']:
+                METRICS.count('http_cache.fresh')
+                METRICS.count('http_cache.bytes_saved', len(body))
+                return CachedResponse(url, body, "fresh")
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        with fetch(url, headers=headers, data=list(data) if data is not None else None) as response:
+            if response.status_code == 304 and cached:
+                METRICS.count('http_cache.not_modified')
+                METRICS.count('http_cache.bytes_saved', len(body))
+                self._refresh(key, meta, response)
+                return CachedResponse(url, body, "not_modified")
+            response.raise_for_status()
+            new_body = response.content
+            METRICS.count('http_cache.bytes', len(new_body))
+            sha256 = hashlib.sha256(new_body).hexdigest()
+            status = "new" if not cached else ("unchanged" if sha256 == meta.get('sha256') else "changed")
+            METRICS.count(f'http_cache.{status}')
+            if 'no-store' not in response.headers.get('Cache-Control', '').lower():
+                self.put(key, self._meta(url, method, sha256, response), new_body)
+            return CachedResponse(url, new_body, status)
+
+    def _meta(self, url: str, method: str, sha256: str, response: requests.Response) -> Dict:
+        age = max_age(response.headers.get('Cache-Control'))
+        return {
+            "url": url,
+            "method": method,
+            "sha256": sha256,
+            "etag": response.headers.get('ETag'),
+            "last_modified": response.headers.get('Last-Modified'),
+            "fetched_at": time.time(),
+            "expires_at": time.time() + age if age else None,
+        }
+
+    def _refresh(self, key: str, meta: Dict, response: requests.Response) -> None:
+        """304 回應可能帶有新的驗證碼或 max-age，更新標頭 (內容不變)"""
+        meta = dict(meta, fetched_at=time.time())
+        for field, header in (("etag", 'ETag'), ("last_modified", 'Last-Modified')):
+            if response.headers.get(header):
+                meta[field] = response.headers[header]
+        age = max_age(response.headers.get('Cache-Control'))
+        meta["expires_at"] = time.time() + age if age else None
+        meta_path, _ = self._paths(key)
+        tmp_path = f'{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+
@@ -1,11 +1,23 @@
+import argparse
 import configparser
+import io
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from sqlalchemy import UniqueConstraint, inspect
 from sqlmodel import SQLModel, Field, Session, create_engine, text
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from tqdm import tqdm
+from corpus_io import find_year_files, iter_questions
+from metrics import METRICS, default_report_path, write_report
+from search_index import SearchIndex
 
 # 定義數據模型
 class ExamQuestion(SQLModel, table=True):
+    # 自然鍵 (年份、考試名稱、科目、題號)，重複載入時以 ON CONFLICT 更新而不是重複新增
+    __table_args__ = (
+        UniqueConstraint("exam_year", "exam_name", "exam_subject", "question_number", name="uq_examquestion_natural_key"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     exam_year: int = Field(alias="考試年份")
     exam_name: str = Field(alias="考試名稱")
@@ -18,56 +30,304 @@ class ExamQuestion(SQLModel, table=True):
     option_d: str = Field(alias="D")
     question_group: Optional[str] = Field(default=None, alias="題組")  # 將題組設為可選的字符串類型
     flag: str
-    answer: str 
-
-# 讀取配置檔案中的資料庫 URL
-config = configparser.ConfigParser()
-config.read('config.conf')
-DATABASE_URL = config['database']['url']
-engine = create_engine(DATABASE_URL)
-
-# 建立資料庫表格
-SQLModel.metadata.create_all(engine)
-
-# 讀取 JSON 檔案
-with open('./考選部考古題json/101_考古題.json', encoding='utf-8') as f:
-    data = json.load(f)
-
-# 解析 JSON 資料並插入資料庫
-with Session(engine) as db:
-    for exam in tqdm(data, desc='Building database', unit="its"):
-        exam_year = exam["考試年份"]
-        exam_name = exam["考試名稱"]
-        exam_subject = exam["考試科目"]
-        
-        for question in exam["考卷內容"]:
-            # 將題組（question_group）轉換為 JSON 字符串格式，若為空則保留 None
-            question_group = json.dumps(question["題組"]) if question["題組"] else None
-            
-            question_data = ExamQuestion(
-                exam_year=exam_year,
-                exam_name=exam_name,
-                exam_subject=exam_subject,
-                question_number=question["題號"],
-                question_text=question["題目"],
-                option_a=question["A"],
-                option_b=question["B"],
-                option_c=question["C"],
-                option_d=question["D"],
-                question_group=question_group,
-                flag=question["flag"],
-                answer=question["答案"]
-            )
-            db.add(question_data)
-    
-    db.commit()  # 提交事務以插入資料
-
-# 驗證插入是否成功的範例查詢
-# with Session(engine) as db:
-#     result = db.exec(text("SELECT * FROM examquestion"))
-#     for row in result:
-#         print(row)
-
-with Session(engine) as db:
-    db_name = db.exec(text("SELECT current_database();")).one()
-    print("Connected to database:", db_name)
+    answer: Optional[str] = None  # 答案pdf中缺少的題號沒有答案
+
+
+# 載入版本，每次載入的交易提交前加一，讀取端 (quiz_service) 據此得知資料已變動
+class LoadState(SQLModel, table=True):
+    id: int = Field(default=1, primary_key=True)
+    version: int = 0
+
+
+TABLE = ExamQuestion.__tablename__
+COLUMNS = [
+    "exam_year", "exam_name", "exam_subject", "question_number", "question_text",
+    "option_a", "option_b", "option_c", "option_d", "question_group", "flag", "answer",
+]
+KEY_COLUMNS = ["exam_year", "exam_name", "exam_subject", "question_number"]
+# 大量載入後才建立的查詢用索引 (名稱, 欄位)
+SECONDARY_INDEXES = [
+    ("ix_examquestion_subject_year_flag", "exam_subject, exam_year, flag"),
+    ("ix_examquestion_exam_name", "exam_name"),
+]
+# PostgreSQL 的 pg_trgm GIN 索引 (名稱, 運算式)，供 LIKE / ILIKE '%關鍵字%' 與相似度查詢使用
+# 中文需資料庫的 LC_CTYPE 為 UTF-8 locale 才會被 pg_trgm 視為文字，且關鍵字至少 3 個字才能用到索引
+# 查詢選項時需使用與索引相同的運算式 (option_a || ' ' || ... || option_d)
+TRGM_INDEXES = [
+    ("ix_examquestion_question_text_trgm", "question_text gin_trgm_ops"),
+    ("ix_examquestion_options_trgm",
+     "(option_a || ' ' || option_b || ' ' || option_c || ' ' || option_d) gin_trgm_ops"),
+]
+
+
+def get_engine(config_path: str = 'config.conf'):
+    # 讀取配置檔案中的資料庫 URL
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    return create_engine(config['database']['url'])
+
+
+def question_row(exam_year: int, exam_name: str, exam_subject: str, question: Dict) -> Tuple:
+    # 將題組（question_group）轉換為 JSON 字符串格式，若為空則保留 None
+    question_group = json.dumps(question["題組"]) if question["題組"] else None
+    return (
+        exam_year, exam_name, exam_subject, question["題號"], question["題目"],
+        question["A"], question["B"], question["C"], question["D"],
+        question_group, question["flag"], question["答案"],
+    )
+
+
+def iter_batches(rows: Iterable[Tuple], batch_size: int) -> Iterator[List[Tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# 在交易最後才執行，平行載入時只在提交前短暫鎖住這一列
+BUMP_VERSION_SQL = (
+    f"INSERT INTO {LoadState.__tablename__} (id, version) VALUES (1, 1) "
+    f"ON CONFLICT (id) DO UPDATE SET version = {LoadState.__tablename__}.version + 1"
+)
+
+
+def upsert_sql(source: str) -> str:
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in COLUMNS if column not in KEY_COLUMNS)
+    return (
+        f"INSERT INTO {TABLE} ({', '.join(COLUMNS)}) {source} "
+        f"ON CONFLICT ({', '.join(KEY_COLUMNS)}) DO UPDATE SET {updates}"
+    )
+
+
+def ensure_schema(engine, dedupe: bool = False) -> None:
+    """
+    建立資料表，並確保自然鍵的唯一索引存在、answer 可為 NULL
+    舊版載入程式建立的資料表沒有唯一索引且可能有重複資料，有重複時需指定 dedupe 才會刪除重複 (保留 id 最小者)
+    後再建立索引，否則拋出 ValueError
+    """
+    SQLModel.metadata.create_all(engine)
+    inspector = inspect(engine)
+    existing = {constraint['name'] for constraint in inspector.get_unique_constraints(TABLE)}
+    existing |= {index['name'] for index in inspector.get_indexes(TABLE) if index.get('unique')}
+    if "uq_examquestion_natural_key" not in existing:
+        key = ", ".join(KEY_COLUMNS)
+        duplicates = f"FROM {TABLE} WHERE id NOT IN (SELECT MIN(id) FROM {TABLE} GROUP BY {key})"
+        with engine.begin() as conn:
+            count = conn.execute(text(f"SELECT COUNT(*) {duplicates}")).scalar()
+            if count and not dedupe:
+                raise ValueError(f"資料表 {TABLE} 有 {count} 筆重複的題目 ({key} 相同)，無法建立唯一索引；"
+                                 f"確認後以 --dedupe 刪除重複 (保留 id 最小者)")
+            if count:
+                print(f"刪除資料表 {TABLE} 中 {count} 筆重複的題目 (保留 id 最小者)")
+                conn.execute(text(f"DELETE {duplicates}"))
+            conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_examquestion_natural_key ON {TABLE} ({key})"))
+    ensure_nullable_answer(engine)
+
+
+def ensure_nullable_answer(engine) -> None:
+    """
+    舊版的資料表 answer 為 NOT NULL，create_all 不會修改既有的資料表，缺少答案的題目會載入失敗，改為可為 NULL
+    SQLite 不支援修改欄位限制，改以目前的定義重建資料表 (保留 id，刪除的查詢用索引在 create_secondary_indexes 時重建)
+    """
+    answer = next(column for column in inspect(engine).get_columns(TABLE) if column['name'] == 'answer')
+    if answer['nullable']:
+        return
+    if engine.dialect.name != 'sqlite':
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {TABLE} ALTER COLUMN answer DROP NOT NULL"))
+        return
+    indexes = [index['name'] for index in inspect(engine).get_indexes(TABLE)]
+    columns = ', '.join(['id'] + COLUMNS)
+    with engine.begin() as conn:
+        for name in indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_old"))
+        ExamQuestion.__table__.create(conn)
+        conn.execute(text(f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {TABLE}_old"))
+        conn.execute(text(f"DROP TABLE {TABLE}_old"))
+
+
+def drop_secondary_indexes(engine) -> None:
+    names = [name for name, _ in SECONDARY_INDEXES]
+    if engine.dialect.name == 'postgresql':
+        names += [name for name, _ in TRGM_INDEXES]
+    with engine.begin() as conn:
+        for name in names:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def create_trgm_indexes(engine) -> None:
+    """
+    建立 pg_trgm 擴充與 GIN 索引，沒有權限建立擴充時略過 (其他索引不受影響)
+    """
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as e:
+        print(f"發生錯誤: 無法建立 pg_trgm 擴充，略過全文檢索索引 {e}")
+        return
+    with engine.begin() as conn:
+        for name, expression in TRGM_INDEXES:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {TABLE} USING gin ({expression})"))
+
+
+def create_secondary_indexes(engine) -> None:
+    with engine.begin() as conn:
+        for name, columns in SECONDARY_INDEXES:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {TABLE} ({columns})"))
+    if engine.dialect.name == 'postgresql':
+        create_trgm_indexes(engine)
+
+
+def _copy_value(value) -> str:
+    # COPY text 格式：NULL 為 \N，並跳脫反斜線、tab、換行
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _copy_batch(cursor, batch: List[Tuple]) -> None:
+    copy_sql = f"COPY {TABLE}_staging ({', '.join(COLUMNS)}) FROM STDIN"
+    if hasattr(cursor, 'copy_expert'):  # psycopg2
+        buffer = io.StringIO()
+        for row in batch:
+            buffer.write('\t'.join(_copy_value(value) for value in row) + '\n')
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+    else:  # psycopg 3
+        with cursor.copy(copy_sql) as copy:
+            for row in batch:
+                copy.write_row(row)
+
+
+def _load_postgresql(engine, rows: Iterable[Tuple], batch_size: int) -> int:
+    """
+    以 COPY 寫入暫存表，再從暫存表 upsert 至正式表 (同一批中重複的自然鍵只保留最後一筆)
+    """
+    key = ", ".join(KEY_COLUMNS)
+    conn = engine.raw_connection()
+    count = 0
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"CREATE TEMP TABLE {TABLE}_staging ON COMMIT DROP AS "
+            f"SELECT {', '.join(COLUMNS)} FROM {TABLE} WITH NO DATA"
+        )
+        cursor.execute(f"ALTER TABLE {TABLE}_staging ADD COLUMN seq BIGSERIAL")
+        for batch in iter_batches(rows, batch_size):
+            with METRICS.timer('db.copy'):
+                _copy_batch(cursor, batch)
+            with METRICS.timer('db.upsert'):
+                cursor.execute(upsert_sql(
+                    f"SELECT DISTINCT ON ({key}) {', '.join(COLUMNS)} FROM {TABLE}_staging ORDER BY {key}, seq DESC"
+                ))
+                cursor.execute(f"TRUNCATE {TABLE}_staging")
+            count += len(batch)
+        cursor.execute(BUMP_VERSION_SQL)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return count
+
+
+def _load_executemany(engine, rows: Iterable[Tuple], batch_size: int) -> int:
+    """
+    非 PostgreSQL (例如 SQLite) 時以 executemany 分批 upsert
+    """
+    statement = text(upsert_sql(f"VALUES ({', '.join(':' + column for column in COLUMNS)})"))
+    count = 0
+    with engine.begin() as conn:
+        for batch in iter_batches(rows, batch_size):
+            with METRICS.timer('db.upsert'):
+                conn.execute(statement, [dict(zip(COLUMNS, row)) for row in batch])
+            count += len(batch)
+        conn.execute(text(BUMP_VERSION_SQL))
+    return count
+
+
+def load_rows(engine, rows: Iterable[Tuple], batch_size: int = 5000) -> int:
+    """
+    將 question_row() 產生的資料列分批 upsert 至資料庫，全部為一個交易，回傳處理的題數
+    """
+    if engine.dialect.name == 'postgresql':
+        count = _load_postgresql(engine, rows, batch_size)
+    else:
+        count = _load_executemany(engine, rows, batch_size)
+    METRICS.count('db.rows', count)
+    return count
+
+
+def load_file(engine, path: str, batch_size: int = 5000) -> int:
+    """
+    將一個年份的輸出檔 (json / jsonl) 分批 upsert 至資料庫，整個檔案為一個交易，回傳處理的題數
+    """
+    rows = (question_row(*item) for item in iter_questions(path))
+    with METRICS.timer('db.load_file', label=path):
+        return load_rows(engine, rows, batch_size)
+
+
+def bulk_load(engine, paths: List[str], workers: int = 4, batch_size: int = 5000, dedupe: bool = False) -> int:
+    """
+    各年份檔案平行載入 (每個 worker 各自一條連線，同時只保留一批資料在記憶體中)，
+    載入前移除查詢用索引，全部載入後再建立
+    dedupe 見 ensure_schema
+    """
+    ensure_schema(engine, dedupe)
+    with METRICS.timer('db.drop_indexes'):
+        drop_secondary_indexes(engine)
+    total = 0
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {executor.submit(load_file, engine, path, batch_size): path for path in paths}
+            for future in tqdm(as_completed(futures), total=len(futures), desc='Building database', unit="files"):
+                total += future.result()
+    finally:
+        with METRICS.timer('db.create_indexes'):
+            create_secondary_indexes(engine)
+    elapsed = time.perf_counter() - start
+    print(f"共載入 {total} 題，{elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} rows/s)")
+    return total
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='將考古題json / jsonl 大量載入資料庫')
+    arg_parser.add_argument('paths', nargs='*', help='要載入的檔案，預設為 ./考選部考古題json 中所有年份')
+    arg_parser.add_argument('--years', type=int, nargs='+', default=None, help='只載入指定年份')
+    arg_parser.add_argument('--workers', type=int, default=4, help='平行載入的年份數')
+    arg_parser.add_argument('--batch-size', type=int, default=5000)
+    arg_parser.add_argument('--config', default='config.conf')
+    arg_parser.add_argument('--metrics', default=None, help='metrics json 的輸出路徑，預設為 ./metrics/load-<時間>.json')
+    arg_parser.add_argument('--no-search-index', action='store_true', help='不更新全文檢索索引 (search_index.py)')
+    arg_parser.add_argument('--dedupe', action='store_true', help='舊版資料表有重複的題目時刪除重複 (保留 id 最小者)')
+    args = arg_parser.parse_args()
+
+    engine = get_engine(args.config)
+    paths = args.paths or list(find_year_files(args.years).values())
+    # SQLite 不支援多條連線同時寫入
+    workers = args.workers if engine.dialect.name == 'postgresql' else 1
+    bulk_load(engine, paths, workers, args.batch_size, args.dedupe)
+    if args.paths and not args.no_search_index:
+        # 索引依年份讀取 ./考選部考古題json 中的輸出檔，與指定的檔案不一定相同，不更新
+        print("指定檔案載入時不更新全文檢索索引，需要時請執行 python search_index.py")
+    elif not args.no_search_index:
+        SearchIndex().update(args.years)
+    write_report(args.metrics or default_report_path('load'), stage='load', files=paths, workers=workers)
+
+    # 驗證插入是否成功的範例查詢
+    # with Session(engine) as db:
+    #     result = db.exec(text("SELECT * FROM examquestion"))
+    #     for row in result:
+    #         print(row)
+
+    if engine.dialect.name == 'postgresql':
+        with Session(engine) as db:
+            db_name = db.exec(text("SELECT current_database();")).one()
+            print("Connected to database:", db_name)
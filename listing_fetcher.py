@@ -0,0 +1,168 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+from lxml import etree, html
+from tqdm import tqdm
+
+from downloader import PDFDownloader
+from http_cache import DEFAULT_HTTP_CACHE_DIR, CachedResponse, HTTPCache
+from listing_parser import BASE_URL, TABLE_ID
+from metrics import METRICS
+
+"""
+自動取得每年的考選部查詢頁面 (ASP.NET WebForms)，存至 ./考選部html/<n>年考選部考古題.html，取代手動下載
+    1. GET 查詢頁面取得表單，以 HTTPCache 條件式請求，頁面未變動時伺服器回 304
+       查詢頁面回 304 且年份已有查詢結果檔時，不再送出該年份的 postback (postback 無法條件式請求，每次都會完整傳輸)，
+       因此每晚重新執行時網站未更新的話只有一個 304；網站更新查詢結果但查詢頁面的 ETag / Last-Modified 不變時無法察覺，
+       可定期以 revalidate=True (--revalidate) 強制重新查詢所有年份
+    2. 每個年份以各自的 session (各自的 cookie 與 __VIEWSTATE) 同時進行：選擇年份的 postback → 按下查詢
+    3. 只保留查詢結果中的考試資料表 (頁面其餘部分含每次都不同的 __VIEWSTATE)，
+       與既有檔案相同時不改寫，保留 mtime 供下游判斷是否變動
+表單欄位名稱依考選部網站設定，網站改版時只需調整下列常數
+"""
+
+SEARCH_URL = f'{BASE_URL}wFrmExamQandASearch.aspx'
+YEAR_FIELD = 'ctl00$holderContent$ddlExamYear'
+SEARCH_BUTTON = ('ctl00$holderContent$btnSearch', '查詢')
+# WebForms 每次回應都會改變的隱藏欄位，不列入快取鍵
+STATE_FIELDS = ('__VIEWSTATE', '__VIEWSTATEGENERATOR', '__EVENTVALIDATION', '__PREVIOUSPAGE')
+HTML_DIR = './考選部html'
+
+FormFields = List[Tuple[str, str]]
+
+
+def listing_path(考試年份, html_dir: str = HTML_DIR) -> str:
+    return os.path.join(html_dir, f'{考試年份}年考選部考古題.html')
+
+
+def form_fields(page: bytes) -> FormFields:
+    """
+    取出頁面第一個表單送出時的欄位 (隱藏欄位、下拉選單的選取值等，不含按鈕)，同瀏覽器送出表單的內容
+    """
+    forms = html.fromstring(page).forms
+    if not forms:
+        raise ValueError("頁面中沒有表單")
+    return list(forms[0].form_values())
+
+
+def year_options(page: bytes) -> List[str]:
+    """年份下拉選單的選項 (不含 "請選擇" 等空值)"""
+    select = html.fromstring(page).forms[0].inputs[YEAR_FIELD]
+    return [value for value in select.value_options if value]
+
+
+def with_fields(fields: FormFields, **overrides: str) -> FormFields:
+    """以 overrides 取代同名欄位的值，沒有的欄位附加在最後"""
+    result = [(name, overrides.pop(name) if name in overrides else value) for name, value in fields]
+    return result + list(overrides.items())
+
+
+def extract_listing(page: bytes) -> bytes:
+    """
+    取出查詢結果中的考試資料表，包成 listing_parser 可解析的html，沒有資料表時拋出 ValueError
+    """
+    try:
+        table = html.fromstring(page).get_element_by_id(TABLE_ID)
+    except KeyError:
+        raise ValueError("查詢結果中沒有考試資料表")
+    return (b'<html><head><meta charset="utf-8"></head><body>'
+            + etree.tostring(table, encoding='utf-8', method='html')
+            + b'</body></html>')
+
+
+def write_if_changed(path: str, body: bytes) -> str:
+    """
+    內容與既有檔案相同時不改寫，回傳 "unchanged"、"updated" 或 "new"
+    """
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            if f.read() == body:
+                return "unchanged"
+        status = "updated"
+    else:
+        status = "new"
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+    return status
+
+
+class ListingFetcher:
+    """
+    downloader: 共用其重試、限速與每個 host 的連線數上限
+    cache: 查詢頁面與查詢結果的 HTTP 快取
+    max_workers: 同時查詢的年份數
+    """
+
+    def __init__(self, downloader: PDFDownloader, cache: Optional[HTTPCache] = None, html_dir: str = HTML_DIR,
+                 max_workers: int = 4, search_url: str = SEARCH_URL):
+        self.downloader = downloader
+        self.cache = cache or HTTPCache(DEFAULT_HTTP_CACHE_DIR, ignored_fields=STATE_FIELDS)
+        self.html_dir = html_dir
+        self.max_workers = max_workers
+        self.search_url = search_url
+
+    def fetch_form(self) -> CachedResponse:
+        return self.cache.request(self.downloader.fetch, self.search_url)
+
+    def fetch_year(self, 考試年份, form_page: bytes) -> str:
+        """
+        以 form_page 的表單查詢一個年份並寫入 listing_path，回傳 write_if_changed 的狀態
+        """
+        year = str(考試年份)
+        if year not in year_options(form_page):
+            raise ValueError(f"查詢頁面沒有 {year} 年的選項")
+
+        with requests.Session() as session, METRICS.timer('listing.fetch', label=year):
+            def fetch(url, headers=None, data=None):
+                return self.downloader.fetch(url, headers=headers, data=data, session=session)
+
+            # 選擇年份會觸發 postback，更新其他下拉選單與 __VIEWSTATE / __EVENTVALIDATION
+            fields = with_fields(form_fields(form_page), **{'__EVENTTARGET': YEAR_FIELD, '__EVENTARGUMENT': '',
+                                                            YEAR_FIELD: year})
+            with fetch(self.search_url, data=fields) as response:
+                response.raise_for_status()
+                year_page = response.content
+
+            button, label = SEARCH_BUTTON
+            fields = with_fields(form_fields(year_page), **{'__EVENTTARGET': '', '__EVENTARGUMENT': '',
+                                                            YEAR_FIELD: year, button: label})
+            result = self.cache.request(fetch, self.search_url, fields)
+
+        return write_if_changed(listing_path(year, self.html_dir), extract_listing(result.body))
+
+    def fetch_all(self, years: Optional[Iterable] = None, revalidate: bool = False) -> Dict[str, str]:
+        """
+        同時查詢多個年份 (None 為查詢頁面中所有年份)，單一年份失敗不影響其他年份
+        查詢頁面回 304 (或快取未過期) 時略過已有查詢結果檔的年份 (狀態為 "unchanged")，revalidate 為 True 時仍重新查詢
+        回傳 {年份: 狀態}，失敗時為 "error: <訊息>"
+        """
+        with METRICS.timer('listing.fetch_form'):
+            form = self.fetch_form()
+        form_page = form.body
+        years = [str(考試年份) for 考試年份 in years] if years is not None else year_options(form_page)
+
+        results: Dict[str, str] = {}
+        # 只有伺服器確認查詢頁面未變動 (304 或 max-age 未過期) 時才略過；回 200 時即使內容相同，也可能是驗證碼改變
+        if form.status in ("fresh", "not_modified") and not revalidate:
+            for year in years:
+                if os.path.exists(listing_path(year, self.html_dir)):
+                    results[year] = "unchanged"
+                    METRICS.count('listing.skipped')
+            years = [year for year in years if year not in results]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.fetch_year, year, form_page): year for year in years}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Fetching listings", unit="years"):
+                year = futures[future]
+                try:
+                    results[year] = future.result()
+                except Exception as e:
+                    print(f"發生錯誤: {year} {e}")
+                    results[year] = f"error: {e}"
+                METRICS.count(f"listing.{results[year].split(':')[0]}")
+        return results
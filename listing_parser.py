@@ -0,0 +1,120 @@
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Pattern, Union
+
+from lxml import html
+
+"""
+解析考選部考古題查詢頁面 (table#ctl00_holderContent_tblExamQand)
+    以 lxml 解析後只走訪目標 table 內的 td 一次，並在走訪過程中記錄目前的 level2 考試名稱，
+    取代原本 BeautifulSoup 對每個 td 呼叫 find_previous('td', class_='level2') 的回溯搜尋
+"""
+
+TABLE_ID = 'ctl00_holderContent_tblExamQand'
+BASE_URL = 'https://wwwq.moex.gov.tw/exam/'
+
+SubjectFilter = Union[None, str, Iterable[str], Pattern, Callable[[str], bool]]
+
+
+@dataclass
+class ExamListing:
+    exam_name: str              # 考試名稱
+    subject: str                # 科目
+    question_url: str = ""      # 試題連結
+    answer_url: str = ""        # 答案連結
+    corrected_answer_url: str = ""  # 更正答案連結
+
+    def to_dict(self) -> Dict[str, str]:
+        return {
+            "考試名稱": self.exam_name,
+            "科目": self.subject,
+            "試題連結": self.question_url,
+            "答案連結": self.answer_url,
+            "更正答案連結": self.corrected_answer_url,
+        }
+
+
+def href_converter(href_string: str) -> str:
+    return f'{BASE_URL}{href_string.replace("amp;", "")}'
+
+
+def make_subject_filter(subject_filter: SubjectFilter) -> Callable[[str], bool]:
+    """
+    將科目篩選條件轉為函式
+        None: 不篩選
+        str: 科目名稱包含該字串，例如 "法"
+        list/tuple/set of str: 科目名稱包含其中任一字串
+        re.Pattern: 科目名稱符合該正則表達式 (search)
+        callable: 直接使用
+    """
+    if subject_filter is None:
+        return lambda subject: True
+    if isinstance(subject_filter, str):
+        return lambda subject: subject_filter in subject
+    if isinstance(subject_filter, re.Pattern):
+        return lambda subject: subject_filter.search(subject) is not None
+    if callable(subject_filter):
+        return subject_filter
+    keywords = list(subject_filter)
+    return lambda subject: any(keyword in subject for keyword in keywords)
+
+
+def _has_class(element, class_name: str) -> bool:
+    return class_name in element.get('class', '').split()
+
+
+def _find_label(td, class_name: Optional[str] = None):
+    for label in td.iter('label'):
+        if class_name is None or _has_class(label, class_name):
+            return label
+    return None
+
+
+def parse_listing_html(html_content: str, subject_filter: SubjectFilter = '法') -> List[ExamListing]:
+    """
+    解析查詢頁面，回傳符合科目篩選條件、且有答案或更正答案的 ExamListing
+        只採用內含 <table> 的 td (否則會因mobile版資料而重複同一筆)
+    """
+    match_subject = make_subject_filter(subject_filter)
+    root = html.fromstring(html_content)
+    try:
+        table = root.get_element_by_id(TABLE_ID)
+    except KeyError:
+        return []
+
+    result = []
+    exam_name = ""
+    for td in table.iter('td'):
+        if _has_class(td, 'level2'):
+            level2_label = _find_label(td)
+            if level2_label is not None:
+                exam_name = level2_label.text_content().strip()
+            continue
+
+        label = _find_label(td, 'exam-title')
+        if label is None or not match_subject(label.text_content()):
+            continue
+        links = list(td.iter('a'))
+        if not any(link.text_content() in ("答案", "更正答案") for link in links):
+            continue
+        if next(td.iter('table'), None) is None:
+            continue
+
+        record = ExamListing(exam_name=exam_name, subject=label.text_content().strip())
+        for link in links:
+            if not _has_class(link, 'exam-question-ans'):
+                continue
+            text = link.text_content()
+            if text == "試題":
+                record.question_url = href_converter(link.get('href'))
+            elif text == "答案":
+                record.answer_url = href_converter(link.get('href'))
+            elif text == "更正答案":
+                record.corrected_answer_url = href_converter(link.get('href'))
+        result.append(record)
+    return result
+
+
+def parse_listing_file(file_path: str, subject_filter: SubjectFilter = '法') -> List[ExamListing]:
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return parse_listing_html(file.read(), subject_filter)
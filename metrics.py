@@ -0,0 +1,192 @@
+import cProfile
+import heapq
+import io
+import json
+import os
+import platform
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+"""
+輕量的計時與計數，各模組共用同一個 METRICS
+    timer(name, label): 累計 name 的次數、總秒數、最大秒數，有 label (例如pdf路徑) 時記錄最慢的前 SLOWEST_LIMIT 個
+    count(name, amount): 累加計數 (例如 download.bytes、pdf.pages、parse.questions、db.rows)
+ProcessPoolExecutor 的 worker 以 snapshot() 回傳自己的紀錄，主 process 以 merge() 合併
+write_report() 輸出一次執行的 metrics json，並依 RATES 計算每秒處理量
+profile_call() 以 cProfile (或已安裝的 pyinstrument) 分析單一次呼叫
+"""
+
+METRICS_DIR = './metrics'
+SLOWEST_LIMIT = 20
+
+# 每秒處理量：(名稱, 計數, 計時)，以計數除以該計時的總秒數
+RATES = [
+    ("bytes_per_sec", "download.bytes", "download.file"),
+    ("pages_per_sec", "pdf.pages", "pdf.extract_text"),
+    ("questions_per_sec", "parse.questions", "parse.questions_pdf"),
+    ("answers_per_sec", "answers.matched", "answers.extract"),
+    ("subjects_per_sec", "subjects", "subject"),
+    ("rows_per_sec", "db.rows", "db.load_file"),
+]
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.timers: Dict[str, Dict[str, float]] = {}
+            self.counters: Dict[str, float] = {}
+            self.slowest: Dict[str, List[Tuple[float, str]]] = {}
+            self.started_at = time.perf_counter()
+
+    def record(self, name: str, seconds: float, label: Optional[str] = None) -> None:
+        with self.lock:
+            timer = self.timers.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            timer["count"] += 1
+            timer["total"] += seconds
+            timer["max"] = max(timer["max"], seconds)
+            if label is not None:
+                # 以 min-heap 保留最慢的前 SLOWEST_LIMIT 個
+                heap = self.slowest.setdefault(name, [])
+                if len(heap) < SLOWEST_LIMIT:
+                    heapq.heappush(heap, (seconds, label))
+                elif seconds > heap[0][0]:
+                    heapq.heapreplace(heap, (seconds, label))
+
+    @contextmanager
+    def timer(self, name: str, label: Optional[str] = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, label)
+
+    def count(self, name: str, amount: float = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "timers": {name: dict(timer) for name, timer in self.timers.items()},
+                "counters": dict(self.counters),
+                "slowest": {name: list(heap) for name, heap in self.slowest.items()},
+            }
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        with self.lock:
+            for name, other in snapshot["timers"].items():
+                timer = self.timers.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+                timer["count"] += other["count"]
+                timer["total"] += other["total"]
+                timer["max"] = max(timer["max"], other["max"])
+            for name, amount in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+            for name, entries in snapshot["slowest"].items():
+                heap = self.slowest.setdefault(name, [])
+                for entry in entries:
+                    entry = (entry[0], entry[1])
+                    if len(heap) < SLOWEST_LIMIT:
+                        heapq.heappush(heap, entry)
+                    elif entry[0] > heap[0][0]:
+                        heapq.heapreplace(heap, entry)
+
+    def rates(self) -> Dict[str, float]:
+        rates = {}
+        for name, counter, timer in RATES:
+            if counter in self.counters and self.timers.get(timer, {}).get("total"):
+                rates[name] = self.counters[counter] / self.timers[timer]["total"]
+        return rates
+
+    def report(self, **extra) -> Dict[str, Any]:
+        """
+        計時的總秒數為各 worker 加總 (CPU 時間的概念)，wall_seconds 為整次執行的實際時間
+        """
+        snapshot = self.snapshot()
+        return {
+            "date": datetime.now().isoformat(timespec='seconds'),
+            "command": ' '.join(sys.argv),
+            "python": platform.python_version(),
+            "wall_seconds": time.perf_counter() - self.started_at,
+            **extra,
+            "rates": self.rates(),
+            "timers": snapshot["timers"],
+            "counters": snapshot["counters"],
+            "slowest": {name: [{"seconds": seconds, "label": label} for seconds, label in sorted(entries, reverse=True)]
+                        for name, entries in snapshot["slowest"].items()},
+        }
+
+
+METRICS = Metrics()
+
+
+def default_report_path(stage: str) -> str:
+    return os.path.join(METRICS_DIR, f"{stage}-{datetime.now():%Y%m%d-%H%M%S}.json")
+
+
+def write_report(path: str, **extra) -> Dict[str, Any]:
+    report = METRICS.report(**extra)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    return report
+
+
+def print_summary(report: Dict[str, Any], top: int = 5) -> None:
+    print(f"總時間 {report['wall_seconds']:.1f}s")
+    for name, value in report["rates"].items():
+        print(f"  {name}: {value:,.1f}")
+    for name, timer in sorted(report["timers"].items(), key=lambda item: -item[1]["total"])[:top * 2]:
+        print(f"  {name}: {timer['total']:.2f}s / {timer['count']} 次 (最長 {timer['max']:.2f}s)")
+    for name, entries in report["slowest"].items():
+        print(f"  最慢的 {name}:")
+        for entry in entries[:top]:
+            print(f"    {entry['seconds']:.2f}s {entry['label']}")
+
+
+def profile_call(func: Callable, *args, output: Optional[str] = None, engine: str = 'cprofile', **kwargs):
+    """
+    分析單一次呼叫 (例如解析一個科目)，印出最耗時的函式並回傳 func 的結果
+        engine="cprofile": output 為 .prof 檔 (可用 snakeviz 等工具檢視)
+        engine="pyinstrument": 需安裝 pyinstrument，output 為 .html 檔
+    """
+    if engine == 'pyinstrument':
+        if pyinstrument is None:
+            raise ImportError("engine='pyinstrument' 需要安裝 pyinstrument 套件")
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profiler.stop()
+        if output:
+            with open(output, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+        print(profiler.output_text(unicode=True, color=False))
+        return result
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        profiler.disable()
+    if output:
+        profiler.dump_stats(output)
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(30)
+    print(stream.getvalue())
+    return result
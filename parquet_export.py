@@ -0,0 +1,303 @@
+import argparse
+import json
+import os
+import shutil
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from corpus_io import JSON_DIR, find_year_files, iter_questions
+from listing_parser import SubjectFilter, make_subject_filter
+from metrics import METRICS
+from search_index import source_stat
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.feather as feather
+    import pyarrow.fs as pafs
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+"""
+將解析輸出 (./考選部考古題json) 匯出為欄式儲存，供分析與出題程式取代重新載入縮排的年份json
+    questions/exam_year=<年份>/part-0.<副檔名>: 每題一列，欄位名稱同資料庫 (exam_year 由資料夾名稱取得)
+        exam_name / exam_subject / flag 以 dictionary 編碼，同一年份中重複的名稱只存一次
+        題組不再每題重複一份，改存 group_id，對應 groups 中同一年份的 group_id
+        同一年份內依 exam_subject、exam_name 排序，以科目篩選時可依 row group 的統計值略過不符合的部分
+    groups/exam_year=<年份>/part-0.<副檔名>: 每個年份中內容相同的題組只存一次 (group_id, start_ques, end_ques, ques_desc)
+    export.json: 格式、各年份來源輸出檔的大小與 mtime、列數，以及各年份出現過的考試名稱、科目、flag (篩選時不必掃描資料)
+file_format="parquet" 以 zstd 壓縮，檔案較小；"arrow" (Feather v2) 不壓縮，以 memory map 讀取時不需複製與解碼
+讀取一律以 memory map 開啟，read_questions() 只讀取需要的欄位，年份篩選只開啟該年份的檔案，
+名稱篩選轉為 dictionary 值的 isin 條件交由 pyarrow 在掃描時套用
+需安裝 pyarrow
+"""
+
+EXPORT_DIR = './考選部考古題parquet'
+EXPORT_VERSION = 1
+ROW_GROUP_SIZE = 8192
+FILE_FORMATS = {'parquet': 'parquet', 'arrow': 'arrow'}  # {file_format: 副檔名}
+DICTIONARY_COLUMNS = ('exam_name', 'exam_subject', 'flag')
+OPTION_COLUMNS = {'A': 'option_a', 'B': 'option_b', 'C': 'option_c', 'D': 'option_d'}
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("匯出與讀取 parquet / arrow 需要安裝 pyarrow 套件")
+
+
+def question_schema() -> 'pa.Schema':
+    """不含分割欄位 exam_year"""
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('exam_name', dictionary),
+        ('exam_subject', dictionary),
+        ('question_number', pa.int32()),
+        ('question_text', pa.string()),
+        ('option_a', pa.string()),
+        ('option_b', pa.string()),
+        ('option_c', pa.string()),
+        ('option_d', pa.string()),
+        ('group_id', pa.int32()),
+        ('flag', dictionary),
+        ('answer', pa.string()),
+    ])
+
+
+def group_schema() -> 'pa.Schema':
+    return pa.schema([
+        ('group_id', pa.int32()),
+        ('start_ques', pa.int32()),
+        ('end_ques', pa.int32()),
+        ('ques_desc', pa.string()),
+    ])
+
+
+def _partitioning() -> 'ds.Partitioning':
+    return ds.partitioning(pa.schema([('exam_year', pa.int16())]), flavor='hive')
+
+
+def build_year_tables(path: str) -> Tuple['pa.Table', 'pa.Table']:
+    """
+    讀取一個年份的輸出檔，回傳 (questions, groups) 兩個表
+    """
+    columns: Dict[str, List] = {name: [] for name in question_schema().names}
+    groups: Dict[Tuple, int] = {}
+    for _, 考試名稱, 考試科目, question in iter_questions(path):
+        題組 = question.get('題組')
+        group_id = None
+        if 題組:
+            key = (題組['start_ques'], 題組['end_ques'], 題組.get('ques_desc'))
+            group_id = groups.setdefault(key, len(groups))
+        columns['exam_name'].append(考試名稱)
+        columns['exam_subject'].append(考試科目)
+        columns['question_number'].append(question['題號'])
+        columns['question_text'].append(question.get('題目'))
+        for key, name in OPTION_COLUMNS.items():
+            columns[name].append(question.get(key))
+        columns['group_id'].append(group_id)
+        columns['flag'].append(question.get('flag'))
+        columns['answer'].append(question.get('答案'))
+
+    # dictionary 編碼的欄位無法排序，先以字串排序再轉換；排序為穩定排序，同一科目內保留原本的次序
+    questions = pa.table(columns, schema=pa.schema([(field.name, field.type.value_type if pa.types.is_dictionary(field.type)
+                                                     else field.type) for field in question_schema()]))
+    questions = questions.take(pc.sort_indices(
+        questions, sort_keys=[('exam_subject', 'ascending'), ('exam_name', 'ascending')])).cast(question_schema())
+    group_rows = sorted(groups.items(), key=lambda item: item[1])
+    group_table = pa.table({
+        'group_id': [group_id for _, group_id in group_rows],
+        'start_ques': [key[0] for key, _ in group_rows],
+        'end_ques': [key[1] for key, _ in group_rows],
+        'ques_desc': [key[2] for key, _ in group_rows],
+    }, schema=group_schema())
+    return questions, group_table
+
+
+def _dictionary_values(table: 'pa.Table', name: str) -> List[str]:
+    return sorted(value for value in table.column(name).combine_chunks().dictionary.to_pylist()
+                  if value is not None)
+
+
+def _write_table(table: 'pa.Table', path: str, file_format: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    if file_format == 'parquet':
+        pq.write_table(table, tmp_path, compression='zstd', row_group_size=ROW_GROUP_SIZE,
+                       use_dictionary=True, write_statistics=True)
+    else:
+        feather.write_feather(table, tmp_path, compression='uncompressed', chunksize=ROW_GROUP_SIZE)
+    os.replace(tmp_path, path)
+
+
+class CorpusExport:
+    """
+    export_dir 中的匯出檔，update() 只重新匯出來源輸出檔有變動的年份
+    """
+
+    def __init__(self, export_dir: str = EXPORT_DIR, json_dir: str = JSON_DIR):
+        _require_pyarrow()
+        self.export_dir = export_dir
+        self.json_dir = json_dir
+        self.manifest = self._load_manifest()
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.export_dir, 'export.json')
+
+    def _load_manifest(self) -> Dict:
+        """{"version", "format", "years": {年份: {"source", "rows", "groups", "exam_name", "exam_subject", "flag"}}}"""
+        try:
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            manifest['years'] = {int(year): entry for year, entry in manifest['years'].items()}
+            return manifest
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"version": EXPORT_VERSION, "format": None, "years": {}}
+
+    def _save_manifest(self) -> None:
+        os.makedirs(self.export_dir, exist_ok=True)
+        manifest = {**self.manifest, "years": {str(year): entry for year, entry in sorted(self.manifest['years'].items())}}
+        tmp_path = f'{self._manifest_path()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self._manifest_path())
+
+    @property
+    def file_format(self) -> Optional[str]:
+        return self.manifest['format']
+
+    def years(self) -> List[int]:
+        return sorted(self.manifest['years'])
+
+    def table_path(self, table: str, year: int) -> str:
+        return os.path.join(self.export_dir, table, f'exam_year={year}', f'part-0.{FILE_FORMATS[self.file_format]}')
+
+    def _remove_year(self, year: int) -> None:
+        for table in ('questions', 'groups'):
+            shutil.rmtree(os.path.dirname(self.table_path(table, year)), ignore_errors=True)
+        self.manifest['years'].pop(year, None)
+
+    def update(self, years: Optional[Iterable[int]] = None, file_format: Optional[str] = None,
+               prune: bool = False) -> Dict[int, str]:
+        """
+        回傳 {年份: "exported" | "unchanged" | "removed"}
+            file_format: "parquet" 或 "arrow"，與既有匯出不同時重新匯出所有年份 (None 為沿用既有格式，預設 parquet)
+            prune: 刪除輸出檔已不存在的年份 (只在 years 為 None 時)
+        """
+        file_format = file_format or self.file_format or 'parquet'
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f"不支援的格式: {file_format}")
+        if self.manifest['version'] != EXPORT_VERSION or self.file_format != file_format:
+            for year in self.years():
+                self._remove_year(year)
+            self.manifest = {"version": EXPORT_VERSION, "format": file_format, "years": {}}
+
+        files = find_year_files(list(years) if years is not None else None, self.json_dir)
+        results = {}
+        for year, path in files.items():
+            entry = self.manifest['years'].get(year)
+            if entry is not None and entry['source'] == source_stat(path) \
+                    and os.path.exists(self.table_path('questions', year)):
+                results[year] = "unchanged"
+                continue
+            source = source_stat(path)
+            with METRICS.timer('export.year', label=path):
+                questions, groups = build_year_tables(path)
+                _write_table(questions, self.table_path('questions', year), file_format)
+                _write_table(groups, self.table_path('groups', year), file_format)
+            self.manifest['years'][year] = {
+                "source": source,
+                "rows": questions.num_rows,
+                "groups": groups.num_rows,
+                **{name: _dictionary_values(questions, name) for name in DICTIONARY_COLUMNS},
+            }
+            self._save_manifest()
+            METRICS.count('export.rows', questions.num_rows)
+            results[year] = "exported"
+        if prune and years is None:
+            for year in set(self.years()) - set(files):
+                self._remove_year(year)
+                results[year] = "removed"
+        self._save_manifest()
+        return results
+
+    def dataset(self, table: str = 'questions') -> 'ds.Dataset':
+        """以 memory map 開啟 questions 或 groups 的所有年份"""
+        if self.file_format is None or not self.years():
+            raise FileNotFoundError(f"{self.export_dir} 中沒有匯出資料，請先執行 python parquet_export.py")
+        return ds.dataset(os.path.join(self.export_dir, table), format='parquet' if self.file_format == 'parquet' else 'ipc',
+                          partitioning=_partitioning(), filesystem=pafs.LocalFileSystem(use_mmap=True))
+
+    def _filter(self, years: List[int], **filters: SubjectFilter) -> Optional['ds.Expression']:
+        """
+        年份與名稱篩選條件轉為 pyarrow 的運算式，名稱篩選 (同 listing_parser 的科目篩選條件) 先套用在
+        export.json 記錄的名稱上，再以符合的名稱做 isin
+        """
+        expression = ds.field('exam_year').isin(years)
+        for name, subject_filter in filters.items():
+            if subject_filter is None:
+                continue
+            match = make_subject_filter(subject_filter)
+            values = {value for year in years for value in self.manifest['years'][year][name] if match(value)}
+            expression &= ds.field(name).isin(sorted(values))
+        return expression
+
+    def read_questions(self, columns: Optional[List[str]] = None, years: Optional[Iterable[int]] = None,
+                       exam_name: SubjectFilter = None, subject: SubjectFilter = None,
+                       flag: SubjectFilter = None) -> 'pa.Table':
+        """
+        只讀取 columns (None 為所有欄位，含 exam_year)，並只保留符合條件的列
+            years: 只開啟這些年份的檔案 (None 為所有已匯出的年份)
+        """
+        years = self.years() if years is None else [year for year in years if year in self.manifest['years']]
+        expression = self._filter(years, exam_name=exam_name, exam_subject=subject, flag=flag)
+        with METRICS.timer('export.read'):
+            return self.dataset('questions').to_table(columns=columns, filter=expression)
+
+    def read_groups(self, years: Optional[Iterable[int]] = None) -> 'pa.Table':
+        years = self.years() if years is None else list(years)
+        return self.dataset('groups').to_table(filter=ds.field('exam_year').isin(years))
+
+    def iter_questions(self, years: Optional[Iterable[int]] = None, exam_name: SubjectFilter = None,
+                       subject: SubjectFilter = None, flag: SubjectFilter = None
+                       ) -> Iterator[Tuple[int, str, str, Dict]]:
+        """
+        同 corpus_io.iter_questions，產生 (考試年份, 考試名稱, 考試科目, 題目)，題目的格式與年份json相同
+        各年份內依科目、考試名稱的順序
+        """
+        years = self.years() if years is None else [year for year in years if year in self.manifest['years']]
+        for year in years:
+            groups = {row['group_id']: row for row in self.read_groups([year]).to_pylist()}
+            table = self.read_questions(None, [year], exam_name, subject, flag)
+            for batch in table.to_batches():
+                for row in batch.to_pylist():
+                    group = groups.get(row['group_id'])
+                    題組 = None
+                    if group is not None:
+                        題組 = {"start_ques": group['start_ques'], "end_ques": group['end_ques']}
+                        if group['ques_desc'] is not None:
+                            題組["ques_desc"] = group['ques_desc']
+                    question = {"題號": row['question_number'], "題目": row['question_text']}
+                    question.update({key: row[name] for key, name in OPTION_COLUMNS.items()})
+                    question.update({"題組": 題組, "flag": row['flag'], "答案": row['answer']})
+                    yield year, row['exam_name'], row['exam_subject'], question
+
+
+def export_corpus(years: Optional[Iterable[int]] = None, file_format: Optional[str] = None,
+                  export_dir: str = EXPORT_DIR, json_dir: str = JSON_DIR) -> Dict[int, str]:
+    return CorpusExport(export_dir, json_dir).update(years, file_format, prune=years is None)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='將考古題匯出為 parquet / arrow')
+    arg_parser.add_argument('--years', type=int, nargs='+', default=None, help='考試年份，預設為所有年份')
+    arg_parser.add_argument('--format', choices=list(FILE_FORMATS), default=None,
+                            help='parquet (zstd 壓縮) 或 arrow (不壓縮，memory map 讀取不需解碼)，預設沿用既有匯出')
+    arg_parser.add_argument('--export-dir', default=EXPORT_DIR)
+    args = arg_parser.parse_args()
+
+    try:
+        for year, status in export_corpus(args.years, args.format, args.export_dir).items():
+            print(f"{year}: {status}")
+    except Exception as e:
+        print(f"發生錯誤: {e}")
@@ -0,0 +1,191 @@
+import hashlib
+import time
+from functools import lru_cache
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import pdfminer
+import pdfplumber
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTTextContainer, LTTextLine
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+
+from metrics import METRICS
+from pdf_cache import source_version
+
+try:
+    import pypdfium2
+    from pypdfium2.version import PDFIUM_INFO, PYPDFIUM_INFO
+except ImportError:
+    pypdfium2 = None
+
+"""
+pdf文字擷取引擎，解析器只依賴 iter_pages() / extract_pages() 產生的每頁文字
+    pdfplumber: 原本的 extract_text()，最慢但最常用
+    pdfminer: 直接使用 pdfminer 的版面分析 (boxes_flow=None 跳過文字區塊排序)，依行由上而下輸出
+    pdfium: pypdfium2 (選用套件) 的文字層，速度最快
+每個引擎各自有 version，作為每頁文字快取的版本：包含擷取文字的套件版本 (pdfplumber 另含其使用的 pdfminer，
+pdfium 含 pypdfium2 與其內建的 pdfium 版本) 與引擎類別原始碼的雜湊，升級套件或修改擷取方式後快取自動失效
+解析器透過 iter_pages() 取得文字，一併記錄頁數 (pdf.pages) 與每份pdf的擷取時間 (pdf.extract_text)
+crop_bbox 為頁面寬高的比例 (x0, top, x1, bottom)，只擷取該區域的文字
+on_open 在開啟文件後以總頁數呼叫一次，提前停止擷取時不需為了頁數再開啟一次pdf
+"""
+
+CropBBox = Tuple[float, float, float, float]
+OnOpen = Optional[Callable[[int], None]]
+DEFAULT_BACKEND = 'pdfplumber'
+
+
+class PdfplumberBackend:
+    name = 'pdfplumber'
+    version = f'pdfplumber-{pdfplumber.__version__}-pdfminer-{pdfminer.__version__}'
+
+    def iter_pages(self, path: str, crop_bbox: Optional[CropBBox] = None, on_open: OnOpen = None) -> Iterator[str]:
+        with pdfplumber.open(path) as pdf:
+            if on_open is not None:
+                on_open(len(pdf.pages))
+            for page in pdf.pages:
+                if crop_bbox is not None:
+                    x0, top, x1, bottom = crop_bbox
+                    page = page.crop((x0 * page.width, top * page.height, x1 * page.width, bottom * page.height))
+                yield page.extract_text() or ''
+
+
+class PdfminerBackend:
+    name = 'pdfminer'
+    version = f'pdfminer-{pdfminer.__version__}'
+
+    def __init__(self, laparams: Optional[LAParams] = None):
+        self.laparams = laparams or LAParams(boxes_flow=None)
+
+    @staticmethod
+    def _lines(container) -> Iterator[LTTextLine]:
+        for item in container:
+            if isinstance(item, LTTextLine):
+                yield item
+            elif isinstance(item, LTTextContainer):
+                yield from PdfminerBackend._lines(item)
+
+    def iter_pages(self, path: str, crop_bbox: Optional[CropBBox] = None, on_open: OnOpen = None) -> Iterator[str]:
+        manager = PDFResourceManager()
+        device = PDFPageAggregator(manager, laparams=self.laparams)
+        interpreter = PDFPageInterpreter(manager, device)
+        with open(path, 'rb') as f:
+            document = PDFDocument(PDFParser(f))
+            if on_open is not None:
+                # 只走訪頁面樹計數，不解析頁面內容
+                on_open(sum(1 for _ in PDFPage.create_pages(document)))
+            for page in PDFPage.create_pages(document):
+                interpreter.process_page(page)
+                layout = device.get_result()
+                lines = self._lines(layout)
+                if crop_bbox is not None:
+                    x0, top, x1, bottom = crop_bbox
+                    # pdf座標原點在左下角
+                    left, right = x0 * layout.width, x1 * layout.width
+                    upper, lower = (1 - top) * layout.height, (1 - bottom) * layout.height
+                    lines = [line for line in lines
+                             if line.x0 >= left and line.x1 <= right and line.y0 >= lower and line.y1 <= upper]
+                lines = sorted(lines, key=lambda line: (-line.y1, line.x0))
+                yield '\n'.join(line.get_text().rstrip('\n') for line in lines)
+
+
+class PdfiumBackend:
+    name = 'pdfium'
+    version = f'pdfium-{PYPDFIUM_INFO}-{PDFIUM_INFO}' if pypdfium2 is not None else 'pdfium'
+
+    def __init__(self):
+        if pypdfium2 is None:
+            raise ImportError("pdfium 引擎需要安裝 pypdfium2 套件")
+
+    def iter_pages(self, path: str, crop_bbox: Optional[CropBBox] = None, on_open: OnOpen = None) -> Iterator[str]:
+        document = pypdfium2.PdfDocument(path)
+        try:
+            if on_open is not None:
+                on_open(len(document))
+            for index in range(len(document)):
+                page = document[index]
+                textpage = page.get_textpage()
+                if crop_bbox is None:
+                    text = textpage.get_text_range()
+                else:
+                    x0, top, x1, bottom = crop_bbox
+                    width, height = page.get_size()
+                    text = textpage.get_text_bounded(
+                        left=x0 * width, bottom=(1 - bottom) * height, right=x1 * width, top=(1 - top) * height)
+                textpage.close()
+                page.close()
+                yield text.replace('\r\n', '\n')
+        finally:
+            document.close()
+
+
+BACKENDS = {
+    'pdfplumber': PdfplumberBackend,
+    'pdfminer': PdfminerBackend,
+    'pdfium': PdfiumBackend,
+}
+for _backend in BACKENDS.values():
+    _backend.version = f'{_backend.version}-{source_version(_backend)}'
+
+
+def available_backends() -> List[str]:
+    return [name for name in BACKENDS if name != 'pdfium' or pypdfium2 is not None]
+
+
+# 主要引擎沒有解析出任何題目時，依序改用的引擎 (未安裝的略過)
+DEFAULT_BACKENDS = tuple(name for name in ('pdfplumber', 'pdfium', 'pdfminer') if name in available_backends())
+
+
+@lru_cache(maxsize=None)
+def get_backend(name: str):
+    if name not in BACKENDS:
+        raise ValueError(f"未知的pdf引擎: {name} (可用: {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
+
+
+def backends_version(backends: Sequence[str]) -> str:
+    """
+    解析結果快取的版本中代表引擎的部分：引擎名稱與順序，加上各引擎 version 的雜湊 (完整字串太長，不適合放進檔名)
+    """
+    versions = '+'.join(get_backend(name).version for name in backends)
+    return f"{'+'.join(backends)}-{hashlib.sha256(versions.encode('utf-8')).hexdigest()[:8]}"
+
+
+def iter_pages(backend: str, path: str, crop_bbox: Optional[CropBBox] = None, on_open: OnOpen = None) -> Iterator[str]:
+    """
+    以指定引擎逐頁擷取文字並計時，只計入實際擷取的頁面 (提前停止時剩下的頁面不計)
+    """
+    pages = get_backend(backend).iter_pages(path, crop_bbox, on_open)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                text = next(pages)
+            except StopIteration:
+                break
+            elapsed += time.perf_counter() - start
+            METRICS.count('pdf.pages')
+            yield text
+    finally:
+        pages.close()
+        METRICS.record('pdf.extract_text', elapsed, label=path)
+
+
+def resolve_backends(backends: Sequence[str]) -> Tuple[str, ...]:
+    """
+    去除重複與未安裝的引擎，保留順序 (第一個為主要引擎，其餘為備援)
+    """
+    available = available_backends()
+    resolved = []
+    for name in backends:
+        if name not in BACKENDS:
+            raise ValueError(f"未知的pdf引擎: {name} (可用: {', '.join(BACKENDS)})")
+        if name in available and name not in resolved:
+            resolved.append(name)
+    if not resolved:
+        raise ImportError(f"沒有可用的pdf引擎: {', '.join(backends)}")
+    return tuple(resolved)
@@ -0,0 +1,195 @@
+import hashlib
+import inspect
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from metrics import METRICS
+
+"""
+以pdf內容 sha256 為鍵的磁碟快取，考古題pdf不會變動，重跑時可直接取回
+    pages: 每頁文字 (版本為擷取引擎及其版本，見 pdf_backend)
+    questions / answers: 解析後的題目、答案 (版本為解析器原始碼的雜湊，修改正則規則後自動失效)
+快取檔以 <cache_dir>/<namespace>/<sha256前2碼>/<sha256>-<version>.json 儲存；
+逐項寫入的項目 (每頁文字、題目，見 writer()) 以同名的 .jsonl 每行一項儲存，以 iter_lines() 逐行讀回，
+超過 max_bytes 時依最近使用時間 (mtime，命中時會更新) 淘汰最舊的項目
+"""
+
+DEFAULT_CACHE_DIR = './.pdf_cache'
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def sha256_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def source_version(*objects) -> str:
+    """
+    以物件 (類別、函式、模組) 的原始碼計算版本字串，原始碼有任何變動 (例如修改正則規則) 版本就會改變
+    """
+    sha256 = hashlib.sha256()
+    for obj in objects:
+        sha256.update(inspect.getsource(obj).encode('utf-8'))
+    return sha256.hexdigest()[:16]
+
+
+class PDFCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._file_keys: Dict[Tuple[str, int, int], str] = {}
+        self._total_bytes: Optional[int] = None
+
+    def file_key(self, pdf_path: str) -> str:
+        """
+        取得pdf的 sha256，同一個 process 內以 (路徑, 大小, mtime) 記住結果，避免重複讀檔
+        """
+        stat = os.stat(pdf_path)
+        stat_key = (os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns)
+        if stat_key not in self._file_keys:
+            self._file_keys[stat_key] = sha256_file(pdf_path)
+        return self._file_keys[stat_key]
+
+    def _entry_path(self, namespace: str, key: str, version: str, suffix: str = '.json') -> str:
+        return os.path.join(self.cache_dir, namespace, key[:2], f'{key}-{version}{suffix}')
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        # 更新 mtime 作為 LRU 的最近使用時間
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def get(self, namespace: str, key: str, version: str) -> Optional[Any]:
+        path = self._entry_path(namespace, key, version)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            METRICS.count(f'cache.{namespace}.miss')
+            return None
+        METRICS.count(f'cache.{namespace}.hit')
+        self._touch(path)
+        return value
+
+    def put(self, namespace: str, key: str, version: str, value: Any) -> None:
+        path = self._entry_path(namespace, key, version)
+        tmp_path = self._tmp_path(path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        self._commit(tmp_path, path)
+
+    def iter_lines(self, namespace: str, key: str, version: str) -> Optional[Iterator[Any]]:
+        """
+        逐行讀回以 writer() 寫入的項目，沒有快取時回傳 None
+            檔案在開始迭代時才開啟、讀完或產生器關閉時關閉，未使用的產生器不會佔用檔案
+        """
+        path = self._entry_path(namespace, key, version, '.jsonl')
+        if not os.path.exists(path):
+            METRICS.count(f'cache.{namespace}.miss')
+            return None
+        METRICS.count(f'cache.{namespace}.hit')
+        self._touch(path)
+        return self._read_lines(path)
+
+    @staticmethod
+    def _read_lines(path: str) -> Iterator[Any]:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def writer(self, namespace: str, key: str, version: str) -> 'CacheWriter':
+        """
+        逐項寫入快取，不需先收集所有項目：
+            with cache.writer('pages', key, version) as writer:
+                for page in pages:
+                    writer.write(page)
+        with 區塊正常結束時才完成寫入 (iter_lines() 才讀得到)，區塊中發生例外 (含產生器被提前關閉) 時捨棄
+        """
+        path = self._entry_path(namespace, key, version, '.jsonl')
+        return CacheWriter(self, path, self._tmp_path(path))
+
+    @staticmethod
+    def _tmp_path(path: str) -> str:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    def _commit(self, tmp_path: str, path: str) -> None:
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(('.json', '.jsonl')):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self) -> None:
+        """
+        刪除最久未使用的項目，直到總大小低於 max_bytes 的 90%
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._total_bytes = total
+
+    def clear(self) -> None:
+        with self.lock:
+            for path, _, _ in list(self._entries()):
+                os.remove(path)
+            self._total_bytes = 0
+
+
+class CacheWriter:
+    """PDFCache.writer() 回傳的逐項寫入器，每項一行json，寫入暫存檔，完成時才以 os.replace 換上"""
+
+    def __init__(self, cache: PDFCache, path: str, tmp_path: str):
+        self.cache = cache
+        self.path = path
+        self.tmp_path = tmp_path
+        self.file = None
+
+    def __enter__(self) -> 'CacheWriter':
+        self.file = open(self.tmp_path, 'w', encoding='utf-8')
+        return self
+
+    def write(self, value: Any) -> None:
+        self.file.write(json.dumps(value, ensure_ascii=False) + '\n')
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.file.close()
+        if exc_type is None:
+            self.cache._commit(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
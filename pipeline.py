@@ -0,0 +1,579 @@
+import argparse
+import glob
+import json
+import os
+import queue
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from tqdm import tqdm
+
+from build_state import content_key, load_state, save_state, subject_fingerprint, subject_key
+from corpus_io import CorpusWriter, OutputOptions, find_year_files, iter_subjects
+from downloader import SUCCESS_STATUSES, DownloadManifest, PDFDownloader
+from file_iterator import build_corpus, run_unit, run_unit_in_worker, unit_path
+from http_cache import DEFAULT_HTTP_CACHE_DIR, HTTPCache
+from json2postgreSQL import bulk_load, ensure_schema, get_engine, load_rows, question_row
+from listing_fetcher import HTML_DIR, STATE_FIELDS, ListingFetcher
+from metrics import METRICS, default_report_path, print_summary, write_report
+from pdf_backend import BACKENDS, DEFAULT_BACKENDS
+from parquet_export import EXPORT_DIR, FILE_FORMATS, export_corpus
+from pdf_cache import DEFAULT_CACHE_DIR
+from search_index import SearchIndex
+from 司法考試_crawler import (DOWNLOAD_WORKERS, MANIFEST_PATH, MAX_RETRIES, PER_HOST_LIMIT, REQUESTS_PER_SECOND,
+                          build_download_tasks, parse_listing)
+
+"""
+考古題處理流程的統一入口
+    listing: 自動取得每年的查詢頁面 (見 listing_fetcher.py)，crawl / download / run 加上 --fetch-listings 時會先執行
+    crawl: 解析查詢頁面 (./考選部html/<n>年考選部考古題.html)，列出要下載的檔案
+    download: 解析查詢頁面並下載試題、答案、更正答案
+    parse: 解析已下載的pdf，輸出每年的json / jsonl (同 file_iterator.py)
+    load: 將每年的輸出載入資料庫 (同 json2postgreSQL.py)，並更新全文檢索索引 (search_index.py)
+    run: 以有上限的佇列串接 crawl → download → parse → load，
+        第一個科目下載完就開始解析、第一個科目解析完就開始載入，下游來不及處理時上游會等待 (backpressure)
+
+    python pipeline.py run --years 110 111 112 --subjects 法 --download-workers 8 --parse-workers 4
+"""
+
+PDF_DIR = './考選部考古題pdf'
+# 工作單元 (考試年份, 考試名稱, 考試科目)
+Unit = Tuple[int, str, str]
+_DONE = object()
+# 串流解析時保留最近幾份解析結果 (暫存檔)，供內容相同的科目直接沿用
+PARSED_CACHE_SIZE = 256
+# 交給 load 的每一份題目列數上限，題數很多的科目分成多份，不在佇列中放入整個科目
+LOAD_CHUNK_SIZE = 1000
+
+
+def listing_years(html_dir: str = HTML_DIR) -> List[int]:
+    """有查詢頁面html的年份"""
+    years = []
+    for path in glob.glob(os.path.join(html_dir, '*年考選部考古題.html')):
+        match = re.fullmatch(r'(\d+)年考選部考古題\.html', os.path.basename(path))
+        if match:
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+
+def downloaded_years(pdf_dir: str = PDF_DIR) -> List[int]:
+    """已有下載資料夾的年份"""
+    years = []
+    for path in glob.glob(os.path.join(pdf_dir, '*年考選部考古題')):
+        match = re.fullmatch(r'(\d+)年考選部考古題', os.path.basename(path))
+        if match and os.path.isdir(path):
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+
+def make_filter(subjects: Optional[List[str]], subject_regex: Optional[str]):
+    if subject_regex:
+        return re.compile(subject_regex)
+    if not subjects:
+        return None
+    return subjects[0] if len(subjects) == 1 else subjects
+
+
+def crawl_units(years: List[int], subject_filter) -> Iterator[Tuple[Unit, List[Tuple[str, str]]]]:
+    """
+    逐年解析查詢頁面，依科目產生 (工作單元, [(連結, 存檔路徑), ...])
+    """
+    seen = set()
+    for 考試年份 in years:
+        for exam in parse_listing(str(考試年份), subject_filter):
+            unit = (考試年份, exam['考試名稱'], exam['科目'])
+            if unit in seen:
+                continue
+            seen.add(unit)
+            yield unit, build_download_tasks(str(考試年份), [exam])
+
+
+class StageError(Exception):
+    pass
+
+
+class StreamingPipeline:
+    """
+    crawl → download → parse → load 的串流執行，各階段之間以有上限的 queue.Queue 連接
+        download: download_workers 個執行緒，每個科目的檔案都下載完成後才交給 parse
+        parse: 最多同時 parse_workers * 2 個科目在 process pool 中 (parse_workers <= 1 時在同一個執行緒中解析)，
+            worker 將題目逐題寫入暫存檔 (SubjectSpool)，完成的科目逐題讀回寫入該年份的 jsonl，再分批交給 load
+            年份的 jsonl 先寫到暫存檔，結束時併入既有輸出中其他科目才取代 (見 _close_year)
+            內容相同的科目 (同一份試題列在多個考試類科下) 只解析一次，解析中或最近解析過的結果直接沿用
+        load: 累積到 batch_size 題或 flush_interval 秒內沒有新科目時 upsert 一次 (每次一個交易)
+    任何階段發生例外時設定 stop，其他階段在下一次存取佇列時結束
+    """
+
+    def __init__(self, years: List[int], subject_filter, engine=None, download_workers: int = DOWNLOAD_WORKERS,
+                 parse_workers: int = 1, queue_size: int = 32, batch_size: int = 5000, flush_interval: float = 2.0,
+                 cache_dir: Optional[str] = DEFAULT_CACHE_DIR, backends=DEFAULT_BACKENDS,
+                 output: OutputOptions = OutputOptions('jsonl'), downloader: Optional[PDFDownloader] = None):
+        self.years = years
+        self.subject_filter = subject_filter
+        self.engine = engine
+        self.download_workers = download_workers
+        self.parse_workers = parse_workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.cache_dir = cache_dir
+        self.backends = backends
+        self.output = output
+        self.downloader = downloader or PDFDownloader(
+            max_workers=download_workers,
+            per_host_limit=PER_HOST_LIMIT,
+            rate=REQUESTS_PER_SECOND,
+            max_retries=MAX_RETRIES,
+            manifest=DownloadManifest(MANIFEST_PATH),
+        )
+        self.download_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.parse_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.load_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.stop = threading.Event()
+        self.stage_errors: List[str] = []
+        self.errors: Dict[Unit, str] = {}
+        self.writers: Dict[int, CorpusWriter] = {}
+        self.states: Dict[int, Dict[str, List[Dict]]] = {}
+        self.progress: Optional[tqdm] = None
+        # content_key -> (SubjectSpool, 錯誤)，只保留最近 PARSED_CACHE_SIZE 份，淘汰時刪除暫存檔
+        self.parsed: OrderedDict = OrderedDict()
+        # content_key -> [(工作單元, 指紋), ...]，等待解析中的同內容科目
+        self.waiting: Dict[Tuple, List[Tuple[Unit, List[Dict]]]] = {}
+
+    def _put(self, q: queue.Queue, item) -> None:
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise StageError("pipeline stopped")
+
+    def _get(self, q: queue.Queue, timeout: Optional[float] = None):
+        waited = 0.0
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                waited += 0.5
+                if timeout is not None and waited >= timeout:
+                    raise
+        raise StageError("pipeline stopped")
+
+    def _stage(self, name, func, *args):
+        try:
+            func(*args)
+        except StageError:
+            pass
+        except Exception as e:
+            self.stage_errors.append(f"{name}: {type(e).__name__}: {e}")
+            self.stop.set()
+
+    def crawl(self) -> None:
+        try:
+            for unit, tasks in crawl_units(self.years, self.subject_filter):
+                self.progress.total += 1
+                self.progress.refresh()
+                self._put(self.download_queue, (unit, tasks))
+        finally:
+            for _ in range(self.download_workers):
+                self._put(self.download_queue, _DONE)
+
+    def download(self) -> None:
+        while True:
+            item = self._get(self.download_queue)
+            if item is _DONE:
+                return
+            unit, tasks = item
+            statuses = {}
+            for url, path in tasks:
+                try:
+                    statuses[path] = self.downloader.download(url, path)
+                except Exception as e:
+                    statuses[path] = f"error: {e}"
+            failed = [f"{os.path.basename(path)} {status}" for path, status in statuses.items()
+                      if status not in SUCCESS_STATUSES]
+            if failed:
+                self.errors[unit] = "下載失敗: " + ', '.join(failed)
+                self.progress.update(1)
+                continue
+            self._put(self.parse_queue, unit)
+
+    def _claim(self, unit: Unit) -> Optional[Tuple]:
+        """
+        內容與最近解析過或解析中的科目相同時直接沿用其結果並回傳 None，否則回傳需解析的 content_key
+        """
+        fingerprint = subject_fingerprint(unit_path(unit))
+        key = content_key(fingerprint)
+        if key in self.parsed:
+            METRICS.count('subjects.deduplicated')
+            self.parsed.move_to_end(key)
+            self._finish_unit(unit, fingerprint, *self.parsed[key])
+        elif key in self.waiting:
+            METRICS.count('subjects.deduplicated')
+            self.waiting[key].append((unit, fingerprint))
+        else:
+            self.waiting[key] = [(unit, fingerprint)]
+            return key
+        return None
+
+    def _complete(self, key: Tuple, 考卷內容, error) -> None:
+        self.parsed[key] = (考卷內容, error)
+        if len(self.parsed) > PARSED_CACHE_SIZE:
+            evicted, _ = self.parsed.popitem(last=False)[1]
+            if evicted is not None:
+                evicted.release()
+        for unit, fingerprint in self.waiting.pop(key):
+            self._finish_unit(unit, fingerprint, 考卷內容, error)
+
+    def _finish_unit(self, unit: Unit, fingerprint: List[Dict], 考卷內容, error) -> None:
+        self.progress.update(1)
+        if error is not None:
+            self.errors[unit] = error
+            return
+        考試年份, 考試名稱, 考試科目 = unit
+        if 考試年份 not in self.writers:
+            self.writers[考試年份] = CorpusWriter(self.output.path(考試年份), self.output.granularity, self.output.compact,
+                                                atomic=True)
+            self.states[考試年份] = {}
+        self.writers[考試年份].write_questions({
+            "考試年份": 考試年份,
+            "考試名稱": 考試名稱,
+            "考試科目": 考試科目,
+        }, 考卷內容)
+        self.states[考試年份][subject_key(考試名稱, 考試科目)] = fingerprint
+        if self.engine is not None:
+            rows = []
+            for question in 考卷內容:
+                rows.append(question_row(考試年份, 考試名稱, 考試科目, question))
+                if len(rows) >= LOAD_CHUNK_SIZE:
+                    self._put(self.load_queue, (unit, rows))
+                    rows = []
+            if rows:
+                self._put(self.load_queue, (unit, rows))
+
+    def parse(self) -> None:
+        with tempfile.TemporaryDirectory(prefix='spool-') as spool_dir:
+            self._parse(spool_dir)
+
+    def _parse(self, spool_dir: str) -> None:
+        try:
+            if self.parse_workers <= 1:
+                while True:
+                    unit = self._get(self.parse_queue)
+                    if unit is _DONE:
+                        return
+                    key = self._claim(unit)
+                    if key is not None:
+                        self._complete(key, *run_unit(unit, self.cache_dir, self.backends, spool_dir))
+            with ProcessPoolExecutor(max_workers=self.parse_workers) as executor:
+                running = {}
+                finished_input = False
+                while not finished_input or running:
+                    # 同時進行的科目數有上限，滿了就先等完成的科目
+                    # 已有科目在解析時不等待新的科目 (下載較慢時，完成的科目仍會立即寫出、交給 load)
+                    while not finished_input and len(running) < self.parse_workers * 2:
+                        if not running:
+                            unit = self._get(self.parse_queue)
+                        else:
+                            try:
+                                unit = self.parse_queue.get_nowait()
+                            except queue.Empty:
+                                break
+                        if unit is _DONE:
+                            finished_input = True
+                            break
+                        key = self._claim(unit)
+                        if key is not None:
+                            running[executor.submit(run_unit_in_worker, unit, self.cache_dir, self.backends, spool_dir)] = key
+                    if not running:
+                        continue
+                    done, _ = wait(running, timeout=0.5, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        考卷內容, error, snapshot = future.result()
+                        METRICS.merge(snapshot)
+                        self._complete(running.pop(future), 考卷內容, error)
+        finally:
+            for 考試年份 in self.writers:
+                self._close_year(考試年份)
+            if self.engine is not None:
+                self._put(self.load_queue, _DONE)
+
+    def _close_year(self, 考試年份: int) -> None:
+        """
+        將既有年份輸出中這次沒有重新解析的科目附加到新的輸出後才取代，建置狀態也與既有的合併，
+        只處理部分科目 (--subjects) 時其他科目不會從年份輸出與建置狀態中消失 (同 file_iterator 的增量模式)
+        解析失敗的科目保留既有的輸出與狀態，指紋不同，下次仍會重新解析
+        """
+        writer = self.writers[考試年份]
+        state = self.states[考試年份]
+        try:
+            for record in iter_subjects(writer.path):
+                if subject_key(record["考試名稱"], record["考試科目"]) not in state:
+                    writer.write_subject(record)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        writer.close()
+        save_state(考試年份, {**load_state(考試年份), **state})
+
+    def load(self) -> None:
+        ensure_schema(self.engine)
+        pending: List[Tuple] = []
+        subjects = set()
+
+        def flush():
+            nonlocal pending, subjects
+            if pending:
+                with METRICS.timer('db.load_file', label=f'{len(subjects)} 個科目'):
+                    load_rows(self.engine, pending, self.batch_size)
+                pending, subjects = [], set()
+
+        while True:
+            try:
+                item = self._get(self.load_queue, timeout=self.flush_interval)
+            except queue.Empty:
+                flush()
+                continue
+            if item is _DONE:
+                flush()
+                return
+            unit, rows = item
+            pending.extend(rows)
+            subjects.add(unit)
+            if len(pending) >= self.batch_size:
+                flush()
+
+    def run(self) -> Dict[Unit, str]:
+        """
+        執行所有階段直到完成，回傳 {工作單元: 錯誤訊息}，階段本身失敗時拋出 RuntimeError
+        """
+        self.progress = tqdm(total=0, desc='Pipeline', unit="subjects")
+        threads = [threading.Thread(target=self._stage, args=('crawl', self.crawl))]
+        threads += [threading.Thread(target=self._stage, args=('download', self.download))
+                    for _ in range(self.download_workers)]
+        parse_thread = threading.Thread(target=self._stage, args=('parse', self.parse))
+        load_thread = threading.Thread(target=self._stage, args=('load', self.load)) if self.engine is not None else None
+        for thread in threads + [parse_thread] + ([load_thread] if load_thread else []):
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+            # 所有下載執行緒結束後才通知 parse 沒有更多科目
+            if not self.stop.is_set():
+                self._put(self.parse_queue, _DONE)
+            parse_thread.join()
+            if load_thread is not None:
+                load_thread.join()
+        except KeyboardInterrupt:
+            self.stop.set()
+            raise
+        except StageError:
+            pass
+        finally:
+            self.progress.close()
+            self.downloader.close()
+        if self.stage_errors:
+            raise RuntimeError('; '.join(self.stage_errors))
+        return self.errors
+
+
+def print_errors(errors: Dict[Unit, str]) -> None:
+    if errors:
+        print(f"共 {len(errors)} 個科目失敗：")
+        for (考試年份, 考試名稱, 考試科目), error in errors.items():
+            print(f"  {考試年份} {考試名稱} {考試科目}: {error}")
+
+
+def fetch_listings(years: Optional[List[int]], http_cache_dir: str = DEFAULT_HTTP_CACHE_DIR,
+                   revalidate: bool = False) -> Dict[str, str]:
+    """
+    取得查詢頁面並印出每個年份的狀態，years 為 None 時取得查詢頁面中所有年份
+    revalidate 為 True 時，查詢頁面未變動也重新查詢每個年份
+    """
+    with PDFDownloader(per_host_limit=PER_HOST_LIMIT, rate=REQUESTS_PER_SECOND, max_retries=MAX_RETRIES) as downloader:
+        fetcher = ListingFetcher(downloader, HTTPCache(http_cache_dir, ignored_fields=STATE_FIELDS), HTML_DIR)
+        results = fetcher.fetch_all(years, revalidate)
+    for 考試年份, status in sorted(results.items()):
+        print(f"  {考試年份}: {status}")
+    return results
+
+
+def cmd_listing(args) -> None:
+    fetch_listings(args.years, args.http_cache_dir, args.revalidate)
+
+
+def cmd_crawl(args) -> None:
+    if args.fetch_listings:
+        fetch_listings(args.years, args.http_cache_dir, args.revalidate)
+    subject_filter = make_filter(args.subjects, args.subject_regex)
+    years = args.years or listing_years()
+    count = 0
+    with open(args.output, 'w', encoding='utf-8') if args.output else open(os.devnull, 'w') as f:
+        for unit, tasks in crawl_units(years, subject_filter):
+            for url, path in tasks:
+                f.write(json.dumps({"unit": unit, "url": url, "path": path}, ensure_ascii=False) + '\n')
+                count += 1
+            if not args.output:
+                print('/'.join(map(str, unit)), len(tasks))
+    print(f"{len(years)} 個年份，共 {count} 個檔案")
+
+
+def cmd_download(args) -> None:
+    if args.fetch_listings:
+        fetch_listings(args.years, args.http_cache_dir, args.revalidate)
+    subject_filter = make_filter(args.subjects, args.subject_regex)
+    years = args.years or listing_years()
+    with PDFDownloader(
+        max_workers=args.download_workers,
+        per_host_limit=PER_HOST_LIMIT,
+        rate=REQUESTS_PER_SECOND,
+        max_retries=MAX_RETRIES,
+        manifest=DownloadManifest(MANIFEST_PATH),
+    ) as downloader:
+        tasks = [task for _, unit_tasks in crawl_units(years, subject_filter) for task in unit_tasks]
+        results = downloader.download_all(tasks)
+    failed = {path: status for path, status in results.items() if status not in SUCCESS_STATUSES}
+    print(f"共 {len(results)} 個檔案，{len(failed)} 個失敗")
+    for path, status in failed.items():
+        print(f"  {path}: {status}")
+
+
+def cmd_parse(args) -> None:
+    years = args.years or downloaded_years()
+    output = OutputOptions(args.format, args.compression, args.granularity, args.compact)
+    errors, _ = build_corpus(years, args.parse_workers, None if args.no_cache else args.cache_dir,
+                             args.incremental, output, (args.backend, *args.fallback))
+    print_errors(errors)
+
+
+def cmd_load(args) -> None:
+    engine = get_engine(args.config)
+    paths = list(find_year_files(args.years).values())
+    workers = args.load_workers if engine.dialect.name == 'postgresql' else 1
+    bulk_load(engine, paths, workers, args.batch_size, args.dedupe)
+    if not args.no_search_index:
+        SearchIndex().update(args.years)
+
+
+def cmd_export(args) -> None:
+    for year, status in export_corpus(args.years, args.format, args.export_dir).items():
+        print(f"{year}: {status}")
+
+
+def cmd_run(args) -> None:
+    if args.fetch_listings:
+        fetch_listings(args.years, args.http_cache_dir, args.revalidate)
+    engine = None if args.no_load else get_engine(args.config)
+    if engine is not None:
+        # 開始下載前先確認資料表可建立唯一索引 (舊版資料表有重複時需 --dedupe)
+        ensure_schema(engine, args.dedupe)
+    pipeline = StreamingPipeline(
+        years=args.years or listing_years(),
+        subject_filter=make_filter(args.subjects, args.subject_regex),
+        engine=engine,
+        download_workers=args.download_workers,
+        parse_workers=args.parse_workers,
+        queue_size=args.queue_size,
+        batch_size=args.batch_size,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        backends=(args.backend, *args.fallback),
+        output=OutputOptions('jsonl', args.compression, args.granularity, args.compact),
+    )
+    print_errors(pipeline.run())
+    if not args.no_search_index:
+        SearchIndex().update(pipeline.years)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='考古題 crawl / download / parse / load 流程')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+
+    def add_years(parser, default_help):
+        parser.add_argument('--years', type=int, nargs='+', default=None, help=f'考試年份，預設為{default_help}')
+
+    def add_filter(parser):
+        parser.add_argument('--subjects', nargs='+', default=['法'], help='科目名稱包含其中任一字串，預設為 "法"')
+        parser.add_argument('--subject-regex', default=None, help='以正則表達式篩選科目 (優先於 --subjects)')
+
+    def add_parse_options(parser):
+        parser.add_argument('--parse-workers', type=int, default=os.cpu_count() or 1, help='平行解析的 process 數')
+        parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+        parser.add_argument('--no-cache', action='store_true')
+        parser.add_argument('--compression', choices=['gzip', 'zstd'], default=None)
+        parser.add_argument('--granularity', choices=['subject', 'question'], default='subject')
+        parser.add_argument('--compact', action='store_true')
+        parser.add_argument('--backend', choices=list(BACKENDS), default=DEFAULT_BACKENDS[0])
+        parser.add_argument('--fallback', choices=list(BACKENDS), nargs='*', default=list(DEFAULT_BACKENDS[1:]))
+
+    def add_fetch_listings(parser):
+        parser.add_argument('--fetch-listings', action='store_true', help='先自動取得查詢頁面 (同 listing 子命令)')
+        parser.add_argument('--http-cache-dir', default=DEFAULT_HTTP_CACHE_DIR, help='查詢頁面的 HTTP 快取資料夾')
+        parser.add_argument('--revalidate', action='store_true', help='查詢頁面未變動時仍重新查詢每個年份')
+
+    fetch_parser = subparsers.add_parser('listing', help='自動取得每年的查詢頁面')
+    add_years(fetch_parser, '查詢頁面中所有年份')
+    fetch_parser.add_argument('--http-cache-dir', default=DEFAULT_HTTP_CACHE_DIR, help='查詢頁面的 HTTP 快取資料夾')
+    fetch_parser.add_argument('--revalidate', action='store_true', help='查詢頁面未變動時仍重新查詢每個年份')
+    fetch_parser.set_defaults(func=cmd_listing)
+
+    crawl_parser = subparsers.add_parser('crawl', help='解析查詢頁面，列出要下載的檔案')
+    add_years(crawl_parser, ' ./考選部html 中所有年份')
+    add_filter(crawl_parser)
+    add_fetch_listings(crawl_parser)
+    crawl_parser.add_argument('--output', default=None, help='將下載清單寫成 jsonl')
+    crawl_parser.set_defaults(func=cmd_crawl)
+
+    download_parser = subparsers.add_parser('download', help='下載試題、答案、更正答案')
+    add_years(download_parser, ' ./考選部html 中所有年份')
+    add_filter(download_parser)
+    add_fetch_listings(download_parser)
+    download_parser.add_argument('--download-workers', type=int, default=DOWNLOAD_WORKERS)
+    download_parser.set_defaults(func=cmd_download)
+
+    parse_parser = subparsers.add_parser('parse', help='解析已下載的pdf')
+    add_years(parse_parser, ' ./考選部考古題pdf 中所有年份')
+    add_parse_options(parse_parser)
+    parse_parser.add_argument('--incremental', action='store_true')
+    parse_parser.add_argument('--format', choices=['json', 'jsonl'], default='json')
+    parse_parser.set_defaults(func=cmd_parse)
+
+    load_parser = subparsers.add_parser('load', help='將每年的輸出載入資料庫')
+    add_years(load_parser, ' ./考選部考古題json 中所有年份')
+    load_parser.add_argument('--load-workers', type=int, default=4)
+    load_parser.add_argument('--batch-size', type=int, default=5000)
+    load_parser.add_argument('--config', default='config.conf')
+    load_parser.add_argument('--no-search-index', action='store_true', help='不更新全文檢索索引')
+    load_parser.add_argument('--dedupe', action='store_true', help='舊版資料表有重複的題目時刪除重複 (保留 id 最小者)')
+    load_parser.set_defaults(func=cmd_load)
+
+    export_parser = subparsers.add_parser('export', help='將每年的輸出匯出為 parquet / arrow (需安裝 pyarrow)')
+    add_years(export_parser, '所有已解析的年份')
+    export_parser.add_argument('--format', choices=list(FILE_FORMATS), default=None,
+                               help='parquet (zstd 壓縮) 或 arrow (不壓縮，memory map 讀取不需解碼)，預設沿用既有匯出')
+    export_parser.add_argument('--export-dir', default=EXPORT_DIR)
+    export_parser.set_defaults(func=cmd_export)
+
+    run_parser = subparsers.add_parser('run', help='串流執行 crawl → download → parse → load')
+    add_years(run_parser, ' ./考選部html 中所有年份')
+    add_filter(run_parser)
+    add_parse_options(run_parser)
+    add_fetch_listings(run_parser)
+    run_parser.add_argument('--download-workers', type=int, default=DOWNLOAD_WORKERS)
+    run_parser.add_argument('--queue-size', type=int, default=32, help='各階段之間佇列的上限')
+    run_parser.add_argument('--batch-size', type=int, default=5000)
+    run_parser.add_argument('--config', default='config.conf')
+    run_parser.add_argument('--no-load', action='store_true', help='只下載與解析，不載入資料庫')
+    run_parser.add_argument('--no-search-index', action='store_true', help='不更新全文檢索索引')
+    run_parser.add_argument('--dedupe', action='store_true', help='舊版資料表有重複的題目時刪除重複 (保留 id 最小者)')
+    run_parser.set_defaults(func=cmd_run)
+
+    for parser in subparsers.choices.values():
+        parser.add_argument('--metrics', default=None, help='metrics json 的輸出路徑，預設為 ./metrics/<子命令>-<時間>.json')
+
+    args = arg_parser.parse_args()
+    args.func(args)
+    metrics_path = args.metrics or default_report_path(args.command)
+    print_summary(write_report(metrics_path, stage=args.command, years=args.years))
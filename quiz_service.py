@@ -0,0 +1,268 @@
+import argparse
+import json
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from json2postgreSQL import ExamQuestion, LoadState, get_engine
+from listing_parser import SubjectFilter, make_subject_filter
+from metrics import METRICS
+
+"""
+練習測驗的讀取端，取代每次以 ORDER BY random() 掃描整個 examquestion 表
+    啟動時讀取 (id, 科目, 年份, flag)，依 (科目, 年份, flag) 分組為排序好的 id 陣列 (array)
+    抽題: 從符合條件的各組合計數量中抽出 k 個位置，再以各組累計數量 bisect 找到 id，與總題數無關
+    分頁: 同樣以位置換算 id，順序依 (年份, 科目, flag, id) 固定
+    題目內容: 只以主鍵查詢尚未快取的 id，完整題目 (題組 json 只解析一次) 存在 LRU 中
+    載入程式 (json2postgreSQL.load_rows) 每次提交時將 loadstate.version 加一，
+    maybe_refresh() 每隔 check_interval 秒檢查一次版本，變動時重建 id 陣列並清空題目快取
+"""
+
+DEFAULT_FLAG = "讚"
+QUESTION_CACHE_SIZE = 4096
+SELECTION_CACHE_SIZE = 256
+CHECK_INTERVAL = 1.0
+
+GroupKey = Tuple[str, int, str]  # (科目, 年份, flag)
+
+
+@lru_cache(maxsize=1024)
+def parse_group(question_group: Optional[str]) -> Optional[Dict]:
+    """題組 json 字串轉為 dict，相同字串只解析一次 (回傳的 dict 共用，不可修改)"""
+    return json.loads(question_group) if question_group else None
+
+
+@dataclass
+class QuizQuestion:
+    id: int
+    year: int                       # 考試年份
+    exam_name: str                  # 考試名稱
+    subject: str                    # 考試科目
+    question_number: int            # 題號
+    question_text: str              # 題目
+    option_a: str
+    option_b: str
+    option_c: str
+    option_d: str
+    group: Optional[Dict]           # 題組
+    flag: str
+    answer: Optional[str]           # 答案
+
+    @classmethod
+    def from_row(cls, row: ExamQuestion) -> 'QuizQuestion':
+        return cls(row.id, row.exam_year, row.exam_name, row.exam_subject, row.question_number, row.question_text,
+                   row.option_a, row.option_b, row.option_c, row.option_d, parse_group(row.question_group),
+                   row.flag, row.answer)
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "考試年份": self.year,
+            "考試名稱": self.exam_name,
+            "考試科目": self.subject,
+            "題號": self.question_number,
+            "題目": self.question_text,
+            "A": self.option_a,
+            "B": self.option_b,
+            "C": self.option_c,
+            "D": self.option_d,
+            "題組": self.group,
+            "flag": self.flag,
+            "答案": self.answer,
+        }
+
+
+class Selection:
+    """
+    符合條件的各組 id 陣列，以累計數量將 0 ~ total-1 的位置對應到 id
+    """
+
+    def __init__(self, arrays: List[array]):
+        self.arrays = arrays
+        self.offsets = []
+        total = 0
+        for ids in arrays:
+            self.offsets.append(total)
+            total += len(ids)
+        self.total = total
+
+    def id_at(self, position: int) -> int:
+        i = bisect_right(self.offsets, position) - 1
+        return self.arrays[i][position - self.offsets[i]]
+
+
+class QuizIndex:
+    """某個載入版本的 id 陣列，建立後不再修改，refresh 時整個替換"""
+
+    def __init__(self, version: int, groups: Dict[GroupKey, array]):
+        self.version = version
+        self.groups = groups
+        self.subjects = sorted({subject for subject, _, _ in groups})
+        self.years = sorted({year for _, year, _ in groups})
+
+    @classmethod
+    def build(cls, engine) -> 'QuizIndex':
+        with Session(engine) as db:
+            version = db.exec(select(LoadState.version).where(LoadState.id == 1)).first() or 0
+            rows = db.exec(select(ExamQuestion.exam_subject, ExamQuestion.exam_year, ExamQuestion.flag, ExamQuestion.id)
+                           .order_by(ExamQuestion.id))
+            groups: Dict[GroupKey, array] = {}
+            for subject, year, flag, question_id in rows:
+                ids = groups.get((subject, year, flag))
+                if ids is None:
+                    ids = groups[(subject, year, flag)] = array('q')
+                ids.append(question_id)
+        # 依 (年份, 科目, flag) 排序，分頁的順序固定
+        return cls(version, {key: groups[key] for key in sorted(groups, key=lambda key: (key[1], key[0], key[2]))})
+
+    def select(self, subject: SubjectFilter, years: Optional[Tuple[int, ...]], flag: Optional[str]) -> Selection:
+        match_subject = make_subject_filter(subject)
+        year_set = set(years) if years is not None else None
+        return Selection([ids for (key_subject, year, key_flag), ids in self.groups.items()
+                          if (flag is None or key_flag == flag) and (year_set is None or year in year_set)
+                          and match_subject(key_subject)])
+
+
+def _selection_key(subject: SubjectFilter, years: Optional[Iterable[int]], flag: Optional[str]) -> tuple:
+    if isinstance(subject, (list, tuple, set, frozenset)):
+        subject = tuple(sorted(subject))
+    return subject, tuple(sorted(years)) if years is not None else None, flag
+
+
+class QuizService:
+    """
+    engine: 與載入程式相同的資料庫
+    cache_size: 題目 LRU 的上限
+    check_interval: maybe_refresh() 檢查載入版本的最短間隔 (秒)，0 為每次都檢查
+    subject 為 listing_parser 的科目篩選條件 (包含字串、字串清單、正則表達式或函式)，flag 為 None 時不限
+    """
+
+    def __init__(self, engine, cache_size: int = QUESTION_CACHE_SIZE, check_interval: float = CHECK_INTERVAL,
+                 rng: Optional[random.Random] = None):
+        self.engine = engine
+        self.cache_size = cache_size
+        self.check_interval = check_interval
+        self.rng = rng or random.Random()
+        self.lock = threading.Lock()
+        self.questions: 'OrderedDict[int, QuizQuestion]' = OrderedDict()
+        self.selections: 'OrderedDict[tuple, Selection]' = OrderedDict()
+        self.last_check = time.monotonic()
+        self.index = self._build()
+
+    def _build(self) -> QuizIndex:
+        with METRICS.timer('quiz.refresh'):
+            return QuizIndex.build(self.engine)
+
+    def current_version(self) -> int:
+        with Session(self.engine) as db:
+            return db.exec(select(LoadState.version).where(LoadState.id == 1)).first() or 0
+
+    def refresh(self) -> bool:
+        """重新讀取 id 陣列，版本有變動時回傳 True"""
+        index = self._build()
+        changed = index.version != self.index.version
+        with self.lock:
+            self.index = index
+            self.selections.clear()
+            if changed:
+                self.questions.clear()
+        return changed
+
+    def maybe_refresh(self) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_check < self.check_interval:
+                return False
+            self.last_check = now
+        if self.current_version() == self.index.version:
+            return False
+        return self.refresh()
+
+    def selection(self, subject: SubjectFilter = None, years: Optional[Iterable[int]] = None,
+                  flag: Optional[str] = DEFAULT_FLAG) -> Selection:
+        self.maybe_refresh()
+        key = _selection_key(subject, years, flag)
+        with self.lock:
+            selection = self.selections.get(key)
+            if selection is not None:
+                self.selections.move_to_end(key)
+                return selection
+            index = self.index
+        selection = index.select(subject, key[1], flag)
+        with self.lock:
+            if index is self.index:
+                self.selections[key] = selection
+                if len(self.selections) > SELECTION_CACHE_SIZE:
+                    self.selections.popitem(last=False)
+        return selection
+
+    def count(self, subject: SubjectFilter = None, years: Optional[Iterable[int]] = None,
+              flag: Optional[str] = DEFAULT_FLAG) -> int:
+        return self.selection(subject, years, flag).total
+
+    def sample(self, k: int, subject: SubjectFilter = None, years: Optional[Iterable[int]] = None,
+               flag: Optional[str] = DEFAULT_FLAG) -> List[QuizQuestion]:
+        """隨機抽出最多 k 題 (不重複)"""
+        selection = self.selection(subject, years, flag)
+        positions = self.rng.sample(range(selection.total), min(k, selection.total))
+        return self.get([selection.id_at(position) for position in positions])
+
+    def page(self, page: int, page_size: int = 20, subject: SubjectFilter = None,
+             years: Optional[Iterable[int]] = None, flag: Optional[str] = DEFAULT_FLAG) -> List[QuizQuestion]:
+        """第 page 頁 (從 0 開始)，超出範圍時回傳空 list"""
+        selection = self.selection(subject, years, flag)
+        start = page * page_size
+        end = min(start + page_size, selection.total)
+        return self.get([selection.id_at(position) for position in range(max(start, 0), end)])
+
+    def get(self, ids: List[int]) -> List[QuizQuestion]:
+        """依 ids 的順序回傳題目，只查詢不在快取中的 id (已被刪除的 id 略過)"""
+        found: Dict[int, QuizQuestion] = {}
+        with self.lock:
+            index = self.index
+            for question_id in ids:
+                question = self.questions.get(question_id)
+                if question is not None:
+                    self.questions.move_to_end(question_id)
+                    found[question_id] = question
+        missing = [question_id for question_id in ids if question_id not in found]
+        METRICS.count('quiz.cache_hits', len(ids) - len(missing))
+        if missing:
+            METRICS.count('quiz.cache_misses', len(missing))
+            with Session(self.engine) as db:
+                rows = db.exec(select(ExamQuestion).where(ExamQuestion.id.in_(missing))).all()
+            hydrated = [QuizQuestion.from_row(row) for row in rows]
+            found.update((question.id, question) for question in hydrated)
+            with self.lock:
+                # 查詢期間重新載入過時不放入快取，避免留下舊版本的內容
+                if index is self.index:
+                    for question in hydrated:
+                        self.questions[question.id] = question
+                        self.questions.move_to_end(question.id)
+                while len(self.questions) > self.cache_size:
+                    self.questions.popitem(last=False)
+        return [found[question_id] for question_id in ids if question_id in found]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='從資料庫隨機抽出練習題')
+    arg_parser.add_argument('--subjects', nargs='+', default=['法'], help='科目名稱包含其中任一字串，預設為 "法"')
+    arg_parser.add_argument('--years', type=int, nargs='+', default=None, help='考試年份，預設為所有年份')
+    arg_parser.add_argument('--flag', default=DEFAULT_FLAG, help='只抽出該 flag 的題目，預設為 "讚"')
+    arg_parser.add_argument('-k', type=int, default=10, help='題數')
+    arg_parser.add_argument('--config', default='config.conf')
+    args = arg_parser.parse_args()
+
+    service = QuizService(get_engine(args.config))
+    print(f"符合條件的題數: {service.count(args.subjects, args.years, args.flag)}")
+    for question in service.sample(args.k, args.subjects, args.years, args.flag):
+        print(f"{question.year} {question.exam_name} {question.subject} 第{question.question_number}題 [{question.flag}]")
+        print(f"    {question.question_text[:80]}")
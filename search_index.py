@@ -0,0 +1,307 @@
+import argparse
+import gzip
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from corpus_io import JSON_DIR, find_year_files, iter_questions
+from listing_parser import SubjectFilter, make_subject_filter
+from metrics import METRICS
+
+"""
+考古題全文檢索的倒排索引，由解析輸出 (./考選部考古題json) 建立，取代 grep 年份json 或資料庫 LIKE 全表掃描
+    斷詞: 全形英數字轉半形後，中日韓文字取相鄰兩字 (bigram)，英數字取整個詞並轉小寫
+        不用 NFKC，否則 "①②" 等選項符號會變成數字而與前面的數字連成一個詞
+        索引時另外收錄每個中日韓單字，查詢中被英數字隔開的單字 (例如 "第12條" 的 "第") 才找得到
+    索引欄位: 題目與選項 A~D，題目的詞頻權重為 TEXT_WEIGHT 倍
+    排序: BM25，查詢的每個詞都必須出現 (AND)
+每個年份一個區段檔 ./考選部考古題index/<年份>.json.gz，manifest.json 記錄各區段來源輸出檔的大小與 mtime，
+update() 只重建來源有變動或新增的年份，查詢時只載入需要的年份
+"""
+
+INDEX_DIR = './考選部考古題index'
+INDEX_VERSION = 3
+TEXT_WEIGHT = 2
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_CJK = r'㐀-䶿一-鿿豈-﫿぀-ヿ가-힯'
+_TOKEN_RE = re.compile(rf'[{_CJK}]+|[0-9a-z]+')
+_CJK_RE = re.compile(rf'[{_CJK}]')
+# 全形英數字與符號 (U+FF01~U+FF5E) 對應至半形
+_HALFWIDTH = {code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}
+
+
+def tokenize(text: str, unigrams: bool = False) -> List[str]:
+    """
+    unigrams: 中日韓文字除了 bigram 外也產生每個單字 (建立索引時使用)，否則只有單獨一字時產生該字
+    """
+    tokens = []
+    for run in _TOKEN_RE.findall((text or '').translate(_HALFWIDTH).lower()):
+        if not _CJK_RE.match(run):
+            tokens.append(run)
+            continue
+        if unigrams or len(run) == 1:
+            tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def question_terms(question: Dict) -> Counter:
+    terms = Counter()
+    for term in tokenize(question.get('題目'), unigrams=True):
+        terms[term] += TEXT_WEIGHT
+    for key in ('A', 'B', 'C', 'D'):
+        terms.update(tokenize(question.get(key), unigrams=True))
+    return terms
+
+
+@dataclass
+class SearchHit:
+    score: float
+    year: int               # 考試年份
+    exam_name: str          # 考試名稱
+    subject: str            # 考試科目
+    question_number: int    # 題號
+    flag: str
+    question_text: str      # 題目
+
+    def to_dict(self) -> Dict:
+        return {
+            "考試年份": self.year,
+            "考試名稱": self.exam_name,
+            "考試科目": self.subject,
+            "題號": self.question_number,
+            "flag": self.flag,
+            "題目": self.question_text,
+            "score": self.score,
+        }
+
+
+class Segment:
+    """
+    一個年份的索引
+        docs: [[考試名稱, 考試科目, 題號, flag, 題目], ...]，以在 docs 中的位置為文件編號
+        lengths: 每份文件的詞數 (含權重)
+        postings: {詞: [文件編號, 詞頻, 文件編號, 詞頻, ...]}，文件編號遞增
+    """
+
+    def __init__(self, year: int, source: Dict, docs: List[List], lengths: List[int], postings: Dict[str, List[int]]):
+        self.year = year
+        self.source = source
+        self.docs = docs
+        self.lengths = lengths
+        self.postings = postings
+        self.total_length = sum(lengths)
+
+    @classmethod
+    def build(cls, year: int, path: str) -> 'Segment':
+        docs, lengths, postings = [], [], {}
+        for _, 考試名稱, 考試科目, question in iter_questions(path):
+            doc = len(docs)
+            docs.append([考試名稱, 考試科目, question['題號'], question.get('flag', ''), question.get('題目', '')])
+            terms = question_terms(question)
+            lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                postings.setdefault(term, []).extend((doc, tf))
+        return cls(year, source_stat(path), docs, lengths, postings)
+
+    @classmethod
+    def load(cls, path: str) -> 'Segment':
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError(f"索引版本不符: {path}，請先執行 python search_index.py 更新索引")
+        return cls(data['year'], data['source'], data['docs'], data['lengths'], data['postings'])
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "year": self.year,
+                "source": self.source,
+                "docs": self.docs,
+                "lengths": self.lengths,
+                "postings": self.postings,
+            }, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def df(self, term: str) -> int:
+        return len(self.postings.get(term, ())) // 2
+
+    def matches(self, terms: List[str]) -> Iterable[tuple]:
+        """
+        回傳包含所有 terms 的 (文件編號, [各詞的詞頻])，從文件數最少的詞開始交集
+        """
+        lists = [self.postings.get(term) for term in terms]
+        if not lists or any(not postings for postings in lists):
+            return ()
+        order = sorted(range(len(terms)), key=lambda i: len(lists[i]))
+        first = lists[order[0]]
+        found = {}
+        for doc, tf in zip(first[::2], first[1::2]):
+            row = [0] * len(terms)
+            row[order[0]] = tf
+            found[doc] = row
+        for i in order[1:]:
+            postings = lists[i]
+            remaining = {}
+            for doc, tf in zip(postings[::2], postings[1::2]):
+                row = found.get(doc)
+                if row is not None:
+                    row[i] = tf
+                    remaining[doc] = row
+            found = remaining
+            if not found:
+                break
+        return found.items()
+
+
+def source_stat(path: str) -> Dict:
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class SearchIndex:
+    def __init__(self, index_dir: str = INDEX_DIR, json_dir: str = JSON_DIR):
+        self.index_dir = index_dir
+        self.json_dir = json_dir
+        self.segments: Dict[int, Segment] = {}
+        self.manifest = self._load_manifest()
+
+    def segment_path(self, year: int) -> str:
+        return os.path.join(self.index_dir, f'{year}.json.gz')
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.index_dir, 'manifest.json')
+
+    def _load_manifest(self) -> Dict[int, Dict]:
+        """{年份: {"version", "source", "docs"}}"""
+        try:
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                return {int(year): entry for year, entry in json.load(f).items()}
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_manifest(self) -> None:
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = f'{self._manifest_path()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({str(year): entry for year, entry in sorted(self.manifest.items())}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self._manifest_path())
+
+    def years(self) -> List[int]:
+        return sorted(self.manifest)
+
+    def segment(self, year: int) -> Segment:
+        if year not in self.segments:
+            self.segments[year] = Segment.load(self.segment_path(year))
+        return self.segments[year]
+
+    def _is_current(self, year: int, path: str) -> bool:
+        entry = self.manifest.get(year)
+        return (entry is not None and entry['version'] == INDEX_VERSION and entry['source'] == source_stat(path)
+                and os.path.exists(self.segment_path(year)))
+
+    def update(self, years: Optional[Iterable[int]] = None, prune: bool = False) -> Dict[int, str]:
+        """
+        只重建輸出檔有變動 (大小或 mtime 不同) 或新增的年份，回傳 {年份: "built" | "unchanged" | "removed"}
+            prune: 刪除輸出檔已不存在的年份索引 (只在 years 為 None 時)
+        """
+        files = find_year_files(list(years) if years is not None else None, self.json_dir)
+        results = {}
+        for year, path in files.items():
+            if self._is_current(year, path):
+                results[year] = "unchanged"
+                continue
+            with METRICS.timer('index.build', label=path):
+                segment = Segment.build(year, path)
+            segment.save(self.segment_path(year))
+            self.segments[year] = segment
+            self.manifest[year] = {"version": INDEX_VERSION, "source": segment.source, "docs": len(segment.docs)}
+            self._save_manifest()
+            METRICS.count('index.docs', len(segment.docs))
+            results[year] = "built"
+        if prune and years is None:
+            for year in set(self.years()) - set(files):
+                if os.path.exists(self.segment_path(year)):
+                    os.remove(self.segment_path(year))
+                self.segments.pop(year, None)
+                self.manifest.pop(year)
+                results[year] = "removed"
+            self._save_manifest()
+        return results
+
+    def search(self, query: str, years: Optional[Iterable[int]] = None, exam_name: SubjectFilter = None,
+               subject: SubjectFilter = None, flag: SubjectFilter = None, limit: int = 20) -> List[SearchHit]:
+        """
+        依 BM25 分數由高至低回傳最多 limit 筆，查詢中的每個詞都必須出現
+            years: 只查詢這些年份中已建立索引者 (None 為所有已建立索引的年份)
+            exam_name / subject / flag: 同 listing_parser 的科目篩選條件 (包含字串、字串清單、正則表達式或函式)
+        BM25 的文件數、平均長度、文件頻率以所有查詢的年份合併計算
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with METRICS.timer('index.search', label=query):
+            years = self.years() if years is None else [year for year in years if year in self.manifest]
+            segments = [self.segment(year) for year in years]
+            n_docs = sum(len(segment.docs) for segment in segments)
+            if not n_docs:
+                return []
+            avg_length = sum(segment.total_length for segment in segments) / n_docs
+            idf = []
+            for term in terms:
+                df = sum(segment.df(term) for segment in segments)
+                idf.append(math.log(1 + (n_docs - df + 0.5) / (df + 0.5)))
+
+            filtered = exam_name is not None or subject is not None or flag is not None
+            exam_filter = make_subject_filter(exam_name)
+            subject_filter = make_subject_filter(subject)
+            flag_filter = make_subject_filter(flag)
+            # BM25: idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * 長度 / 平均長度))
+            weights = [value * (BM25_K1 + 1) for value in idf]
+            base, per_length = BM25_K1 * (1 - BM25_B), BM25_K1 * BM25_B / avg_length
+            hits = []
+            for segment in segments:
+                docs, lengths = segment.docs, segment.lengths
+                for doc, tfs in segment.matches(terms):
+                    if filtered:
+                        考試名稱, 考試科目, _, doc_flag, _ = docs[doc]
+                        if not (exam_filter(考試名稱) and subject_filter(考試科目) and flag_filter(doc_flag)):
+                            continue
+                    norm = base + per_length * lengths[doc]
+                    score = 0.0
+                    for weight, tf in zip(weights, tfs):
+                        score += weight * tf / (tf + norm)
+                    hits.append((score, segment.year, doc))
+            top = heapq.nlargest(limit, hits)
+        return [SearchHit(score, year, *self.segments[year].docs[doc]) for score, year, doc in top]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='考古題全文檢索')
+    arg_parser.add_argument('query', nargs='?', default=None, help='查詢字串，不指定時只更新索引')
+    arg_parser.add_argument('--years', type=int, nargs='+', default=None, help='考試年份，預設為所有年份')
+    arg_parser.add_argument('--exam-name', nargs='+', default=None, help='考試名稱包含其中任一字串')
+    arg_parser.add_argument('--subjects', nargs='+', default=None, help='科目名稱包含其中任一字串')
+    arg_parser.add_argument('--flag', default=None, help='flag 包含該字串，例如 "讚"')
+    arg_parser.add_argument('--limit', type=int, default=20)
+    arg_parser.add_argument('--update', action='store_true', help='查詢前先更新索引')
+    args = arg_parser.parse_args()
+
+    index = SearchIndex()
+    if args.update or args.query is None:
+        for year, status in index.update(args.years, prune=args.years is None).items():
+            print(f"{year}: {status}")
+    if args.query is not None:
+        for hit in index.search(args.query, args.years, args.exam_name, args.subjects, args.flag, args.limit):
+            print(f"{hit.score:6.2f}  {hit.year} {hit.exam_name} {hit.subject} 第{hit.question_number}題 [{hit.flag}]")
+            print(f"        {hit.question_text[:80]}")